@@ -0,0 +1,345 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Clientes HTTP del dashboard: API flask de centrales / cmg_programados y API de costo marginal online
+del coordinador.cl.
+"""
+
+import json
+import math
+import os
+import time
+import uuid
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from instrumentation import trazar, propagar
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+# requests se importa dentro de cada funcion para no cargarlo en el arranque del dashboard
+
+# Se puede reemplazar por un servidor local (benchmarks, pruebas); la variable de entorno COORDINADOR_URL
+# lo hace para un proceso de streamlit completo (carga.py)
+COORDINADOR_URL = os.environ.get('COORDINADOR_URL', 'https://www.coordinador.cl/wp-json/costo-marginal/v1/data/')
+
+# Atributos editables de la tabla central y limite absoluto segun la precision de la columna (DECIMAL(7,4) / DECIMAL(7,3))
+LIMITES_ATRIBUTOS = {
+    'porcentaje_brent': 1e3,
+    'tasa_proveedor': 1e3,
+    'tasa_central': 1e3,
+    'factor_motor': 1e4,
+    'margen_garantia': 1e4
+}
+
+# Segundos durante los que un envio con la misma llave de idempotencia no se repite (doble click en Submit). La llave
+# la entrega quien llama (ver nueva_llave_idempotencia); app.py la renueva cada vez que cambia el contenido del formulario
+VENTANA_IDEMPOTENCIA = 300
+
+_envios = {}
+_lock_envios = threading.Lock()
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+@trazar('http')
+def get_json_costo_marginal_online(fecha_gte, fecha_lte, barras, user_key, verbose=False):
+    """ Realiza un request para obtener costos marginales de las barras ingresadas. Devuelve una lista de diccionarios con
+    la información solicitada. Los datos se filtran por barra, y solo se incluyen las filas que corresponden a barras
+    especificadas en la lista barras.
+
+    Args:
+        fecha_gte (str): Fecha de inicio del rango en formato YYYY-MM-DD.
+        fecha_lte (str): Fecha de término del rango en formato YYYY-MM-DD.
+        user_key (str): Clave de usuario para autenticar la solicitud.
+        barras (list): Lista con los nombres de las barras a incluir.
+
+    Returns:
+        list: Lista de diccionarios con la información solicitada para las barras especificadas. Si se produce
+        un error durante la solicitud, se devuelve una lista vacía.
+    """
+    import requests
+
+    try:
+        with requests.Session() as session:
+            SITE_URL = f'{COORDINADOR_URL}?fecha__gte={fecha_gte}&fecha__lte={fecha_lte}&user_key={user_key}'
+            response = session.get(SITE_URL, timeout=15)
+            if response.status_code == 200:
+                json_data = json.loads(response.text)
+                if verbose:
+                    print(f"Request successful: {response.status_code}")
+            else:
+                if verbose:
+                    print(f"Request failed: {response.status_code}")
+                return []
+
+    except requests.exceptions.Timeout:
+        print(f"Error: Request timed out")
+        return []
+
+    except requests.exceptions.RequestException as error:
+        print(f"Error: {error}")
+        return []
+
+    if not json_data:
+        print('Error: empty JSON response')
+        return []
+
+    filtered_data = [n for n in json_data if n['barra'] in barras]
+    return filtered_data
+
+def get_costo_marginal_online_hora(fecha_gte, fecha_lte, barras, hora_in, user_key):
+    """
+    Obtiene los valores del costo marginal de las barras en una hora específica.
+
+    Args:
+        fecha_gte (str): Fecha de inicio en formato "YYYY-MM-DD".
+        fecha_lte (str): Fecha de fin en formato "YYYY-MM-DD".
+        user_key (str): Clave de usuario para acceder a la API.
+        barras (list): Lista de las barras cuyos valores de costo marginal se desean obtener.
+        hora (str, optional): Hora en formato "HH:MM:SS". El valor por defecto es "17:00:00".
+
+    Returns:
+        dict: Diccionario con las barras como llaves y los valores de costo marginal como valores.
+    """
+    json_raw = get_json_costo_marginal_online(
+        fecha_gte, fecha_lte, barras, user_key)
+    if not json_raw:
+        print('Error: empty JSON response')
+        return {}
+
+    fecha_cutoff = datetime.strptime(f'{fecha_lte} {hora_in}', '%Y-%m-%d %H:%M:%S')
+    selected_data = [row for row in json_raw if datetime.strptime(row['fecha'], '%Y-%m-%d %H:%M:%S') == fecha_cutoff]
+    out_dict = {row['barra']: row['cmg'] for row in selected_data}
+
+    return out_dict
+
+@trazar('http')
+def get_central(name_central, host, port):
+    '''
+    Usa request API para obtener la ultima entrada de la central inputada
+
+    '''
+    import requests
+
+    url = f"http://{host}:{port}/central/{name_central}"
+
+    try:
+        response = requests.get(url , timeout= 10)
+
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 404:
+            return {"error": "No central entries found"}
+        else:
+            return {"error": "Failed to retrieve central entry"}
+
+    except requests.RequestException as e:
+        return {"error": f"Request failed: {e}"}
+
+@trazar('http')
+def get_cmg_programados(name_central, date_in, host, port, session_http=None):
+    """
+    Retrieves the entry for the central in the 'cmg_programados' table for the given date.
+
+    Args:
+        name_central (str): The name of the central.
+        date (str): The date in the format "YYYY-MM-DD".
+        session_http (requests.Session, optional): sesion HTTP a reutilizar (conexiones keep-alive).
+
+    Returns:
+        dict: A dictionary containing the central entry's information for the given date.
+              If no entry is found, an error message is returned.
+    """
+    import requests
+
+    url = f"http://{host}:{port}/cmg_programados/{name_central}/{date_in}"
+
+    response = (session_http or requests).get(url, timeout= 10)
+    response_data = json.loads(response.text)
+
+    if response.status_code == 200:
+        return response_data
+    else:
+        return {"error": "Failed to retrieve central entry"}
+
+@trazar('http')
+def get_cmg_programados_centrales(names_central, date_in, host, port):
+    """
+    cmg_programados de varias centrales para la fecha indicada. Las consultas se hacen en paralelo sobre una sesion
+    HTTP compartida, por lo que el tiempo total es el de la consulta mas lenta y no la suma de todas.
+
+    Args:
+        names_central (list): nombres de las centrales en la API flask.
+        date_in (str): fecha en formato "YYYY-MM-DD".
+
+    Returns:
+        dict: nombre -> respuesta de get_cmg_programados. Si la consulta de una central falla, su valor es
+        {"error": ...} y el resto no se ve afectado.
+    """
+    import requests
+
+    names_central = list(names_central)
+    if not names_central:
+        return {}
+
+    def consultar(name_central):
+        try:
+            return get_cmg_programados(name_central, date_in, host, port, session_http=session_http)
+        except (requests.RequestException, ValueError) as e:
+            logging.error(f"Request failed for cmg_programados {name_central}: {e}")
+            return {"error": f"Request failed: {e}"}
+
+    with requests.Session() as session_http:
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=len(names_central))
+        session_http.mount('http://', adapter)
+        with ThreadPoolExecutor(max_workers=len(names_central)) as executor:
+            respuestas = list(executor.map(propagar(consultar), names_central))
+
+    return dict(zip(names_central, respuestas))
+
+@trazar('http')
+def insert_central(name_central, editor, data, host, port, idempotency_key=None, session_http=None):
+    import requests
+
+    url = f"http://{host}:{port}/central/insert/{quote(name_central)}/{quote(editor)}"
+    headers = {"Content-Type": "application/json"}
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+
+    try:
+        response = (session_http or requests).put(url, headers=headers, json=data, timeout=15)
+
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 404:
+            return {"error": "No central entries found"}
+        else:
+            return (f"Failed to insert central entry. Response content: {response.content}")
+
+    except requests.RequestException as e:
+        logging.error(f"Request failed: {e}")
+        return {"error": f"Request failed: {e}"}
+
+def validar_cambios(cambios, centrales_validas=None):
+    """
+    Valida localmente un lote de cambios de atributos antes de enviarlo.
+
+    Args:
+        cambios (dict): nombre de central -> {atributo: valor}.
+        centrales_validas (iterable, optional): nombres aceptados.
+
+    Returns:
+        list: mensajes de error (vacia si el lote es valido).
+    """
+    errores = []
+    if not cambios:
+        errores.append('No changes to submit')
+
+    for name_central, data in (cambios or {}).items():
+        if centrales_validas is not None and name_central not in centrales_validas:
+            errores.append(f'Unknown central {name_central}')
+        if not data:
+            errores.append(f'No attributes for central {name_central}')
+        for atributo, valor in (data or {}).items():
+            if atributo not in LIMITES_ATRIBUTOS:
+                errores.append(f'Unknown attribute {atributo} for central {name_central}')
+            elif not isinstance(valor, (int, float)) or isinstance(valor, bool) or not math.isfinite(valor):
+                errores.append(f'{atributo} for central {name_central} must be a finite number')
+            elif abs(valor) >= LIMITES_ATRIBUTOS[atributo]:
+                errores.append(f'{atributo} for central {name_central} out of range (|value| < {LIMITES_ATRIBUTOS[atributo]:g})')
+
+    return errores
+
+def nueva_llave_idempotencia():
+    "llave aleatoria de un envio del formulario; sus reintentos (doble click, reenvio tras un error) la reutilizan"
+    return uuid.uuid4().hex
+
+def _exitosa(respuesta):
+    return isinstance(respuesta, dict) and 'error' not in respuesta
+
+@trazar('http')
+def insert_centrales(cambios, editor, host, port, centrales_validas=None, idempotency_key=None):
+    """
+    Envia un lote de cambios de atributos de varias centrales en un solo request a /central/insert_batch/<editor>.
+    Si la API no tiene la ruta por lotes (404 / 405), envia un PUT por central en paralelo sobre una sesion compartida.
+
+    Cada lote lleva una llave de idempotencia (header Idempotency-Key). Un lote con la misma llave enviado con exito
+    dentro de VENTANA_IDEMPOTENCIA segundos no se reenvia: se retorna la respuesta original. Solo se deduplican
+    repeticiones de la misma llave, nunca lotes con el mismo contenido (ej: A -> B -> A sobre la misma central).
+
+    Args:
+        cambios (dict): nombre de central (API) -> {atributo: valor}.
+        editor (str): persona que realiza el cambio.
+        centrales_validas (iterable, optional): nombres aceptados en la validacion local.
+        idempotency_key (str, optional): llave del envio del formulario (ver nueva_llave_idempotencia). Por defecto
+            una llave nueva, por lo que la llamada no se deduplica.
+
+    Returns:
+        dict: nombre de central -> respuesta de la API.
+
+    Raises:
+        ValueError: si la validacion local falla; en ese caso no se envia nada.
+    """
+    import requests
+
+    errores = validar_cambios(cambios, centrales_validas)
+    if errores:
+        raise ValueError('; '.join(errores))
+
+    llave = idempotency_key or nueva_llave_idempotencia()
+    ahora = time.monotonic()
+    with _lock_envios:
+        for llave_vieja in [k for k, (instante, _) in _envios.items() if ahora - instante > VENTANA_IDEMPOTENCIA]:
+            del _envios[llave_vieja]
+        if llave in _envios:
+            respuesta_previa = _envios[llave][1]
+            if respuesta_previa is None:
+                return {name_central: {"error": "Duplicate submission in progress"} for name_central in cambios}
+            return respuesta_previa
+        # None marca el lote como en curso
+        _envios[llave] = (ahora, None)
+
+    respuestas = None
+    try:
+        with requests.Session() as session_http:
+            url = f"http://{host}:{port}/central/insert_batch/{quote(editor)}"
+            headers = {"Content-Type": "application/json", "Idempotency-Key": llave}
+            payload = [{'nombre': name_central, 'data': data} for name_central, data in cambios.items()]
+
+            try:
+                response = session_http.put(url, headers=headers, json=payload, timeout=15)
+                if response.status_code == 200:
+                    cuerpo = response.json()
+                    respuestas = cuerpo if isinstance(cuerpo, dict) and set(cuerpo) == set(cambios) else {name_central: cuerpo for name_central in cambios}
+                elif response.status_code not in (404, 405):
+                    respuestas = {name_central: {"error": f"Failed to insert central entries. Response content: {response.content}"} for name_central in cambios}
+            except requests.RequestException as e:
+                logging.error(f"Request failed: {e}")
+                respuestas = {name_central: {"error": f"Request failed: {e}"} for name_central in cambios}
+
+            if respuestas is None:
+                # API sin ruta por lotes: un PUT por central, con llave derivada de la del lote
+                session_http.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=len(cambios)))
+                with ThreadPoolExecutor(max_workers=len(cambios)) as executor:
+                    futuros = {name_central: executor.submit(propagar(insert_central), name_central, editor, data, host, port,
+                                                             idempotency_key=f'{llave}:{name_central}', session_http=session_http)
+                               for name_central, data in cambios.items()}
+                respuestas = {name_central: {"error": futuro.result()} if isinstance(futuro.result(), str) else futuro.result()
+                              for name_central, futuro in futuros.items()}
+
+    finally:
+        with _lock_envios:
+            if respuestas is not None and all(_exitosa(respuesta) for respuesta in respuestas.values()):
+                _envios[llave] = (time.monotonic(), respuestas)
+            else:
+                # un lote fallido se puede reintentar de inmediato
+                _envios.pop(llave, None)
+
+    return respuestas
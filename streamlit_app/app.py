@@ -1,17 +1,28 @@
 import streamlit as st
-import os
-from urllib.parse import quote
-import numpy as np
 import pandas as pd
+import numpy as np
 import json
 import time
 import pytz
+import hashlib
 import logging
-from datetime import date, datetime, timedelta
-import requests
-import seaborn as sns
-import matplotlib.pyplot as plt
+import functools
+from datetime import datetime
+# seaborn / matplotlib y requests se importan de forma diferida en pipeline.py y api.py
 import connection as cn
+import instrumentation
+import api
+import pipeline
+import escenarios
+import despacho
+import espejo
+import archivo
+import desacople as indice_desacople
+import conciliacion
+import grabacion
+import descargas
+from registro_centrales import CENTRALES, mapeo_barra_central, central_por_nombre
+from timeseries_store import TimeSeriesStore
 
 
 #############################################################
@@ -25,6 +36,8 @@ HOST = st.secrets["AWS_MYSQL"]["HOST"]
 USER = st.secrets["AWS_MYSQL"]["USER"]
 PASSWORD = st.secrets["AWS_MYSQL"]["USER_PASSWORD"]
 PORT = st.secrets["AWS_MYSQL"]["PORT"]
+# URL de SQLAlchemy opcional que reemplaza a MySQL (ej: sqlite de carga.py para pruebas locales)
+CONNECTION_STRING = st.secrets["AWS_MYSQL"].get("CONNECTION_STRING")
 USER_KEY = st.secrets["COORDINADOR"]["USER_KEY"]
 
 #Informacion API flask
@@ -32,11 +45,49 @@ API_HOST = st.secrets["API"]["HOST"]
 API_PORT = st.secrets["API"]["PORT"]
 
 
-# Establecer motor de base de datos
-engine, metadata = cn.establecer_engine(DATABASE, USER, PASSWORD, HOST, PORT, verbose=True)
+# Replica de lectura opcional: las consultas del dashboard no compiten con las escrituras del scheduler
+READ_HOST = st.secrets.get("AWS_MYSQL_READ", {}).get("HOST")
+READ_PORT = st.secrets.get("AWS_MYSQL_READ", {}).get("PORT")
+
+# Espejo analitico local (espejo.py) para las lecturas historicas; se usa solo si el job de replicacion ya lo creo
+RUTA_ESPEJO = st.secrets.get("ESPEJO", {}).get("RUTA", espejo.RUTA_ESPEJO)
+
+# Archivo Parquet de los meses cerrados (archivo.py); las consultas por rango lo leen de forma transparente
+RUTA_ARCHIVO = st.secrets.get("ARCHIVO", {}).get("RUTA", archivo.RUTA_ARCHIVO)
+
+# Archivo JSONL de trazas por rerun (instrumentation.py); '' desactiva la escritura
+RUTA_TRAZAS = st.secrets.get("TRAZAS", {}).get("RUTA", instrumentation.RUTA_TRAZAS)
+
+# Grabacion / reproduccion de la I/O (grabacion.py) segun GRABACION_MODO; al reproducir no se usa MySQL ni la red
+grabacion.instalar_desde_entorno()
+if grabacion.reproduciendo():
+    CONNECTION_STRING = 'sqlite://'
+
+# cada rerun es una traza: las consultas, requests y etapas de procesamiento quedan como spans anidados
+instrumentation.iniciar_traza('rerun', ruta=RUTA_TRAZAS)
+
+
+# Establecer motores de base de datos (primario para escrituras, replica para lecturas)
+# create_engine no se conecta: el estado real de la conexion se conoce con la primera consulta (token de cambios).
+# Con connect_timeout / pool_timeout cortos y el circuit breaker del engine, una caida de MySQL no bloquea la pagina.
+# El router se comparte entre reruns y sesiones para conservar los pools y el estado del circuit breaker.
+@st.cache_resource
+def obtener_router():
+    router_out, metadata_out = cn.establecer_router(DATABASE, USER, PASSWORD, HOST, PORT, host_lectura=READ_HOST, port_lectura=READ_PORT, verbose=True,
+                                                    connect_timeout=3, pool_timeout=5, umbral_fallos=2, enfriamiento=30,
+                                                    connection_string_in=CONNECTION_STRING)
+    cn.configurar_archivo(archivo.abrir_archivo(RUTA_ARCHIVO))
+    espejo_analitico = espejo.abrir_espejo(RUTA_ESPEJO)
+    if router_out is not None and espejo_analitico is not None:
+        router_out.conectar_espejo(espejo_analitico)
+    return router_out, metadata_out
 
+router, metadata = obtener_router()
 
-CONN_STATUS = engine is not None
+# Centrales monitoreadas (centrales.json): toda la pagina se construye a partir de este registro
+NOMBRES_CENTRALES = [central['nombre'] for central in CENTRALES]
+BARRAS_CENTRALES = [central['barra_transmision'] for central in CENTRALES]
+MAPEO_BARRA_CENTRAL = mapeo_barra_central(CENTRALES)
 
 st.set_page_config(layout="wide")
 
@@ -60,263 +111,255 @@ hora_redondeada_cmg_programados = f'{hora[0]}:00'
 naive_datetime = chile_datetime.astimezone().replace(tzinfo=None)
 unixtime = int(time.mktime(naive_datetime.timetuple()))
 
-def get_json_costo_marginal_online(fecha_gte, fecha_lte, barras, user_key=USER_KEY , verbose=False):
-    """ Realiza un request para obtener costos marginales de las barras ingresadas. Devuelve una lista de diccionarios con
-    la información solicitada. Los datos se filtran por barra, y solo se incluyen las filas que corresponden a barras
-    especificadas en la lista barras.
-
-    Args:
-        fecha_gte (str): Fecha de inicio del rango en formato YYYY-MM-DD.
-        fecha_lte (str): Fecha de término del rango en formato YYYY-MM-DD.
-        user_key (str): Clave de usuario para autenticar la solicitud.
-        barras (list): Lista con los nombres de las barras a incluir.
-
-    Returns:
-        list: Lista de diccionarios con la información solicitada para las barras especificadas. Si se produce
-        un error durante la solicitud, se devuelve una lista vacía.
-    """
-    try:
-        with requests.Session() as session:
-            SITE_URL = f'https://www.coordinador.cl/wp-json/costo-marginal/v1/data/?fecha__gte={fecha_gte}&fecha__lte={fecha_lte}&user_key={user_key}'
-            response = session.get(SITE_URL, timeout=15)
-            if response.status_code == 200:
-                json_data = json.loads(response.text)
-                if verbose:
-                    print(f"Request successful: {response.status_code}")
-            else:
-                if verbose:
-                    print(f"Request failed: {response.status_code}")
-                return []
-
-    except requests.exceptions.Timeout:
-        print(f"Error: Request timed out")
-        return []
-
-    except requests.exceptions.RequestException as error:
-        print(f"Error: {error}")
-        return []
-
-    if not json_data:
-        print('Error: empty JSON response')
-        return []
-
-    filtered_data = [n for n in json_data if n['barra'] in barras]
-    return filtered_data
-
-def get_costo_marginal_online_hora(fecha_gte, fecha_lte, barras, hora_in, user_key=USER_KEY):
-    """
-    Obtiene los valores del costo marginal de las barras en una hora específica.
-
-    Args:
-        fecha_gte (str): Fecha de inicio en formato "YYYY-MM-DD".
-        fecha_lte (str): Fecha de fin en formato "YYYY-MM-DD".
-        user_key (str): Clave de usuario para acceder a la API.
-        barras (list): Lista de las barras cuyos valores de costo marginal se desean obtener.
-        hora (str, optional): Hora en formato "HH:MM:SS". El valor por defecto es "17:00:00".
-
-    Returns:
-        dict: Diccionario con las barras como llaves y los valores de costo marginal como valores.
-    """
-    json_raw = get_json_costo_marginal_online(
-        fecha_gte, fecha_lte, barras, user_key)
-    if not json_raw:
-        print('Error: empty JSON response')
-        return {}
-    
-    fecha_cutoff = datetime.strptime(f'{fecha_lte} {hora_in}', '%Y-%m-%d %H:%M:%S')
-    selected_data = [row for row in json_raw if datetime.strptime(row['fecha'], '%Y-%m-%d %H:%M:%S') == fecha_cutoff]
-    out_dict = {row['barra']: row['cmg'] for row in selected_data}
-
-    return out_dict
-
-def get_central(name_central, host=API_HOST, port=API_PORT):
-    '''
-    Usa request API para obtener la ultima entrada de la central inputada
-    
-    '''
-    url = f"http://{host}:{port}/central/{name_central}"
-   
-    try:
-        response = requests.get(url , timeout= 10)
-        
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 404:
-            return {"error": "No central entries found"}
-        else:
-            return {"error": "Failed to retrieve central entry"}
-            
-    except requests.RequestException as e:
-        return {"error": f"Request failed: {e}"}
-
-def get_cmg_programados(name_central, date_in, host=API_HOST, port=API_PORT):
-    """
-    Retrieves the entry for the central in the 'cmg_programados' table for the given date.
-
-    Args:
-        name_central (str): The name of the central.
-        date (str): The date in the format "YYYY-MM-DD".
-
-    Returns:
-        dict: A dictionary containing the central entry's information for the given date.
-              If no entry is found, an error message is returned.
-    """
-    url = f"http://{host}:{port}/cmg_programados/{name_central}/{date_in}"
-
-    response = requests.get(url, timeout= 10)
-    response_data = json.loads(response.text)
-
-    if response.status_code == 200:
-        return response_data
-    else:
-        return {"error": "Failed to retrieve central entry"}
-
-def insert_central(name_central, editor, data, host=API_HOST, port=API_PORT):
-
-    url = f"http://{host}:{port}/central/insert/{quote(name_central)}/{quote(editor)}"
-    headers = {"Content-Type": "application/json"}
-    
-    try:
-        response = requests.put(url, headers=headers, json=data, timeout=15)
-        
-        if response.status_code == 200:
-            return response.json()
-        elif response.status_code == 404:
-            return {"error": "No central entries found"}
-        else:
-            return (f"Failed to insert central entry. Response content: {response.content}")
-            
-    except requests.RequestException as e:
-        st.write(f"Request failed: {e}")
-        return {"error": f"Request failed: {e}"}
-
-def reformat_to_iso(date_string):
-    # Parse the date_string using strptime with the given format
-    dt_object = datetime.strptime(date_string, '%d.%m.%y %H:%M:%S')
-    
-    # Return the reformatted string using strftime
-    return dt_object.strftime('%Y-%m-%d %H:%M:%S')
-
-
 #############################################################
 ###################  Consultas    ###########################
 #############################################################
 
-with cn.establecer_session(engine) as session:
-    # last row tracking_cmg
-    tracking_cmg_last_row = cn.query_last_ins_tracking_coordinador(session)
-    ultimo_tracking = tracking_cmg_last_row[1]
-    ultimo_mod_rio = tracking_cmg_last_row[3]
-
-    # get last entry cmg_tiempo_real , afecto_desacople, central_referencia
-    central_referencia_charrua, desacople_charrua, cmg_charrua = cn.query_values_last_desacople_bool(
-        session, barra_transmision='CHARRUA__220')
+@st.cache_resource
+def obtener_store():
+    'store de series cmg compartido por todas las sesiones del proceso'
+    return TimeSeriesStore(dias=30, ttl=60)
+
+store = obtener_store()
+
+def obtener_token_cambios():
+    'id maximo de tracking_coordinador, cmg_tiempo_real y central; cambia solo cuando hay datos nuevos. None si la base de datos no responde'
+    with router.session_lectura() as session:
+        return cn.query_change_token(session)
+
+@st.cache_resource
+def obtener_snapshot():
+    'ultimo resultado valido de cada consulta, compartido por todas las sesiones del proceso'
+    return {}
+
+snapshot = obtener_snapshot()
+datos_desactualizados = {}
+
+def con_snapshot(nombre, cargar, *args):
+    'ejecuta la consulta si hay conexion y guarda el resultado; si no hay conexion o falla (excepcion o None), retorna la ultima copia valida'
+    if CONN_STATUS:
+        try:
+            with instrumentation.span(f'snapshot {nombre}', 'cache'):
+                resultado = cargar(*args)
+            if resultado is None:
+                raise RuntimeError('query returned None')
+            snapshot[nombre] = (resultado, datetime.now(chile_tz))
+            return resultado
+        except Exception as error:
+            logging.error(f"Error while loading {nombre}: {error}")
+    if nombre in snapshot:
+        resultado, instante = snapshot[nombre]
+        datos_desactualizados[nombre] = instante
+        return resultado
+    return None
+
+# Cada bloque de consultas se cachea con la parte del token de la que depende: un rerun solo vuelve a consultar
+# las tablas que cambiaron desde el rerun anterior.
+
+@st.cache_data(show_spinner=False)
+def cargar_tracking(token_tracking):
+    'ultima fila de tracking_coordinador'
+    with router.session_lectura() as session:
+        ultima_fila = cn.query_last_ins_tracking_coordinador(session)
+    # una consulta fallida se levanta como excepcion para que st.cache_data no la guarde
+    if ultima_fila is None:
+        raise RuntimeError('tracking_coordinador query failed')
+    return ultima_fila
+
+@st.cache_data(show_spinner=False)
+def cargar_centrales(token_central):
+    'ultimo estado de cada central del registro y ultimas entradas de la tabla central'
+    with router.session_lectura() as session:
+        ultimas_filas = cn.query_last_row_centrales(session, NOMBRES_CENTRALES)
+        df_central = cn.query_central_table(session, num_entries= 10 * len(CENTRALES))
+        df_central_mod = cn.query_central_table_modifications(session, num_entries= 10 * len(CENTRALES))
+    # una consulta fallida se levanta como excepcion para que st.cache_data no la guarde
+    if ultimas_filas is None or df_central is None or df_central_mod is None:
+        raise RuntimeError('central table query failed')
+    return ultimas_filas, df_central, df_central_mod
+
+@st.cache_data(show_spinner=False)
+def cargar_historial_brent(token_central, nombre_central):
+    'historial de precio brent de la central para el simulador de escenarios'
+    with router.session_lectura() as session:
+        return cn.query_historial_precio_brent(session, nombre_central) or {'fecha_registro': [], 'precio_brent': []}
+
+@st.cache_data(show_spinner=False)
+def cargar_backtest(token_central, token_cmg, centrales, unix_inicio, unix_fin, parametros):
+    'backtest de despacho; se recalcula solo si cambian las tablas o los parametros'
+    # el cmg_ponderado historico sale del espejo analitico; solo la tabla central y las horas recientes van a MySQL
+    cmg_ponderado = router.ejecutar_rango(cn.query_cmg_ponderado_rango, unix_inicio, unix_fin, list(centrales.values()))
+    if cmg_ponderado is None:
+        return None
+    with router.session_lectura() as session:
+        return cn.backtest_despacho(session, centrales, unix_inicio, unix_fin, parametros=parametros, detalle=True, cmg_ponderado=cmg_ponderado)
+
+@st.cache_data(show_spinner=False, ttl=300)
+def cargar_externos(fecha_in, hora_in):
+    'cmg programados y cmg online de la hora actual para todas las centrales'
+    cmg_programados = api.get_cmg_programados_centrales([central['nombre_api'] for central in CENTRALES], date_in= fecha_in, host=API_HOST, port=API_PORT)
+    cmg_online = api.get_costo_marginal_online_hora(fecha_gte=fecha_in, fecha_lte=fecha_in, barras=[central['barra_online'] for central in CENTRALES], hora_in=hora_in, user_key=USER_KEY)
+    return cmg_programados, cmg_online
+
+def cargar_cmg_ponderado_96h():
+    'cmg_ponderado de las ultimas 96 horas desde el store, o desde la base de datos si el store no tiene datos'
+    cmg_ponderado = store.dataframe_cmg_ponderado(unixtime - 96 * 3600)
+    if cmg_ponderado.empty:
+        with router.session_lectura() as session:
+            entries = cn.query_cmg_ponderado_by_time(session, unixtime, 96)
+        if entries is None:
+            raise RuntimeError('cmg_ponderado query failed')
+        cmg_ponderado = pipeline.preparar_cmg_ponderado(entries)
+    return cmg_ponderado
+
+def ultimos_desacople(session_in, barras_transmision):
+    'ultima lectura de cmg_tiempo_real de cada barra desde el store; las barras sin datos se consultan juntas en la base de datos'
+    ultimos = {barra: store.ultimo('cmg_tiempo_real', barra) for barra in barras_transmision}
+    faltantes = [barra for barra, ultimo in ultimos.items() if ultimo is None]
+    if faltantes:
+        ultimos.update(cn.query_values_last_desacople_bool_barras(session_in, faltantes) or {})
+    return ultimos
+
+token_cambios = obtener_token_cambios()
+
+# conexion real: el token se obtuvo de la base de datos
+CONN_STATUS = token_cambios is not None
+token_cambios = token_cambios or {}
+salud_conexion = router.salud()
+estado_circuito = salud_conexion.get('lectura', salud_conexion['primario'])['estado']
+
+# el store se refresca de inmediato si hay lecturas nuevas, o a lo mas una vez por minuto para todas las sesiones
+if CONN_STATUS:
+    store.actualizar(router.session_lectura, forzar=token_cambios.get('cmg_tiempo_real') != st.session_state.get('token_cambios', {}).get('cmg_tiempo_real'))
+st.session_state['token_cambios'] = token_cambios
+
+# Modificaciones RIO: un detector compartido consulta solo max(id) / last_modification de tracking_coordinador
+@st.cache_resource
+def obtener_detector_rio():
+    'detector de modificaciones RIO compartido por todas las sesiones del proceso; a lo mas una consulta cada 30 s'
+    return cn.DetectorModificacionRio(router.session_lectura, intervalo=30)
+
+detector_rio = obtener_detector_rio()
+if CONN_STATUS:
+    detector_rio.consultar()
+    rio_visto = st.session_state.get('rio_visto')
+    if rio_visto is not None and detector_rio.ultima_modificacion is not None and detector_rio.ultima_modificacion != rio_visto:
+        st.toast(f'Nueva modificación RIO del coordinador: {detector_rio.ultima_modificacion}')
+    st.session_state['rio_visto'] = detector_rio.ultima_modificacion
+
+# last row tracking_cmg
+tracking_cmg_last_row = con_snapshot('tracking', cargar_tracking, token_cambios.get('tracking_coordinador'))
+
+# consulta estado centrales
+centrales_snapshot = con_snapshot('centrales', cargar_centrales, token_cambios.get('central'))
+
+# consulta de datos cmg_ponderado 96 horas previas
+cmg_ponderado_96h = con_snapshot('cmg_ponderado_96h', cargar_cmg_ponderado_96h)
+
+if tracking_cmg_last_row is None or centrales_snapshot is None or cmg_ponderado_96h is None:
+    st.error('Sin conexión a la base de datos y sin datos previos en caché. Reintentando en la próxima recarga.')
+    st.stop()
+
+ultimo_tracking = tracking_cmg_last_row[1]
+ultimo_mod_rio = tracking_cmg_last_row[3]
+ultimas_filas_central, df_central, df_central_mod = centrales_snapshot
+
+def cargar_desacople():
+    with router.session_lectura() as session:
+        # get last entry cmg_tiempo_real , afecto_desacople, central_referencia
+        return ultimos_desacople(session, BARRAS_CENTRALES)
+
+desacople_barras = con_snapshot('desacople', cargar_desacople) or {}
+
+# Filter out rows where the date is more than 4 days ago
+filtered_df = pipeline.filtrar_modificaciones_recientes(df_central_mod, chile_datetime, dias=4)
+
+# Hacer merge entre df_central y cmg_ponderado
+merged_df = pipeline.merge_central_cmg_ponderado(cmg_ponderado_96h, df_central, MAPEO_BARRA_CENTRAL)
 
-    if desacople_charrua:
-        afecto_desacople_charrua = 'Activo'
-    else:
-        afecto_desacople_charrua = 'No Activo'
-
-    central_referencia_quillota, desacople_quillota, cmg_quillota = cn.query_values_last_desacople_bool(
-        session, barra_transmision='QUILLOTA__220')
-
-    if desacople_quillota:
-        afecto_desacople_quillota = 'Activo'
-    else:
-        afecto_desacople_quillota = 'No Activo'
 
-    cmg_charrua = round(float(cmg_charrua) , 2)
-    cmg_quillota = round(float(cmg_quillota) , 2)
-    
-    # consulta de datos cmg_ponderado 48 horas previas
-    cmg_ponderado_96h = pd.DataFrame(cn.query_cmg_ponderado_by_time(session, unixtime, 96))
-    cmg_ponderado_96h['timestamp'] = pd.to_datetime(cmg_ponderado_96h["timestamp"], format="%d.%m.%y %H:%M:%S")
-    cmg_ponderado_96h.drop(['unix_time'], axis=1, inplace=True)
-
-    # consulta estado central 
-    last_row_la = cn.query_last_row_central(session, 'Los Angeles') 
-    last_row_q = cn.query_last_row_central(session, 'Quillota')
-
-    estado_generacion_la =  last_row_la[2]
-    estado_generacion_q = last_row_q[2]
-
-    costo_operacional_la = round(float(last_row_la[8]),2)
-    costo_operacional_la_base = costo_operacional_la - round(float(last_row_la[10]),2)
-    costo_operacional_q = round(float(last_row_q[8]),2)
-    costo_operacional_q_base = costo_operacional_q - round(float(last_row_q[10]),2)
-
-    # Consultar ultimas entradas de table Central: 
-    df_central = cn.query_central_table(session, num_entries= 20)
-    df_central['margen_garantia'] = df_central['margen_garantia'].astype(float)
-    df_central_mod = cn.query_central_table_modifications(session, num_entries= 20)
-    df_central_mod['margen_garantia'] = df_central_mod['margen_garantia'].astype(float)
-    df_central_mod_co = df_central_mod.loc[:,['nombre' , 'costo_operacional','fecha_registro']]
-    df_central_mod_co['fecha_registro'] = df_central_mod_co['fecha_registro'].apply(reformat_to_iso)
-    # Eliminar todas las entradas que tenga mas de 96 horas.
-    df_central_mod_co['fecha_registro'] = pd.to_datetime(df_central_mod_co['fecha_registro'], format='%Y-%m-%d %H:%M:%S')
-
-    # Filter out rows where the date is more than 4 days ago
-    four_days_ago = chile_datetime - timedelta(days=4)
-    four_days_ago = four_days_ago.replace(tzinfo=None)    
-
-    filtered_df = df_central_mod_co[df_central_mod_co['fecha_registro'] > four_days_ago]
-    
-    # Hacer merge entre df_central y cmg_ponderado
-    cmg_ponderado = cmg_ponderado_96h.copy()
-    cmg_ponderado['timestamp'] = cmg_ponderado['timestamp'].astype(str)
-    cmg_ponderado[['fecha', 'hora']] = cmg_ponderado['timestamp'].str.split(' ', expand=True)
-    cmg_ponderado['central'] = cmg_ponderado['barra_transmision'].replace({'CHARRUA__220':'Los Angeles' , 'QUILLOTA__220' : 'Quillota'})
-
-    cmg_ponderado_la = cmg_ponderado[cmg_ponderado['barra_transmision'] == 'CHARRUA__220']
-    cmg_ponderado_quillota = cmg_ponderado[cmg_ponderado['barra_transmision'] == 'QUILLOTA__220']
-    row_cmg_quillota = round(float(cmg_ponderado_quillota.iloc[-1]['cmg_ponderado']),2)
-    row_cmg_la = round(float(cmg_ponderado_la.iloc[-1]['cmg_ponderado']),2)
-
-
-    df_central_to_merge = df_central.copy()
-    df_central_to_merge[['fecha', 'hora']] = df_central_to_merge['fecha_registro'].str.split(' ', expand=True)
-    # df_central_to_merge['hora'] = pd.to_datetime(df_central_to_merge['hora']).dt.floor('H').dt.time
-    df_central_to_merge['hora'] = pd.to_datetime(df_central_to_merge['hora'], format='%H:%M:%S').dt.floor('H').dt.time
-
-
-    # Reformat the 'fecha' column in cmg_ponderado
-    cmg_ponderado['fecha'] = pd.to_datetime(cmg_ponderado['fecha'], format='%Y-%m-%d')
-
-    # Reformat the 'fecha' column in df_central_to_merge
-    df_central_to_merge['fecha'] = pd.to_datetime(df_central_to_merge['fecha'], format='%d.%m.%y')
-
-    # Rename the 'nombre' column in df_central_to_merge to 'central'
-    df_central_to_merge.rename(columns={'nombre': 'central'}, inplace=True)
-
-
-    # Perform the merge on 'hora', 'fecha', and 'central' columns
-    cmg_ponderado['hora'] = cmg_ponderado['hora'].astype(str)
-    cmg_ponderado['fecha'] = cmg_ponderado['fecha'].astype(str)
+############# Queries externas #############
+cmg_programados, cmg_online = cargar_externos(fecha, hora_redondeada)
 
-    
-    df_central_to_merge['hora'] = df_central_to_merge['hora'].astype(str)
-    df_central_to_merge['fecha'] = df_central_to_merge['fecha'].astype(str)
+############# Estado por central #############
 
-    merged_df = pd.merge(cmg_ponderado, df_central_to_merge, on=['hora', 'fecha', 'central'], how='inner')
-    merged_df.drop(['timestamp', 'fecha_registro', 'external_update', 'editor', 'barra_transmision','id'], axis=1, inplace=True)
-    merged_df = merged_df[['central','costo_operacional','generando','cmg_ponderado','fecha', 'hora','margen_garantia','factor_motor','tasa_proveedor', 'porcentaje_brent', 'tasa_central', 'precio_brent','fecha_referencia_brent' ]]
+barras_con_datos = set(cmg_ponderado_96h['barra_transmision'])
+estado_centrales = []
 
-  
-############# Queries externas #############
-cmg_programados_quillota = get_cmg_programados('Quillota' , date_in= fecha)
-cmg_programados_la = get_cmg_programados('Los Angeles' , date_in= fecha)
-cmg_online = get_costo_marginal_online_hora(fecha_gte=fecha, fecha_lte=fecha, barras=['Quillota' , 'Charrua'], hora_in=hora_redondeada, user_key=USER_KEY)
+for central in CENTRALES:
+    fila_central = ultimas_filas_central.get(central['nombre'])
+    central_referencia, desacople, cmg_tiempo_real = desacople_barras.get(central['barra_transmision']) or (None, False, None)
+    programados = cmg_programados.get(central['nombre_api'], {})
+    online = cmg_online.get(central['barra_online'])
 
-# check if cmg_online is empty
-if not cmg_online:
-    cmg_online = {'Charrua': 'Not Available', 'Quillota': 'Not Available'}
-else:
-    cmg_online = {key : round(cmg_online[key], 2) for key in cmg_online}
+    if fila_central is not None:
+        costo_operacional = round(fila_central[8], 2)
+        costo_operacional_base = costo_operacional - round(fila_central[10], 2)
+    else:
+        costo_operacional = costo_operacional_base = None
+
+    estado_centrales.append({
+        'central': central,
+        'parametros': dict(zip(cn.CentralTable.__table__.columns.keys(), fila_central)) if fila_central is not None else {},
+        'generando': fila_central[2] if fila_central is not None else False,
+        'costo_operacional': costo_operacional,
+        'costo_operacional_base': costo_operacional_base,
+        'central_referencia': central_referencia,
+        'afecto_desacople': 'Activo' if desacople else 'No Activo',
+        'cmg_ponderado': pipeline.ultimo_cmg_ponderado(cmg_ponderado_96h, central['barra_transmision']) if central['barra_transmision'] in barras_con_datos else 'Not Available',
+        'cmg_online': round(online, 2) if online is not None else 'Not Available',
+        'cmg_programado': round(float(programados[hora_redondeada_cmg_programados]), 2) if hora_redondeada_cmg_programados in programados else None
+    })
+
+############# Auto refresco #############
+# Consulta periodica y barata del token de cambios; solo cuando cambia se vuelve a ejecutar la pagina
+
+with st.sidebar:
+    auto_refresco = st.toggle('Auto refresco', value=False)
+    intervalo_refresco = st.number_input('Intervalo de consulta [s]', min_value=5, max_value=600, value=30, step=5, disabled=not auto_refresco)
+
+@st.fragment(run_every=intervalo_refresco)
+def vigilar_cambios():
+    # en la ejecucion completa el token recien se consulto
+    if time.monotonic() - st.session_state.get('token_consultado', 0) < intervalo_refresco / 2:
+        return
+    st.session_state['token_consultado'] = time.monotonic()
+    if (obtener_token_cambios() or {}) != st.session_state.get('token_cambios'):
+        st.rerun(scope="app")
+
+st.session_state['token_consultado'] = time.monotonic()
+if auto_refresco:
+    vigilar_cambios()
+
+############# Fragmentos #############
+# Cada panel con widgets es un st.fragment: interactuar con el solo vuelve a ejecutar ese panel, con los argumentos
+# de la ultima ejecucion completa (sus dependencias de datos). Las consultas de Monitoreo, las llamadas HTTP y el
+# grafico solo se ejecutan en reruns completos (carga de la pagina, auto refresco, Submit de Atributos).
+
+def fragmento(nombre):
+    'st.fragment cuyos reruns parciales quedan como trazas propias en el waterfall'
+    def decorador(funcion):
+        @st.fragment
+        @functools.wraps(funcion)
+        def wrapper(*args, **kwargs):
+            # dentro de un rerun completo el panel es un span mas de la traza del rerun
+            if instrumentation.traza_actual() is not None:
+                with instrumentation.span(f'fragmento {nombre}', 'app'):
+                    return funcion(*args, **kwargs)
+            instrumentation.iniciar_traza(f'fragmento {nombre}', ruta=RUTA_TRAZAS)
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                traza = instrumentation.terminar_traza()
+                if traza is not None:
+                    st.session_state['trazas'] = (st.session_state.get('trazas', []) + [traza])[-10:]
+        return wrapper
+    return decorador
 
 #########################################################
 ################### WEBSITE DESIGN ######################
 #########################################################
-tab1, tab2, tab3 = st.tabs(["Monitoreo", "Atributos", "Descarga Archivos"])
+tab1, tab2, tab3, tab4, tab5 = st.tabs(["Monitoreo", "Atributos", "Descarga Archivos", "Backtest Despacho", "Conciliación CMg"])
 
 with tab1:
     st.header("Monitoreo")
@@ -331,7 +374,7 @@ with tab1:
         if CONN_STATUS:
             CONNECTION_MD = f'<p style="font-family:sans-serif; font-weight: bold; text-align: left; vertical-align: text-bottom; color:Green; font-size:1rem;"> Connected to MySQL server: {CONN_STATUS} </a></p>'
         else:
-            CONNECTION_MD = f'<p style="font-family:sans-serif; font-weight: bold; text-align: left; vertical-align: text-bottom; color:Red; font-size:1rem;"> Connected to MySQL server: {CONN_STATUS} </a></p>'
+            CONNECTION_MD = f'<p style="font-family:sans-serif; font-weight: bold; text-align: left; vertical-align: text-bottom; color:Red; font-size:1rem;"> Connected to MySQL server: {CONN_STATUS} (circuito {estado_circuito}) </a></p>'
         
         TRACKING_RIO = f'<p style="font-family:sans-serif; font-weight: bold; text-align: left; vertical-align: text-bottom; font-size:1.3rem;"> Última Modificación CEN: {ultimo_mod_rio}</a></p>'
 
@@ -339,103 +382,63 @@ with tab1:
         
         st.markdown(CONNECTION_MD, unsafe_allow_html=True)
 
+        if datos_desactualizados:
+            st.warning(f'Datos desactualizados: se muestra la última copia válida, obtenida el {min(datos_desactualizados.values()):%d-%m-%Y %H:%M:%S}.')
+
         st.markdown("""<hr style="height:3px; border:none;color:#333;background-color:#333;" /> """,unsafe_allow_html=True)
 
 
     ################## Body ##################
 
-    col1, col2 = st.columns((1, 1))
-
-
-    ################## DATOS Charrua - Los Angeles ##############################################
-    with col1:
-        COL1_TITLE = '<p style="font-family:sans-serif; font-weight: bold; color:#050a30; font-size:2rem; text-align:center;"> Los Angeles </p>'
-
-        st.markdown(COL1_TITLE, unsafe_allow_html=True)
-
-        if estado_generacion_la:
-            GENERANDO_LA = '<p style="font-family:sans-serif; font-weight: bold; color:Green; font-size:1.5rem;"> GENERANDO </p>'
-        else:
-            GENERANDO_LA = '<p style="font-family:sans-serif; font-weight: bold; color:#ff2400; font-size:1.5rem;"> APAGADO </p>'
-
-        st.markdown(GENERANDO_LA, unsafe_allow_html=True)
-
-        col1_1, col2_1 = st.columns((1, 1))
-
-        with col1_1:
+    columnas_centrales = st.columns(len(estado_centrales))
 
-            str_cmg_calculado_charrua= f'<p style="font-family:sans-serif; font-weight: bold; color:#ff2400; font-size:1.5rem;"> CMg Calculado - {row_cmg_la} </p>'
-            st.markdown(str_cmg_calculado_charrua, unsafe_allow_html=True)
+    ################## DATOS por central ##############################################
+    for columna, estado in zip(columnas_centrales, estado_centrales):
+        with columna:
+            COL_TITLE = f'<p style="font-family:sans-serif; font-weight: bold; color:#050a30; font-size:2rem; text-align:center;"> {estado["central"]["nombre"]} </p>'
 
-        with col2_1:
-            str_co_la= f'<p style="font-family:sans-serif; font-weight: bold; font-size:1.5rem;"> Costo Operacional - {costo_operacional_la} </p>'
-            st.markdown(str_co_la, unsafe_allow_html=True)
+            st.markdown(COL_TITLE, unsafe_allow_html=True)
 
-        m1, m2  = st.columns(2)
-        m1.metric(f"Costo marginal Online - {hora_redondeada}", cmg_online['Charrua'])
-        if hora_redondeada_cmg_programados in cmg_programados_la:
-            m2.metric(f"Costo marginal Programado - {hora_redondeada}", round(float(cmg_programados_la[hora_redondeada_cmg_programados]),2))
-        else:
-            st.error(f"Data for time {hora_redondeada_cmg_programados} not found in cmg_programados_la.")
-
-
-        m3, m4  = st.columns(2)
-        m3.metric("Central referencia", central_referencia_charrua)
-        m4.metric(label="Zona en desacople", value=afecto_desacople_charrua)
-
-
-    ################## DATOS Quillota ##############################################
-
-    with col2:
-        COL2_TITLE = '<p style="font-family:sans-serif; font-weight: bold; color:#050a30; font-size:2rem; text-align:center;"> Quillota </p>'
-        st.markdown(COL2_TITLE, unsafe_allow_html=True)
+            if estado['generando']:
+                GENERANDO = '<p style="font-family:sans-serif; font-weight: bold; color:Green; font-size:1.5rem;"> GENERANDO </p>'
+            else:
+                GENERANDO = '<p style="font-family:sans-serif; font-weight: bold; color:#ff2400; font-size:1.5rem;"> APAGADO </p>'
 
-        if estado_generacion_q:
-            GENERANDO_Q = '<p style="font-family:sans-serif; font-weight: bold; color:Green; font-size:1.5rem;"> GENERANDO </p>'
-        else:
-            GENERANDO_Q = '<p style="font-family:sans-serif; font-weight: bold; color:#ff2400; font-size:1.5rem;"> APAGADO </p>'
+            st.markdown(GENERANDO, unsafe_allow_html=True)
 
-        st.markdown(GENERANDO_Q, unsafe_allow_html=True)
+            col1_1, col2_1 = st.columns((1, 1))
 
-        col1_1, col2_1 = st.columns((1, 1))
+            with col1_1:
 
-        with col1_1:
+                str_cmg_calculado= f'<p style="font-family:sans-serif; font-weight: bold; color:#ff2400; font-size:1.5rem;"> CMg Calculado - {estado["cmg_ponderado"]} </p>'
+                st.markdown(str_cmg_calculado, unsafe_allow_html=True)
 
-            str_cmg_calculado_quillota= f'<p style="font-family:sans-serif; font-weight: bold; color:#ff2400; font-size:1.5rem;"> CMg Calculado - {row_cmg_quillota} </p>'
-            st.markdown(str_cmg_calculado_quillota, unsafe_allow_html=True)
+            with col2_1:
+                str_co= f'<p style="font-family:sans-serif; font-weight: bold; font-size:1.5rem;"> Costo Operacional - {estado["costo_operacional"]} </p>'
+                st.markdown(str_co, unsafe_allow_html=True)
 
-        with col2_1:
-            str_co_quillota= f'<p style="font-family:sans-serif; font-weight: bold; font-size:1.5rem;"> Costo Operacional - {costo_operacional_q} </p>'
-            st.markdown(str_co_quillota, unsafe_allow_html=True)
+            m1, m2  = st.columns(2)
+            m1.metric(f"Costo marginal Online - {hora_redondeada}", estado['cmg_online'])
+            if estado['cmg_programado'] is not None:
+                m2.metric(f"Costo marginal Programado - {hora_redondeada}", estado['cmg_programado'])
+            else:
+                st.error(f"Data for time {hora_redondeada_cmg_programados} not found in cmg_programados {estado['central']['nombre']}.")
 
-       
-        m1, m2  = st.columns(2)
-        m1.metric(f"Costo marginal Online - {hora_redondeada}", cmg_online['Quillota'])
-        if hora_redondeada_cmg_programados in cmg_programados_quillota:
-            m2.metric(f"Costo marginal Programado - {hora_redondeada}", round(float(cmg_programados_quillota[hora_redondeada_cmg_programados]),2))
-        else:
-            st.error(f"Data for time {hora_redondeada_cmg_programados} not found in cmg_programados_quillota.")
 
-        m3, m4  = st.columns(2)
-        m3.metric("Central referencia", central_referencia_quillota)
-        m4.metric(label="Zona en desacople", value=afecto_desacople_quillota)
+            m3, m4  = st.columns(2)
+            m3.metric("Central referencia", estado['central_referencia'])
+            m4.metric(label="Zona en desacople", value=estado['afecto_desacople'])
 
 
     ################## GRAFICO ##################
 
     with st.container():
 
-        costo_operacional_plot_lineas_la = False
-        costo_operacional_plot_lineas_quillota = False
-        if filtered_df.empty:
-            costo_operacional_plot_lineas_quillota = True
-            costo_operacional_plot_lineas_la = True
-        else:
+        # centrales con cambios de costo operacional recientes se ven en el grafico, el resto como linea horizontal
+        centrales_modificadas = set()
+        if not filtered_df.empty:
             cmg_ponderado_96h = pd.concat([cmg_ponderado_96h, filtered_df], axis=1)
-            if filtered_df[filtered_df['nombre'] == 'Quillota'].empty:
-                costo_operacional_plot_lineas_quillota = True
-            if filtered_df[filtered_df['nombre'] == 'Los Angeles'].empty:   
-                costo_operacional_plot_lineas_la = True
+            centrales_modificadas = set(filtered_df['nombre'])
 
         st.markdown("""<hr style="height:3px; border:none;color:#333;background-color:#333;" /> """,
                 unsafe_allow_html=True)
@@ -443,40 +446,21 @@ with tab1:
         col_left, col_center, col_right = st.columns([1,4,1])
 
         with col_center:
-            # Create the Seaborn lineplot
-            plt.figure(figsize=(10, 6))
-            sns.lineplot(data=cmg_ponderado_96h, x="timestamp", y="cmg_ponderado", hue="barra_transmision", style="barra_transmision")
-
-            # Set y-axis limits
-            max_value = max(cmg_ponderado_96h["cmg_ponderado"].max(), costo_operacional_la, costo_operacional_q)
-            margin = 2
-            plt.ylim(0, max_value + margin)
-
-            # add two horizontal lines
-            if costo_operacional_plot_lineas_quillota:
-                plt.axhline(y=costo_operacional_q, color='b', linestyle='--', label='CO - Quillota')
-            if costo_operacional_plot_lineas_la:
-                plt.axhline(y=costo_operacional_la, color='r', linestyle='--', label='CO - Los Angeles')
-
-            # Move legend outside the plot
-            plt.legend(loc="upper left", bbox_to_anchor=(1, 1))
-
-            # Set plot title and labels
-            plt.xlabel("Fecha")
-            plt.ylabel("CMg")
+            costos_operacionales = [estado['costo_operacional'] for estado in estado_centrales if estado['costo_operacional'] is not None]
+            lineas_co = [(estado['costo_operacional'], estado['central']['color'], f"CO - {estado['central']['nombre']}")
+                         for estado in estado_centrales
+                         if estado['costo_operacional'] is not None and estado['central']['nombre'] not in centrales_modificadas]
 
             # Show the plot
-            st.pyplot(plt.gcf())
+            with instrumentation.span('st.pyplot', 'render'):
+                st.pyplot(pipeline.render_grafico_cmg(cmg_ponderado_96h, costos_operacionales, lineas_co))
 
 
         col1, col2 = st.columns((1, 1))
 
         with col1:
             st.write('Tracking CMg ponderado - DataFrame: Ultimas 5 horas')
-            cmg_ponderado_96h['cmg_ponderado'] = cmg_ponderado_96h['cmg_ponderado'].round(2)
-            cmg_ponderado_96h['Central'] = cmg_ponderado_96h['barra_transmision'].replace({'CHARRUA__220':'Los Angeles' , 'QUILLOTA__220' : 'Quillota'})
-            cmg_ponderado_96h = cmg_ponderado_96h.rename(columns={'barra_transmision': 'Alimentador', 'timestamp' : 'Fecha y Hora', 'cmg_ponderado' : 'CMg Ponderado'})
-            st.dataframe(cmg_ponderado_96h.tail(10), use_container_width=True)
+            st.dataframe(pipeline.preparar_tabla_cmg_ponderado(cmg_ponderado_96h, MAPEO_BARRA_CENTRAL).tail(10), use_container_width=True)
 
         with col2:
             st.write('Ultimos movimientos Encendido/Apagado')
@@ -484,7 +468,9 @@ with tab1:
 
 ################## Modificaci'on de parametros ##################
 
-with tab2:
+@fragmento('atributos')
+def panel_atributos(estado_centrales, df_central_mod):
+    'formulario de cambio de atributos de la tabla central; el Submit fuerza un rerun completo'
     st.header("Modificación de Parametros")
     col_a, col_b = st.columns((1, 2))
    
@@ -492,57 +478,156 @@ with tab2:
         st.markdown("($$Costo Operacional = ((Porcentaje Brent * Precio Brent) + Tasa Proveedor) * Factor Motor + Tasa Central + Margen de Garantia$$)", unsafe_allow_html=True)
 
         editor = st.text_input('Ingresar Nombre de persona realizando cambio de atributos', 'Cristian Valls')
-        central_seleccion = st.radio("Seleccionar central a modificar:", ('Los Angeles', 'Quillota'))
-        options = st.multiselect('Seleccionar atributos a modificar', ['Porcentaje Brent', 'Tasa Proveedor', 'Factor Motor', 'Tasa Central', 'Margen Garantia'], ['Margen Garantia'])
-
-        dict_data = {}
-
-        if 'Porcentaje Brent' in options:
-            porcentaje_brent = st.number_input('Porcentaje Brent [ej: 0.14]:', value=0.0)
-            dict_data['porcentaje_brent'] = porcentaje_brent
-        if 'Tasa Proveedor' in options:
-            tasa_proveedor = st.number_input('Tasa de proveedor [ej: 4.12]:', value=0.0)
-            dict_data['tasa_proveedor'] = tasa_proveedor
-        if 'Factor Motor' in options:
-            factor_motor = st.number_input('Factor motor [ej: 10.12]:', value=0.0)
-            dict_data['factor_motor'] = factor_motor
-        if 'Tasa Central' in options:
-            tasa_central = st.number_input('Tasa Central [ej: 8.8]:', value=0.0)
-            dict_data['tasa_central'] = tasa_central
-        if 'Margen Garantia' in options:
-            margen_garantia = st.number_input('Margen Garantia [ej: -25.0]:', value=0.0)
-            dict_data['margen_garantia'] = margen_garantia
+        st.write('Ingresar los nuevos valores por central (celdas vacías no se modifican) [ej: Porcentaje Brent 0.14, Tasa Proveedor 4.12, Factor Motor 10.12, Tasa Central 8.8, Margen Garantia -25.0]')
+
+        cambios_tabla = st.data_editor(
+            pd.DataFrame(np.nan, index=pd.Index(NOMBRES_CENTRALES, name='Central'), columns=list(escenarios.ETIQUETAS)),
+            column_config={etiqueta: st.column_config.NumberColumn(etiqueta, format='%.4f') for etiqueta in escenarios.ETIQUETAS},
+            use_container_width=True,
+            key='cambios_atributos'
+        )
+
+        # un solo lote con todas las centrales modificadas
+        dict_cambios = {}
+        for nombre, fila in cambios_tabla.iterrows():
+            dict_data = {escenarios.ETIQUETAS[etiqueta]: float(valor) for etiqueta, valor in fila.items() if pd.notna(valor)}
+            if dict_data:
+                dict_cambios[central_por_nombre(CENTRALES, nombre)['nombre_api']] = dict_data
+
+        # llave de idempotencia del envio: se guarda junto al hash del contenido (editor y cambios) y se renueva solo
+        # cuando el contenido cambia. Un doble click o un reintento sobre la misma tabla reutilizan la llave; un cambio
+        # A -> B -> A produce una llave nueva en cada paso
+        firma_cambios = hashlib.sha256(json.dumps({'editor': editor, 'cambios': dict_cambios}, sort_keys=True).encode('utf-8')).hexdigest()
+        llave_atributos, firma_previa = st.session_state.get('llave_atributos', (None, None))
+        if firma_cambios != firma_previa:
+            llave_atributos = api.nueva_llave_idempotencia()
+            st.session_state['llave_atributos'] = (llave_atributos, firma_cambios)
 
         if st.button('Submit'):
 
             try:
-                st.write((insert_central(central_seleccion, editor, dict_data, host=API_HOST, port=API_PORT)))
-                st.write(f'Atributos de central {central_seleccion} modificados')
+                respuestas = api.insert_centrales(dict_cambios, editor, host=API_HOST, port=API_PORT,
+                                                  centrales_validas=[central['nombre_api'] for central in CENTRALES],
+                                                  idempotency_key=llave_atributos)
+                st.session_state['resultado_insert'] = respuestas
+
+                # las consultas cacheadas de la tabla central se invalidan de inmediato para no mostrar valores antiguos
+                cargar_centrales.clear()
+                cargar_historial_brent.clear()
+                cargar_backtest.clear()
+                # rerun completo: Monitoreo y el resto de los paneles se recalculan con los valores nuevos
+                st.rerun(scope="app")
+
+            except ValueError as error:
+                st.error(f'Invalid changes: {error}')
 
             except Exception as error:
                 st.write(f'Insert error: {error}')
                 st.error(f'Error occurred during insert: {error}')
+
+        if 'resultado_insert' in st.session_state:
+            for nombre_api, respuesta in st.session_state['resultado_insert'].items():
+                if isinstance(respuesta, dict) and 'error' not in respuesta:
+                    st.success(f'Atributos de central {nombre_api} modificados')
+                else:
+                    st.error(f'Central {nombre_api}: {respuesta}')
     
     with col_b:
 
-        la_co_sin_margen = f'<p style="font-family:sans-serif; font-weight: bold; text-align: left; vertical-align: text-bottom; font-size:1.1rem;"> Los Angeles - Costo Operacional Basal: {costo_operacional_la_base}</a></p>'
-        st.markdown(la_co_sin_margen, unsafe_allow_html=True)
-        
-        quillota_co_sin_margen = f'<p style="font-family:sans-serif; font-weight: bold; text-align: left; vertical-align: text-bottom; font-size:1.1rem;"> Quillota - Costo Operacional Basal: {costo_operacional_q_base}</a></p>'
-        st.markdown(quillota_co_sin_margen, unsafe_allow_html=True)
+        for estado in estado_centrales:
+            co_sin_margen = f'<p style="font-family:sans-serif; font-weight: bold; text-align: left; vertical-align: text-bottom; font-size:1.1rem;"> {estado["central"]["nombre"]} - Costo Operacional Basal: {estado["costo_operacional_base"]}</a></p>'
+            st.markdown(co_sin_margen, unsafe_allow_html=True)
 
         st.write('Ultimos cambios de atributos')
         st.dataframe(df_central_mod)
 
+################## Simulador de escenarios ##################
+# Evalua una grilla de parametros contra el historial de cmg_ponderado, sin escribir en la base de datos
+
+@fragmento('escenarios')
+def panel_escenarios(estado_centrales, token_cambios, conectado, unixtime):
+    'simulador de escenarios de costo operacional sobre el cmg_ponderado del store'
+    st.markdown("""<hr style="height:3px; border:none;color:#333;background-color:#333;" /> """, unsafe_allow_html=True)
+    st.subheader("Simulador de escenarios de Costo Operacional")
+
+    col_c, col_d = st.columns((1, 2))
+
+    with col_c:
+        central_escenario = st.selectbox("Central a simular:", NOMBRES_CENTRALES)
+        dias_escenario = st.slider('Ventana de evaluación [días]', min_value=1, max_value=store.dias, value=7)
+        variar = st.multiselect('Atributos a variar', list(escenarios.ETIQUETAS), ['Porcentaje Brent', 'Margen Garantia'])
+        puntos = st.slider('Valores por atributo', min_value=2, max_value=100, value=20)
+
+        estado_escenario = next(estado for estado in estado_centrales if estado['central']['nombre'] == central_escenario)
+        parametros_actuales = {parametro: float(estado_escenario['parametros'].get(parametro) or 0.0) for parametro in escenarios.PARAMETROS}
+
+        # atributos no seleccionados quedan fijos en su valor actual
+        valores_escenario = dict(parametros_actuales)
+        for etiqueta in variar:
+            parametro = escenarios.ETIQUETAS[etiqueta]
+            actual = parametros_actuales[parametro]
+            amplitud = abs(actual) * 0.2 or 1.0
+            col_min, col_max = st.columns(2)
+            minimo = col_min.number_input(f'{etiqueta} mínimo', value=round(actual - amplitud, 4), key=f'min_{parametro}')
+            maximo = col_max.number_input(f'{etiqueta} máximo', value=round(actual + amplitud, 4), key=f'max_{parametro}')
+            valores_escenario[parametro] = np.linspace(minimo, maximo, puntos)
+
+    with col_d:
+        cmg_escenario = store.dataframe_cmg_ponderado(unixtime - dias_escenario * 86400, [estado_escenario['central']['barra_transmision']])
+        if cmg_escenario.empty and conectado:
+            with router.session_lectura() as session:
+                entries_escenario = cn.query_cmg_ponderado_by_time(session, unixtime, dias_escenario * 24)
+            if entries_escenario is not None and not entries_escenario.empty:
+                cmg_escenario = pipeline.preparar_cmg_ponderado(entries_escenario)
+                cmg_escenario = cmg_escenario[cmg_escenario['barra_transmision'] == estado_escenario['central']['barra_transmision']]
+
+        historial_brent = cargar_historial_brent(token_cambios.get('central'), central_escenario)
+
+        if cmg_escenario.empty or not historial_brent['precio_brent']:
+            st.warning(f'Sin datos de cmg_ponderado o precio brent para {central_escenario}.')
+        else:
+            try:
+                resultado_escenarios = escenarios.simular(valores_escenario, historial_brent, cmg_escenario)
+                actual = escenarios.simular(parametros_actuales, historial_brent, cmg_escenario).iloc[0]
+
+                m1, m2, m3 = st.columns(3)
+                m1.metric('Combinaciones evaluadas', len(resultado_escenarios))
+                m2.metric('CO actual', round(actual['costo_operacional'], 2))
+                m3.metric(f'Horas en mérito actuales (de {len(cmg_escenario)})', int(actual['horas_en_merito']))
+
+                st.scatter_chart(resultado_escenarios, x='costo_operacional', y='horas_en_merito')
+
+                columnas_tabla = [escenarios.ETIQUETAS[etiqueta] for etiqueta in variar] + ['costo_operacional', 'horas_en_merito', 'fraccion_merito', 'margen_en_merito']
+                st.dataframe(resultado_escenarios.sort_values(['horas_en_merito', 'costo_operacional'], ascending=[False, True])[columnas_tabla].head(200).round(4),
+                             use_container_width=True)
+
+            except ValueError as error:
+                st.error(f'{error}')
+
+with tab2:
+    panel_atributos(estado_centrales, df_central_mod)
+    panel_escenarios(estado_centrales, token_cambios, CONN_STATUS, unixtime)
+
 
 ################## Descarga de Datos ##################
 
-with tab3:
-    central_seleccion = st.radio("Seleccionar central para descargar datos", ('Los Angeles', 'Quillota'))
-    if central_seleccion == 'Los Angeles':
-        SELECCIONAR = 'CHARRUA__220'
-    else:
-        SELECCIONAR = 'QUILLOTA__220'
+@st.cache_resource
+def obtener_servicio_descargas():
+    'artefactos de descarga en disco, compartidos por todas las sesiones del proceso'
+    return descargas.ServicioDescargas(router)
+
+def leer_descarga(tabla, barra, unix_inicio, marca, formato):
+    'bytes del artefacto de descarga; se ejecuta al hacer click en el boton'
+    datos = obtener_servicio_descargas().obtener(tabla, barra, unix_inicio, marca, formato)
+    if datos is None:
+        raise RuntimeError(f'descarga {tabla} {barra} no disponible')
+    return datos
+
+@fragmento('descarga')
+def panel_descarga(conectado, unixtime):
+    'descarga de cmg_ponderado / cmg_tiempo_real y periodos en desacople de la central elegida'
+    central_seleccion = st.radio("Seleccionar central para descargar datos", NOMBRES_CENTRALES)
+    SELECCIONAR = central_por_nombre(CENTRALES, central_seleccion)['barra_transmision']
 
     date_calculate = st.date_input(
         "Seleccionar periodo CMg ponderados para descargar",
@@ -551,40 +636,239 @@ with tab3:
         max_value=datetime.now().date()
     )
 
-    # Convert date_calculate to a Unix timestamp
-    datetime_obj = datetime.combine(date_calculate, datetime.min.time())
-    unix_timestamp = int(datetime_obj.timestamp())
-    unix_time_delta = unixtime - unix_timestamp
-    horas_delta = (unixtime - unix_timestamp) / 3600
-
-    with cn.establecer_session(engine) as session:
-        cmg_ponderado_descarga = pd.DataFrame(cn.query_cmg_ponderado_by_time(session, unixtime, horas_delta))
-        cmg_tiempo_real_descarga = pd.DataFrame(cn.get_cmg_tiempo_real(session, unix_time_delta))
-
-    @st.cache_data
-    def convert_df(df):
-        'seleccionar central a descargar y convertir a csv'
-        # IMPORTANT: Cache the conversion to prevent computation on every rerun
-        df = df[df['barra_transmision'] == SELECCIONAR]
-        return df.to_csv().encode('utf-8')
-
-    csv = convert_df(cmg_ponderado_descarga)
-
-    st.download_button(
-        label="Descargar costos marginales ponderados por hora",
-        data=csv,
-        file_name='costos_programados.csv',
-        mime='text/csv'
-    )
+    # inicio del dia seleccionado en hora de Chile, independiente de la zona horaria del servidor
+    unix_timestamp = int(despacho.unix_hora_chile([f'{date_calculate:%Y-%m-%d} 00:00:00'])[0])
 
-    csv_2 = convert_df(cmg_tiempo_real_descarga)
+    if not conectado:
+        st.warning('Descarga no disponible: sin conexión a la base de datos.')
+    else:
+        # artefactos precalculados por (tabla, barra, inicio, hora de la ultima lectura) y compartidos por todas las
+        # sesiones (descargas.py); el boton los lee al hacer click, sin consultas ni pandas en cada rerun
+        formato = st.radio('Formato', list(descargas.FORMATOS), horizontal=True, format_func=str.upper)
+        for tabla, etiqueta in (('cmg_ponderado', "Descargar costos marginales ponderados por hora"),
+                                ('cmg_tiempo_real', "Descargar costos marginales en tiempo real")):
+            marca = descargas.marca_agua(store, tabla, SELECCIONAR, unixtime)
+            st.download_button(
+                label=etiqueta,
+                data=functools.partial(leer_descarga, tabla, SELECCIONAR, unix_timestamp, marca, formato),
+                file_name=f'{tabla}_{SELECCIONAR}_{date_calculate:%Y%m%d}.{formato}',
+                mime=descargas.FORMATOS[formato],
+                on_click='ignore'
+            )
+
+        # tramos de desacople de la barra en el periodo, desde el indice de intervalos (desacople.py)
+        with router.session_lectura() as session:
+            intervalos = indice_desacople.query_intervalos_desacople(session, [SELECCIONAR], unix_timestamp, unixtime)
+        if intervalos is None:
+            st.info('Indice de desacople no disponible.')
+        elif intervalos['inicio_unix']:
+            df_intervalos = pd.DataFrame(intervalos)
+            for columna in ('inicio_unix', 'fin_unix'):
+                df_intervalos[columna] = pd.to_datetime(df_intervalos[columna], unit='s', utc=True).dt.tz_convert(chile_tz).dt.tz_localize(None)
+            st.write(f'Periodos en desacople de {central_seleccion}')
+            st.dataframe(df_intervalos.rename(columns={'inicio_unix': 'Inicio', 'fin_unix': 'Fin', 'central_referencia': 'Central referencia',
+                                                       'lecturas': 'Lecturas'}).drop(columns='barra_transmision'), use_container_width=True)
 
-    st.download_button(
-        label="Descargar costos marginales en tiempo real",
-        data=csv_2,
-        file_name='costos_programados.csv',
-        mime='text/csv'
-    )
+with tab3:
+    panel_descarga(CONN_STATUS, unixtime)
+
+################## Backtest de despacho ##################
+
+@fragmento('backtest')
+def panel_backtest(estado_centrales, token_cambios, conectado, chile_datetime):
+    'backtest de despacho con parametros historicos o hipoteticos'
+    st.header("Backtest de Despacho")
+    st.write('Horas GENERANDO, margen y encendidos de cada central con los parametros historicos de la tabla central '
+             '(vigentes en cada hora) o con parametros hipoteticos, sobre el cmg_ponderado horario.')
+
+    col_a, col_b = st.columns((1, 2))
+
+    with col_a:
+        centrales_backtest = st.multiselect('Centrales', NOMBRES_CENTRALES, NOMBRES_CENTRALES)
+        periodo_backtest = st.date_input(
+            "Periodo",
+            value=((chile_datetime - pd.Timedelta(days=90)).date(), chile_datetime.date()),
+            min_value=datetime(2023, 5, 1).date(),
+            max_value=chile_datetime.date()
+        )
+        hipoteticos = st.toggle('Usar parametros hipoteticos', value=False)
+
+        parametros_backtest = None
+        if hipoteticos and centrales_backtest:
+            referencia = next(estado['parametros'] for estado in estado_centrales if estado['central']['nombre'] == centrales_backtest[0])
+            variar_backtest = st.multiselect('Atributos a reemplazar', list(escenarios.ETIQUETAS), ['Margen Garantia'])
+            parametros_backtest = {}
+            for etiqueta in variar_backtest:
+                parametro = escenarios.ETIQUETAS[etiqueta]
+                parametros_backtest[parametro] = st.number_input(f'{etiqueta} (todas las centrales)', value=float(referencia.get(parametro) or 0.0), key=f'backtest_{parametro}')
+
+    with col_b:
+        if not conectado:
+            st.warning('Backtest no disponible: sin conexión a la base de datos.')
+        elif not centrales_backtest or len(periodo_backtest) != 2:
+            st.info('Seleccionar al menos una central y un periodo.')
+        else:
+            # limites del periodo en hora de Chile, independientes de la zona horaria del servidor
+            unix_inicio, unix_fin = (int(unix) for unix in despacho.unix_hora_chile([
+                datetime.combine(periodo_backtest[0], datetime.min.time()), datetime.combine(periodo_backtest[1], datetime.max.time())]))
+            resultado_backtest = cargar_backtest(token_cambios.get('central'), token_cambios.get('cmg_tiempo_real'),
+                                                 {nombre: central_por_nombre(CENTRALES, nombre)['barra_transmision'] for nombre in centrales_backtest},
+                                                 unix_inicio, unix_fin, parametros_backtest)
+
+            if resultado_backtest is None:
+                st.error('Error al ejecutar el backtest.')
+            else:
+                resumen_backtest, detalle_backtest = resultado_backtest
+                st.dataframe(resumen_backtest.round(3), use_container_width=True)
+
+                if not detalle_backtest.empty:
+                    detalle_backtest['Fecha y Hora'] = pd.to_datetime(detalle_backtest['unix_time'], unit='s', utc=True).dt.tz_convert(chile_tz).dt.tz_localize(None)
+                    detalle_backtest['margen_acumulado'] = detalle_backtest.groupby('central')['margen'].cumsum()
+                    st.write('Margen acumulado')
+                    st.line_chart(detalle_backtest, x='Fecha y Hora', y='margen_acumulado', color='central')
+
+                    st.download_button(
+                        label="Descargar detalle horario del backtest",
+                        data=detalle_backtest.to_csv(index=False).encode('utf-8'),
+                        file_name='backtest_despacho.csv',
+                        mime='text/csv'
+                    )
+
+with tab4:
+    panel_backtest(estado_centrales, token_cambios, CONN_STATUS, chile_datetime)
+
+################## Conciliacion online / programado / ponderado ##################
+
+@st.cache_resource
+def obtener_cache_conciliacion():
+    'respuestas diarias de las APIs externas, compartidas por todas las sesiones del proceso'
+    return conciliacion.CacheDias(ttl=300)
+
+class ConciliacionIncompleta(Exception):
+    'conciliacion con dias sin respuesta de las APIs externas; lleva el resultado parcial'
+    def __init__(self, resultado, pendientes):
+        super().__init__(f'{len(pendientes)} days without external data')
+        self.resultado = resultado
+        self.pendientes = pendientes
+
+@st.cache_data(show_spinner=False, ttl=60)
+def cargar_conciliacion_reciente(token_cmg, nombres_centrales, fecha_inicio, fecha_fin):
+    """
+    conciliacion del rango, guardada un minuto tambien si falla: los dias con error o vacios de las APIs y las
+    consultas fallidas de cmg_ponderado se reintentan a lo mas una vez por minuto, no en cada rerun
+    """
+    registro = [central_por_nombre(CENTRALES, nombre) for nombre in nombres_centrales]
+    unix_inicio, unix_fin = conciliacion.fechas_unix(fecha_inicio, fecha_fin)
+    cmg_ponderado = router.ejecutar_rango(cn.query_cmg_ponderado_rango, unix_inicio, unix_fin + 3599,
+                                          [central['barra_transmision'] for central in registro])
+    if cmg_ponderado is None:
+        return None, None
+    cache = obtener_cache_conciliacion()
+    resultado = conciliacion.conciliar(registro, fecha_inicio, fecha_fin, cmg_ponderado, cache, USER_KEY, API_HOST, API_PORT)
+    return resultado, conciliacion.dias_pendientes(cache, registro, fecha_inicio, fecha_fin)
+
+@st.cache_data(show_spinner=False)
+def cargar_conciliacion(token_cmg, nombres_centrales, fecha_inicio, fecha_fin):
+    'conciliacion completa del rango; se recalcula solo si cambia el token de cmg'
+    resultado, pendientes = cargar_conciliacion_reciente(token_cmg, nombres_centrales, fecha_inicio, fecha_fin)
+    # los resultados fallidos o incompletos se levantan para que st.cache_data no los guarde sin expiracion
+    if resultado is None:
+        raise RuntimeError('cmg_ponderado query failed')
+    if pendientes:
+        raise ConciliacionIncompleta(resultado, pendientes)
+    return resultado
+
+@fragmento('conciliacion')
+def panel_conciliacion(token_cambios, conectado, chile_datetime):
+    'conciliacion horaria de CMg online, programado y ponderado'
+    st.header("Conciliación CMg")
+    st.write('CMg online (coordinador.cl), CMg programado y CMg ponderado calculado, alineados por hora. '
+             'Error = fuente - referencia; el sesgo es el error medio.')
+
+    col_a, col_b = st.columns((1, 2))
+
+    with col_a:
+        centrales_conciliacion = st.multiselect('Centrales a conciliar', NOMBRES_CENTRALES, NOMBRES_CENTRALES)
+        periodo_conciliacion = st.date_input(
+            "Periodo de conciliación",
+            value=((chile_datetime - pd.Timedelta(days=7)).date(), chile_datetime.date()),
+            min_value=datetime(2023, 5, 1).date(),
+            max_value=chile_datetime.date()
+        )
+
+    with col_b:
+        if not conectado:
+            st.warning('Conciliación no disponible: sin conexión a la base de datos.')
+        elif not centrales_conciliacion or len(periodo_conciliacion) != 2:
+            st.info('Seleccionar al menos una central y un periodo.')
+        else:
+            fecha_inicio_conc, fecha_fin_conc = (fecha.strftime('%Y-%m-%d') for fecha in periodo_conciliacion)
+            try:
+                alineado, resumen_conciliacion = cargar_conciliacion(token_cambios.get('cmg_tiempo_real'), tuple(centrales_conciliacion),
+                                                                     fecha_inicio_conc, fecha_fin_conc)
+            except ConciliacionIncompleta as incompleta:
+                alineado, resumen_conciliacion = incompleta.resultado
+                st.warning(f'Sin datos de las APIs externas para {len(incompleta.pendientes)} día(s); se reintenta en un minuto.')
+            except RuntimeError:
+                alineado = None
+                st.error('Error al consultar cmg_ponderado.')
+
+            if alineado is not None:
+                st.dataframe(resumen_conciliacion.round(3), use_container_width=True)
+
+                alineado['Fecha y Hora'] = pd.to_datetime(alineado['unix_time'], unit='s', utc=True).dt.tz_convert(chile_tz).dt.tz_localize(None)
+                central_grafico = st.selectbox('Central', centrales_conciliacion, key='central_conciliacion')
+                st.line_chart(alineado[alineado['central'] == central_grafico], x='Fecha y Hora', y=list(conciliacion.FUENTES))
+
+with tab5:
+    panel_conciliacion(token_cambios, CONN_STATUS, chile_datetime)
+
+################## Diagnostico (oculto) ##################
+# Visible solo con ?diagnostico=1 en la URL
+
+# la traza del rerun termina aqui; se guardan las ultimas de la sesion para el waterfall
+traza_rerun = instrumentation.terminar_traza()
+if traza_rerun is not None:
+    st.session_state['trazas'] = (st.session_state.get('trazas', []) + [traza_rerun])[-10:]
+
+@st.fragment
+def panel_waterfall():
+    'elegir otro rerun solo vuelve a dibujar el waterfall'
+    trazas_sesion = st.session_state.get('trazas', [])[::-1]
+    # las opciones del selectbox se copian, por lo que se eligen por posicion
+    indice_traza = st.selectbox('Rerun', range(len(trazas_sesion)),
+                                format_func=lambda i: f"{datetime.fromtimestamp(trazas_sesion[i].inicio_unix, chile_tz):%H:%M:%S} {trazas_sesion[i].nombre} - {trazas_sesion[i].duracion_ms:.0f} ms ({trazas_sesion[i].estado})")
+    filas_waterfall = pd.DataFrame(instrumentation.waterfall(trazas_sesion[indice_traza])) if trazas_sesion else pd.DataFrame()
+    if not filas_waterfall.empty:
+        import altair as alt
+        st.altair_chart(
+            alt.Chart(filas_waterfall).mark_bar().encode(
+                x=alt.X('inicio_ms', title='ms desde el inicio del rerun'),
+                x2='fin_ms',
+                y=alt.Y('etiqueta', sort=None, title=None),
+                color='tipo',
+                tooltip=['nombre', 'tipo', 'inicio_ms', 'duracion_ms', 'estado', 'thread']
+            ).properties(height=max(200, 18 * len(filas_waterfall))),
+            use_container_width=True)
+        st.dataframe(filas_waterfall.drop(columns=['orden', 'etiqueta']), use_container_width=True)
+
+if st.query_params.get("diagnostico") == "1":
+    with st.expander("Waterfall del rerun", expanded=True):
+        panel_waterfall()
+
+    with st.expander("Diagnóstico data layer", expanded=True):
+        st.write('Estado de conexión (circuit breaker)')
+        st.json(router.salud())
+        st.dataframe(pd.DataFrame(instrumentation.REGISTRO.resumen()), use_container_width=True)
+
+        metricas_prometheus = instrumentation.REGISTRO.prometheus()
+        st.download_button(
+            label="Descargar métricas (Prometheus)",
+            data=metricas_prometheus,
+            file_name='metrics.prom',
+            mime='text/plain'
+        )
+        st.code(metricas_prometheus, language='text')
 
 ################## footer ##################
 
@@ -0,0 +1,381 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Particionado mensual por unix_time de cmg_tiempo_real y cmg_ponderado y archivado de meses cerrados a
+Parquet comprimido. Los meses archivados se eliminan de MySQL (DROP PARTITION si la tabla esta particionada, DELETE por
+dias si no) y las funciones de rango de connection.py los leen de forma transparente desde el archivo.
+
+El manifiesto (manifiesto.json) registra, por tabla, los meses archivados y `archivado_hasta`: todas las lecturas con
+unix_time < archivado_hasta salen del archivo y solo el resto se consulta en MySQL. Los meses se archivan en orden y
+el manifiesto se actualiza antes de eliminar las filas, por lo que una lectura nunca ve filas repetidas ni faltantes.
+Si se hace un backfill sobre un mes ya archivado, ese mes se debe volver a archivar con --rearchivar.
+
+Uso:
+    python archivo.py ddl --desde 2023-05 --hasta 2027-01               # DDL para particionar las tablas
+    python archivo.py extender --meses 3 --ejecutar                     # agrega particiones de los proximos meses
+    python archivo.py archivar --meses-calientes 6 --ejecutar           # archiva y elimina los meses cerrados
+"""
+
+import os
+import copy
+import json
+import logging
+import argparse
+import threading
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import text, func
+
+import connection as cn
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+# se puede reemplazar con la variable de entorno ARCHIVO_CMG. Es la unica copia de los meses eliminados de MySQL: por
+# defecto queda en el directorio de datos del usuario ($XDG_DATA_HOME o ~/.local/share), fuera del directorio de la
+# app, para que un redeploy no lo borre
+RUTA_ARCHIVO = os.environ.get('ARCHIVO_CMG', os.path.join(
+    os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share'), 'dashboard_cmg', 'archivo_cmg'))
+
+TABLAS = {'cmg_tiempo_real': cn.CmgTiempoReal, 'cmg_ponderado': cn.CmgPonderado}
+
+# los limites de cada mes se calculan en hora de Chile, igual que los timestamps de las tablas
+ZONA_HORARIA = 'America/Santiago'
+
+COMPRESION = 'zstd'
+
+#########################################################################
+###################        Particionado        ##########################
+#########################################################################
+
+def inicio_mes(anio, mes):
+    "unix_time del inicio del mes en hora de Chile"
+    inicio = pd.Timestamp(year=anio, month=mes, day=1).tz_localize(ZONA_HORARIA, ambiguous=False, nonexistent='shift_forward')
+    return int(inicio.timestamp())
+
+def mes_siguiente(anio, mes):
+    return (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+def meses(desde, hasta):
+    """
+    Meses entre desde (inclusive) y hasta (exclusive).
+
+    Args:
+        desde, hasta (tuple): (anio, mes).
+
+    Returns:
+        list of tuple: (anio, mes) en orden.
+    """
+    salida, actual = [], tuple(desde)
+    while actual < tuple(hasta):
+        salida.append(actual)
+        actual = mes_siguiente(*actual)
+    return salida
+
+def mes_de_unix(unix_time):
+    "(anio, mes) en hora de Chile de un unix_time"
+    fecha = pd.Timestamp(unix_time, unit='s', tz='UTC').tz_convert(ZONA_HORARIA)
+    return fecha.year, fecha.month
+
+def nombre_particion(anio, mes):
+    return f'p{anio}{mes:02d}'
+
+def _pk(modelo):
+    return list(modelo.__table__.primary_key.columns)[0].name
+
+def ddl_particionar(tabla, desde, hasta):
+    """
+    DDL para convertir la tabla en una tabla particionada por rango mensual de unix_time.
+
+    MySQL exige que la columna de particion forme parte de cada clave unica, por lo que la clave primaria pasa a ser
+    (id, unix_time); el id sigue siendo AUTO_INCREMENT y unico en la practica, y el modelo ORM no cambia.
+
+    Args:
+        tabla (str): cmg_tiempo_real o cmg_ponderado.
+        desde, hasta (tuple): (anio, mes) de la primera particion y del mes siguiente a la ultima.
+
+    Returns:
+        list of str: sentencias a ejecutar en orden. La ultima particion (pmax) recibe los meses futuros.
+    """
+    pk = _pk(TABLAS[tabla])
+    particiones = [f"PARTITION {nombre_particion(*mes)} VALUES LESS THAN ({inicio_mes(*mes_siguiente(*mes))})"
+                   for mes in meses(desde, hasta)]
+    particiones.append("PARTITION pmax VALUES LESS THAN MAXVALUE")
+    return [
+        f"ALTER TABLE `{tabla}` DROP PRIMARY KEY, ADD PRIMARY KEY (`{pk}`, `unix_time`)",
+        f"ALTER TABLE `{tabla}` PARTITION BY RANGE (`unix_time`) (\n    " + ",\n    ".join(particiones) + "\n)"
+    ]
+
+def ddl_agregar_mes(tabla, anio, mes):
+    "DDL que separa el mes indicado de la particion pmax"
+    return (f"ALTER TABLE `{tabla}` REORGANIZE PARTITION pmax INTO ("
+            f"PARTITION {nombre_particion(anio, mes)} VALUES LESS THAN ({inicio_mes(*mes_siguiente(anio, mes))}), "
+            f"PARTITION pmax VALUES LESS THAN MAXVALUE)")
+
+def particiones_existentes(conn, tabla):
+    "nombres de las particiones de la tabla (vacio si no esta particionada o la base no es MySQL)"
+    if conn.dialect.name != 'mysql':
+        return set()
+    filas = conn.execute(text(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :tabla AND PARTITION_NAME IS NOT NULL"), {'tabla': tabla})
+    return {fila[0] for fila in filas}
+
+def extender_particiones(engine_in, meses_adelante=3, ejecutar=False):
+    """
+    Separa de pmax una particion para cada mes desde el actual hasta `meses_adelante` meses en el futuro, para que
+    las filas nuevas no se acumulen en pmax.
+
+    Returns:
+        list of str: sentencias ejecutadas (o que se ejecutarian si ejecutar es False).
+    """
+    ahora = datetime.now()
+    hasta = (ahora.year, ahora.month)
+    for _ in range(meses_adelante + 1):
+        hasta = mes_siguiente(*hasta)
+
+    sentencias = []
+    with engine_in.connect() as conn:
+        for tabla in TABLAS:
+            existentes = particiones_existentes(conn, tabla)
+            if 'pmax' not in existentes:
+                logging.info(f"{tabla} no esta particionada, se omite")
+                continue
+            sentencias.extend(ddl_agregar_mes(tabla, *mes) for mes in meses((ahora.year, ahora.month), hasta)
+                              if nombre_particion(*mes) not in existentes)
+
+    if ejecutar:
+        with engine_in.begin() as conn:
+            for sentencia in sentencias:
+                conn.execute(text(sentencia))
+    return sentencias
+
+#########################################################################
+##############                Classes                 ###################
+#########################################################################
+
+class ArchivoParquet:
+    """
+    Directorio con un archivo Parquet por tabla y mes (<tabla>/<AAAA-MM>.parquet) y el manifiesto. Las lecturas
+    filtran por unix_time y barra al leer cada archivo, y solo abren los meses que se cruzan con el rango.
+    """
+    def __init__(self, directorio=RUTA_ARCHIVO):
+        self.directorio = directorio
+        self.ruta_manifiesto = os.path.join(directorio, 'manifiesto.json')
+        self._manifiesto = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def manifiesto(self):
+        "manifiesto actual; se vuelve a leer solo si el archivo cambio"
+        with self._lock:
+            try:
+                mtime = os.path.getmtime(self.ruta_manifiesto)
+            except OSError:
+                return {}
+            if mtime != self._mtime:
+                with open(self.ruta_manifiesto, encoding='utf-8') as archivo:
+                    self._manifiesto = json.load(archivo)
+                self._mtime = mtime
+            return self._manifiesto
+
+    def _guardar_manifiesto(self, manifiesto):
+        tmp_path = f'{self.ruta_manifiesto}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as archivo:
+            json.dump(manifiesto, archivo, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.ruta_manifiesto)
+
+    def limite(self, tabla):
+        "unix_time desde el cual la tabla se lee de MySQL (0 si no hay meses archivados)"
+        return self.manifiesto().get(tabla, {}).get('archivado_hasta', 0)
+
+    def leer(self, tabla, unix_time_inicio, unix_time_fin, barras_transmision=None, columnas=None):
+        """
+        Filas archivadas de la tabla entre dos unix_time (inclusive), ordenadas por unix_time.
+
+        Args:
+            tabla (str): cmg_tiempo_real o cmg_ponderado.
+            unix_time_inicio, unix_time_fin (int): rango inclusive.
+            barras_transmision (list of str, optional): barras a leer. Por defecto todas.
+            columnas (list of str, optional): columnas a leer. Por defecto todas.
+
+        Returns:
+            pd.DataFrame: filas del rango (vacio si no hay meses archivados en el rango).
+        """
+        filtros = [('unix_time', '>=', unix_time_inicio), ('unix_time', '<=', unix_time_fin)]
+        if barras_transmision is not None:
+            filtros.append(('barra_transmision', 'in', list(barras_transmision)))
+
+        partes = []
+        for registro in self.manifiesto().get(tabla, {}).get('meses', {}).values():
+            if registro['fin'] <= unix_time_inicio or registro['inicio'] > unix_time_fin:
+                continue
+            partes.append(pd.read_parquet(os.path.join(self.directorio, registro['archivo']), columns=columnas, filters=filtros))
+
+        if not partes:
+            return pd.DataFrame(columns=columnas or TABLAS[tabla].__table__.columns.keys())
+        return pd.concat(partes, ignore_index=True).sort_values('unix_time', kind='stable', ignore_index=True)
+
+    def archivar_mes(self, session_in, tabla, anio, mes):
+        """
+        Exporta un mes de MySQL a Parquet y lo registra en el manifiesto. No elimina filas de MySQL.
+
+        Si el mes ya estaba archivado, las filas de MySQL se combinan con las del archivo existente (prevalecen las
+        de MySQL por barra_transmision y unix_time). El archivo se escribe en un temporal, se verifica releyendo la
+        cantidad de filas y luego se reemplaza de forma atomica. `archivado_hasta` solo avanza si el mes es contiguo
+        a los ya archivados.
+
+        Returns:
+            int: filas archivadas.
+
+        Raises:
+            RuntimeError: si falla la consulta a MySQL o la verificacion del archivo.
+        """
+        modelo = TABLAS[tabla]
+        inicio, fin = inicio_mes(anio, mes), inicio_mes(*mes_siguiente(anio, mes))
+
+        # la consulta se hace directo a MySQL: el mes todavia no esta en el manifiesto
+        filas = cn.query_filas_rango(session_in, inicio, fin - 1, modelo, usar_archivo=False)
+        if filas is None:
+            raise RuntimeError(f"Could not read {tabla} {anio}-{mes:02d} from MySQL")
+
+        relativo = os.path.join(tabla, f'{anio}-{mes:02d}.parquet')
+        ruta = os.path.join(self.directorio, relativo)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        df = pd.DataFrame(filas, columns=modelo.__table__.columns.keys())
+        if os.path.exists(ruta):
+            df = pd.concat([pd.read_parquet(ruta), df], ignore_index=True).drop_duplicates(
+                ['barra_transmision', 'unix_time'], keep='last').sort_values('unix_time', kind='stable', ignore_index=True)
+        df.to_parquet(f'{ruta}.tmp', compression=COMPRESION, index=False)
+        if len(pd.read_parquet(f'{ruta}.tmp', columns=['unix_time'])) != len(df):
+            raise RuntimeError(f"Parquet verification failed for {relativo}")
+        os.replace(f'{ruta}.tmp', ruta)
+
+        manifiesto = copy.deepcopy(self.manifiesto())
+        registro_tabla = manifiesto.setdefault(tabla, {'archivado_hasta': 0, 'meses': {}})
+        registro_tabla['meses'][f'{anio}-{mes:02d}'] = {'inicio': inicio, 'fin': fin, 'filas': len(df), 'archivo': relativo}
+        if registro_tabla['archivado_hasta'] in (0, inicio):
+            registro_tabla['archivado_hasta'] = fin
+        self._guardar_manifiesto(manifiesto)
+        return len(df)
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def abrir_archivo(directorio=RUTA_ARCHIVO):
+    "ArchivoParquet del directorio si ya tiene manifiesto, o None"
+    if not directorio or not os.path.exists(os.path.join(directorio, 'manifiesto.json')):
+        return None
+    return ArchivoParquet(directorio)
+
+def eliminar_mes(engine_in, tabla, anio, mes):
+    """
+    Elimina de MySQL las filas de un mes ya archivado: DROP PARTITION si existe la particion del mes, o DELETE por
+    dias (transacciones cortas) si la tabla no esta particionada.
+
+    Returns:
+        str: 'particion' o 'delete'.
+    """
+    inicio, fin = inicio_mes(anio, mes), inicio_mes(*mes_siguiente(anio, mes))
+    with engine_in.connect() as conn:
+        existentes = particiones_existentes(conn, tabla)
+
+    if nombre_particion(anio, mes) in existentes:
+        with engine_in.begin() as conn:
+            conn.execute(text(f"ALTER TABLE `{tabla}` DROP PARTITION {nombre_particion(anio, mes)}"))
+        return 'particion'
+
+    tabla_sql = TABLAS[tabla].__table__
+    for desde in range(inicio, fin, 86400):
+        with engine_in.begin() as conn:
+            conn.execute(tabla_sql.delete().where(tabla_sql.c.unix_time >= desde).where(tabla_sql.c.unix_time < min(desde + 86400, fin)))
+    return 'delete'
+
+def archivar(engine_in, archivo, meses_calientes=6, ejecutar=False, rearchivar=None):
+    """
+    Archiva en orden los meses cerrados de cada tabla (anteriores a los `meses_calientes` meses mas recientes) y los
+    elimina de MySQL.
+
+    Args:
+        engine_in: engine del primario.
+        archivo (ArchivoParquet): destino.
+        meses_calientes (int): meses recientes que se mantienen en MySQL, incluido el actual.
+        ejecutar (bool): si es False solo retorna el plan.
+        rearchivar (tuple, optional): (anio, mes) ya archivado que se vuelve a exportar (ej: despues de un backfill).
+
+    Returns:
+        list of dict: tabla, mes, filas y modo de eliminacion de cada mes (o el plan si ejecutar es False).
+    """
+    ahora = datetime.now()
+    corte = (ahora.year, ahora.month)
+    for _ in range(meses_calientes - 1):
+        corte = (corte[0] - 1, 12) if corte[1] == 1 else (corte[0], corte[1] - 1)
+
+    resultado = []
+    for tabla, modelo in TABLAS.items():
+        with cn.establecer_session(engine_in) as session:
+            # primer mes con filas en MySQL a partir del limite ya archivado
+            minimo = session.query(func.min(modelo.unix_time)).filter(modelo.unix_time >= archivo.limite(tabla)).scalar()
+            pendientes = meses(mes_de_unix(minimo), corte) if minimo is not None else []
+            if rearchivar is not None:
+                pendientes = [tuple(rearchivar)] + [mes for mes in pendientes if mes != tuple(rearchivar)]
+
+            for anio, mes in pendientes:
+                if not ejecutar:
+                    resultado.append({'tabla': tabla, 'mes': f'{anio}-{mes:02d}', 'filas': None, 'eliminacion': None})
+                    continue
+                filas = archivo.archivar_mes(session, tabla, anio, mes)
+                session.commit()
+                resultado.append({'tabla': tabla, 'mes': f'{anio}-{mes:02d}', 'filas': filas,
+                                  'eliminacion': eliminar_mes(engine_in, tabla, anio, mes)})
+                logging.info(f"Archivado {tabla} {anio}-{mes:02d}: {filas} filas")
+
+    return resultado
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Particionado mensual y archivado Parquet de cmg_tiempo_real y cmg_ponderado')
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+    parser_ddl = subparsers.add_parser('ddl', help='imprime el DDL para particionar las tablas')
+    parser_ddl.add_argument('--desde', required=True, help='primer mes AAAA-MM')
+    parser_ddl.add_argument('--hasta', required=True, help='mes siguiente al ultimo AAAA-MM')
+    parser_extender = subparsers.add_parser('extender', help='agrega particiones de los proximos meses')
+    parser_extender.add_argument('--meses', type=int, default=3)
+    parser_extender.add_argument('--ejecutar', action='store_true')
+    parser_archivar = subparsers.add_parser('archivar', help='archiva a Parquet y elimina los meses cerrados')
+    parser_archivar.add_argument('--meses-calientes', type=int, default=6)
+    parser_archivar.add_argument('--directorio', default=RUTA_ARCHIVO)
+    parser_archivar.add_argument('--rearchivar', default=None, help='mes AAAA-MM ya archivado que se vuelve a exportar')
+    parser_archivar.add_argument('--ejecutar', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if args.comando == 'ddl':
+        desde = tuple(int(parte) for parte in args.desde.split('-'))
+        hasta = tuple(int(parte) for parte in args.hasta.split('-'))
+        for tabla in TABLAS:
+            print(";\n".join(ddl_particionar(tabla, desde, hasta)) + ";\n")
+        raise SystemExit(0)
+
+    host = os.environ.get("MYSQL_HOST")
+    database = os.environ.get("MYSQL_DATABASE")
+    user = os.environ.get("MYSQL_USER")
+    password = os.environ.get("MYSQL_USER_PASSWORD")
+    port = os.environ.get("MYSQL_PORT")
+
+    engine, _ = cn.establecer_engine(database, user, password, host, port, verbose=True)
+
+    if args.comando == 'extender':
+        for sentencia in extender_particiones(engine, args.meses, ejecutar=args.ejecutar):
+            print(sentencia + ";")
+    else:
+        rearchivar = tuple(int(parte) for parte in args.rearchivar.split('-')) if args.rearchivar else None
+        for fila in archivar(engine, ArchivoParquet(args.directorio), args.meses_calientes, ejecutar=args.ejecutar, rearchivar=rearchivar):
+            print(fila)
+
+    engine.dispose()
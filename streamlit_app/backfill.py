@@ -0,0 +1,289 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Backfill historico de cmg_tiempo_real y cmg_ponderado. Recalcula el CMg corregido para un rango de fechas
+y una lista de barras, repartiendo las revisiones RIO en un pool de procesos e insertando los resultados en bloque con
+checkpoints reanudables.
+
+Uso:
+    python backfill.py --desde 2023-05-01 --hasta 2024-05-01 --barras CHARRUA__220 QUILLOTA__220 --workers 8
+"""
+
+import os
+import json
+import logging
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import screener
+import connection as cn
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+FORMATO_TIMESTAMP = '%d.%m.%y %H:%M:%S'
+CHECKPOINT_PATH = 'backfill_checkpoint.json'
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def generar_tareas(revisiones, fecha_desde, fecha_hasta, barras):
+    """
+    Agrupa los instantes a recalcular por revision RIO. Cada revision se evalua en su instante de modificacion y en
+    cada inicio de hora hasta la siguiente revision del mismo archivo, igual que lo hace el scheduler en tiempo real.
+
+    Args:
+        revisiones (list): tuplas (id, timestamp, archivo_rio, last_modification) de query_revisiones_rio.
+        fecha_desde (datetime): inicio del rango (inclusive).
+        fecha_hasta (datetime): fin del rango (exclusive).
+        barras (list of str): barras de transmision a recalcular.
+
+    Returns:
+        list of dict: tareas con llaves id, archivo_rio, timestamps y barras.
+    """
+    parsed = []
+    for id_rev, _, archivo_rio, last_modification in revisiones:
+        try:
+            instante = datetime.strptime(last_modification, FORMATO_TIMESTAMP)
+        except (TypeError, ValueError):
+            logging.error(f"Revision {id_rev} con last_modification invalido: {last_modification}")
+            continue
+        parsed.append((id_rev, archivo_rio, instante))
+
+    parsed.sort(key=lambda rev: rev[2])
+
+    tareas = []
+    for i, (id_rev, archivo_rio, instante) in enumerate(parsed):
+        # la revision es valida hasta la siguiente modificacion del mismo archivo o hasta el fin del dia
+        fin_dia = instante.replace(hour=0, minute=0, second=0) + timedelta(days=1)
+        siguiente = fin_dia
+        for _, archivo_sig, instante_sig in parsed[i + 1:]:
+            if instante_sig >= fin_dia:
+                break
+            if archivo_sig == archivo_rio:
+                siguiente = min(instante_sig, fin_dia)
+                break
+        siguiente = min(siguiente, fecha_hasta)
+
+        instantes = [instante] if fecha_desde <= instante < fecha_hasta else []
+        hora = instante.replace(minute=0, second=0) + timedelta(hours=1)
+        while hora < siguiente:
+            if hora >= fecha_desde:
+                instantes.append(hora)
+            hora += timedelta(hours=1)
+
+        if instantes:
+            tareas.append({
+                'id': id_rev,
+                'archivo_rio': archivo_rio,
+                'timestamps': [ts.strftime(FORMATO_TIMESTAMP) for ts in instantes],
+                'barras': list(barras)
+            })
+
+    return tareas
+
+def procesar_revision(tarea):
+    """
+    Descarga los archivos de una revision RIO y evalua get_cmg_corregido para todos sus instantes y barras.
+    Se ejecuta en un proceso del pool, por lo que no usa la base de datos.
+
+    Args:
+        tarea (dict): tarea generada por generar_tareas.
+
+    Returns:
+        tuple: (id de la revision, lista de filas para bulk_upsert_cmg_tiempo_real)
+    """
+    rows_out = []
+    df_rio, df_tco, df_fp, arr_temp_files = screener.download_and_import_files(tarea['archivo_rio'])
+
+    try:
+        for timestamp in tarea['timestamps']:
+            int_year, int_month, int_day, str_time, int_unix_time = screener.timestamp_decomp(timestamp)
+
+            for barra in tarea['barras']:
+                flt_cmg_corregido, central_ref = screener.get_cmg_corregido(
+                    timestamp_in=timestamp, df_tco_in=df_tco, df_fp_in=df_fp, df_rio_in=df_rio, central_in=barra)
+
+                rows_out.append({
+                    'barra_transmision': barra,
+                    'año': int_year,
+                    'mes': int_month,
+                    'dia': int_day,
+                    'hora': str_time,
+                    'unix_time': int_unix_time,
+                    'cmg': float(flt_cmg_corregido),
+                    'central_referencia': central_ref
+                })
+    finally:
+        if arr_temp_files is not None:
+            for file in arr_temp_files:
+                screener.delete_temp_file(file_name=file)
+
+    return tarea['id'], rows_out
+
+def leer_checkpoint(path, parametros):
+    """
+    Lee el checkpoint de un backfill previo. Si los parametros no coinciden se ignora.
+
+    Returns:
+        set: ids de revisiones ya insertadas.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    with open(path, 'r') as file:
+        checkpoint = json.load(file)
+
+    if checkpoint.get('parametros') != parametros:
+        logging.warning(f"Checkpoint {path} corresponde a otros parametros, se ignora")
+        return set()
+
+    return set(checkpoint.get('revisiones_completadas', []))
+
+def escribir_checkpoint(path, parametros, completadas):
+    "escribe el checkpoint de forma atomica"
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump({'parametros': parametros, 'revisiones_completadas': sorted(completadas)}, file)
+    os.replace(tmp_path, path)
+
+def recalcular_cmg_ponderado(session_in, unix_desde, unix_hasta, barras):
+    """
+    Recalcula cmg_ponderado para todas las horas del rango a partir de cmg_tiempo_real.
+
+    Returns:
+        int: cantidad de horas recalculadas.
+    """
+    entries = cn.query_cmg_tiempo_real_rango(session_in, unix_desde, unix_hasta - 1, barras)
+    if entries is None:
+        raise RuntimeError("No se pudo consultar cmg_tiempo_real para recalcular cmg_ponderado")
+
+    df_horas = cn.calcular_cmg_ponderado_horas(pd.DataFrame(entries))
+    rows = [{
+        'barra_transmision': row.barra_transmision,
+        'timestamp': screener.get_timestamp_from_unix_time(float(row.unix_time)),
+        'unix_time': int(row.unix_time),
+        'cmg_ponderado': round(float(row.cmg_ponderado), 4)
+    } for row in df_horas.itertuples(index=False)]
+
+    cn.bulk_upsert_cmg_ponderado(session_in, rows)
+    session_in.commit()
+    return len(rows)
+
+def ejecutar_backfill(engine_in, fecha_desde, fecha_hasta, barras, workers=None, checkpoint_path=CHECKPOINT_PATH,
+                      tamano_lote=5000, ponderado=True):
+    """
+    Ejecuta el backfill de cmg_tiempo_real (y opcionalmente cmg_ponderado) para un rango de fechas.
+
+    Los resultados de cada revision se acumulan y se insertan en bloque cada `tamano_lote` filas; el checkpoint solo
+    registra revisiones cuyas filas ya fueron confirmadas, por lo que un backfill interrumpido se puede reanudar.
+
+    Args:
+        engine_in: SQLAlchemy engine object.
+        fecha_desde (datetime): inicio del rango (inclusive).
+        fecha_hasta (datetime): fin del rango (exclusive).
+        barras (list of str): barras de transmision a recalcular.
+        workers (int, optional): procesos del pool. Por defecto os.cpu_count().
+        checkpoint_path (str): archivo de checkpoint.
+        tamano_lote (int): filas por transaccion de insercion.
+        ponderado (bool): si es True recalcula cmg_ponderado al terminar.
+
+    Returns:
+        dict: resumen con revisiones procesadas, filas insertadas/actualizadas y horas ponderadas.
+    """
+    parametros = {
+        'desde': fecha_desde.strftime('%Y-%m-%d'),
+        'hasta': fecha_hasta.strftime('%Y-%m-%d'),
+        'barras': sorted(barras)
+    }
+    completadas = leer_checkpoint(checkpoint_path, parametros)
+    resumen = {'revisiones': 0, 'insertadas': 0, 'actualizadas': 0, 'horas_ponderadas': 0, 'errores': 0}
+
+    with cn.establecer_session(engine_in) as session:
+        revisiones = cn.query_revisiones_rio(session)
+        if revisiones is None:
+            raise RuntimeError("No se pudieron consultar las revisiones RIO")
+
+        tareas = [tarea for tarea in generar_tareas(revisiones, fecha_desde, fecha_hasta, barras)
+                  if tarea['id'] not in completadas]
+        logging.info(f"Backfill: {len(tareas)} revisiones pendientes, {len(completadas)} ya completadas")
+
+        buffer, pendientes = [], []
+
+        def flush():
+            insertadas, actualizadas = cn.bulk_upsert_cmg_tiempo_real(session, buffer)
+            session.commit()
+            completadas.update(pendientes)
+            escribir_checkpoint(checkpoint_path, parametros, completadas)
+            resumen['insertadas'] += insertadas
+            resumen['actualizadas'] += actualizadas
+            buffer.clear()
+            pendientes.clear()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(procesar_revision, tarea): tarea['id'] for tarea in tareas}
+
+            for future in as_completed(futures):
+                try:
+                    id_rev, rows = future.result()
+                except Exception as exception:
+                    resumen['errores'] += 1
+                    logging.error(f"Error al procesar revision {futures[future]}: {exception}")
+                    continue
+
+                buffer.extend(rows)
+                pendientes.append(id_rev)
+                resumen['revisiones'] += 1
+
+                if len(buffer) >= tamano_lote:
+                    flush()
+
+        flush()
+
+        if ponderado:
+            unix_desde = int(fecha_desde.timestamp())
+            unix_hasta = int(fecha_hasta.timestamp())
+            resumen['horas_ponderadas'] = recalcular_cmg_ponderado(session, unix_desde, unix_hasta, barras)
+
+    return resumen
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Backfill historico de cmg_tiempo_real y cmg_ponderado')
+    parser.add_argument('--desde', required=True, help='fecha inicial YYYY-MM-DD (inclusive)')
+    parser.add_argument('--hasta', required=True, help='fecha final YYYY-MM-DD (exclusive)')
+    parser.add_argument('--barras', nargs='+', default=['CHARRUA__220', 'QUILLOTA__220'])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--lote', type=int, default=5000, help='filas por transaccion')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH)
+    parser.add_argument('--sin-ponderado', action='store_true', help='no recalcular cmg_ponderado')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    host = os.environ.get("MYSQL_HOST")
+    database = os.environ.get("MYSQL_DATABASE")
+    user = os.environ.get("MYSQL_USER")
+    password = os.environ.get("MYSQL_USER_PASSWORD")
+    port = os.environ.get("MYSQL_PORT")
+
+    engine, _ = cn.establecer_engine(database, user, password, host, port, verbose=True)
+
+    resultado = ejecutar_backfill(
+        engine,
+        datetime.strptime(args.desde, '%Y-%m-%d'),
+        datetime.strptime(args.hasta, '%Y-%m-%d'),
+        args.barras,
+        workers=args.workers,
+        checkpoint_path=args.checkpoint,
+        tamano_lote=args.lote,
+        ponderado=not args.sin_ponderado)
+
+    print(resultado)
+    engine.dispose()
@@ -0,0 +1,538 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Benchmarks offline del pipeline de datos del dashboard. Siembra una base local (SQLite por defecto, o
+MySQL via --url) con volumenes realistas de cmg_tiempo_real, cmg_ponderado, central y tracking_coordinador, levanta
+un servidor HTTP local que reemplaza a la API flask y a coordinador.cl, y mide cada funcion de connection.py y cada
+etapa de app.py para varios tamaños de datos. El reporte JSON se puede comparar con uno anterior para detectar
+regresiones antes de un deploy.
+
+Uso:
+    python benchmark.py --tamanos 30 365 730 --salida bench.json
+    python benchmark.py --tamanos 30 365 730 --comparar bench_base.json --tolerancia 0.25
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import warnings
+import platform
+import tempfile
+import threading
+import subprocess
+import statistics
+from datetime import datetime
+from urllib.parse import urlparse, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+import connection as cn
+from instrumentation import contar_filas
+import api
+import pipeline
+import escenarios
+import espejo
+import descargas
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+BARRAS = ['CHARRUA__220', 'QUILLOTA__220']
+CENTRALES = {'Los Angeles': 'CHARRUA__220', 'Quillota': 'QUILLOTA__220'}
+BARRAS_ONLINE = ['Charrua', 'Quillota', 'Alto Jahuel', 'Crucero', 'Polpaico']
+ZONA_HORARIA = 'America/Santiago'
+FORMATO_TIMESTAMP = '%d.%m.%y %H:%M:%S'
+
+# fin fijo de los datos sembrados para que los reportes sean comparables entre ejecuciones
+FIN_UNIX = int(datetime(2024, 6, 1).timestamp())
+
+TAMANO_CHUNK = 20000
+
+# modulos que importa app.py al arrancar y modulos pesados que deben cargarse solo al usarse
+MODULOS_ARRANQUE = ['connection', 'instrumentation', 'api', 'pipeline']
+MODULOS_DIFERIDOS = ['seaborn', 'matplotlib', 'mysql.connector', 'requests']
+
+#########################################################################
+###################      Datos sinteticos       #########################
+#########################################################################
+
+def _timestamps(unix_time):
+    "formatea unix_time como los timestamps de texto que escribe el scheduler (hora de Chile)"
+    fechas = pd.to_datetime(unix_time, unit='s', utc=True).tz_convert(ZONA_HORARIA)
+    return fechas.strftime(FORMATO_TIMESTAMP)
+
+def _insertar(engine_in, tabla, columnas):
+    "inserta un diccionario de columnas en bloques"
+    df = pd.DataFrame(columnas)
+    registros = df.to_dict('records')
+    with engine_in.begin() as conn:
+        for i in range(0, len(registros), TAMANO_CHUNK):
+            conn.execute(tabla.insert(), registros[i:i + TAMANO_CHUNK])
+
+def sembrar_base_datos(engine_in, dias, fin_unix=FIN_UNIX, semilla=0):
+    """
+    Crea el esquema y siembra `dias` dias de datos sinteticos que terminan en fin_unix.
+
+    Volumenes por dia: 96 lecturas de cmg_tiempo_real y 24 de cmg_ponderado por barra, 96 filas de
+    tracking_coordinador y 4 entradas de central por central.
+
+    Returns:
+        dict: cantidad de filas sembradas por tabla.
+    """
+    rng = np.random.default_rng(semilla)
+    cn.Base.metadata.drop_all(engine_in)
+    cn.Base.metadata.create_all(engine_in)
+    inicio = fin_unix - dias * 86400
+    filas = {}
+
+    # cmg_tiempo_real cada 15 minutos
+    unix_15 = np.arange(inicio, fin_unix, 900, dtype=np.int64)
+    ts_15 = _timestamps(unix_15)
+    partes = pd.Series(ts_15).str.split(' ', expand=True)
+    fechas_15 = pd.to_datetime(unix_15, unit='s', utc=True).tz_convert(ZONA_HORARIA)
+    for barra in BARRAS:
+        cmg = np.round(60 + 40 * np.sin(unix_15 / 86400 * 2 * np.pi) + rng.normal(0, 15, len(unix_15)), 3).clip(0, 9999)
+        desacople = rng.random(len(unix_15)) < 0.1
+        _insertar(engine_in, cn.CmgTiempoReal.__table__, {
+            'barra_transmision': barra,
+            'año': fechas_15.year,
+            'mes': fechas_15.month,
+            'dia': fechas_15.day,
+            'hora': partes[1].to_numpy(),
+            'unix_time': unix_15,
+            'desacople_bool': desacople,
+            'cmg': cmg,
+            'central_referencia': np.where(desacople, rng.choice(['SANTA MARIA', 'ANGAMOS', 'NEHUENCO'], len(unix_15)), barra)
+        })
+    filas['cmg_tiempo_real'] = len(unix_15) * len(BARRAS)
+
+    # cmg_ponderado horario
+    unix_h = np.arange(inicio, fin_unix, 3600, dtype=np.int64)
+    ts_h = _timestamps(unix_h)
+    for barra in BARRAS:
+        _insertar(engine_in, cn.CmgPonderado.__table__, {
+            'barra_transmision': barra,
+            'timestamp': ts_h,
+            'unix_time': unix_h,
+            'cmg_ponderado': np.round(60 + 40 * np.sin(unix_h / 86400 * 2 * np.pi) + rng.normal(0, 10, len(unix_h)), 4).clip(0, 999)
+        })
+    filas['cmg_ponderado'] = len(unix_h) * len(BARRAS)
+
+    # historial de central cada 6 horas
+    unix_6 = np.arange(inicio, fin_unix, 6 * 3600, dtype=np.int64)
+    ts_6 = _timestamps(unix_6)
+    for nombre in CENTRALES:
+        n = len(unix_6)
+        porcentaje_brent = rng.uniform(0.12, 0.16, n).round(4)
+        precio_brent = rng.uniform(70, 95, n).round(3)
+        tasa_proveedor = rng.uniform(3.5, 4.5, n).round(4)
+        factor_motor = rng.uniform(9.5, 10.5, n).round(3)
+        tasa_central = rng.uniform(8, 9.5, n).round(4)
+        margen_garantia = rng.choice([-25.0, -10.0, 0.0], n)
+        costo_operacional = ((porcentaje_brent * precio_brent) + tasa_proveedor) * factor_motor + tasa_central + margen_garantia
+        _insertar(engine_in, cn.CentralTable.__table__, {
+            'nombre': nombre,
+            'generando': rng.random(n) < 0.5,
+            'tasa_proveedor': tasa_proveedor,
+            'porcentaje_brent': porcentaje_brent,
+            'tasa_central': tasa_central,
+            'precio_brent': precio_brent,
+            'fecha_referencia_brent': ts_6,
+            'costo_operacional': costo_operacional.round(3),
+            'fecha_registro': ts_6,
+            'margen_garantia': margen_garantia,
+            'factor_motor': factor_motor,
+            'external_update': rng.random(n) < 0.2,
+            'editor': 'benchmark'
+        })
+    filas['central'] = len(unix_6) * len(CENTRALES)
+
+    # tracking_coordinador cada 15 minutos
+    _insertar(engine_in, cn.TrackingCoordinador.__table__, {
+        'timestamp': ts_15,
+        'archivo_rio': ['RIO' + fecha.strftime('%y%m%d') + '.xls' for fecha in fechas_15],
+        'last_modification': ts_15,
+        'rio_mod': rng.random(len(unix_15)) < 0.05
+    })
+    filas['tracking_coordinador'] = len(unix_15)
+
+    return filas
+
+#########################################################################
+###################       Servidor stub         #########################
+#########################################################################
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    Responde las rutas de la API flask (/central, /cmg_programados, /central/insert) y de coordinador.cl
+    (/costo-marginal/) con datos deterministas.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def _responder(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        partes = [unquote(p) for p in url.path.strip('/').split('/')]
+
+        if partes[0] == 'costo-marginal':
+            query = dict(p.split('=', 1) for p in url.query.split('&') if '=' in p)
+            fecha = query.get('fecha__lte', '2024-06-01')
+            self._responder([{'barra': barra, 'fecha': f'{fecha} {hora:02d}:00:00', 'cmg': 50.0 + hora + i}
+                             for i, barra in enumerate(BARRAS_ONLINE) for hora in range(24)])
+        elif partes[0] == 'cmg_programados' and len(partes) == 3:
+            self._responder({f'{hora:02d}:00': 55.0 + hora for hora in range(24)})
+        elif partes[0] == 'central' and len(partes) == 2:
+            self._responder({'nombre': partes[1], 'generando': True, 'costo_operacional': 80.0, 'margen_garantia': -25.0})
+        else:
+            self._responder({'error': 'not found'}, status=404)
+
+    def do_PUT(self):
+        largo = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(largo) or b'{}')
+        self._responder({'status': 'ok', 'data': data})
+
+class ServidorStub:
+    """
+    Servidor HTTP local en un thread. Al iniciarlo redirige api.COORDINADOR_URL hacia el stub.
+    """
+    def __init__(self, host='127.0.0.1', port=0):
+        self.server = ThreadingHTTPServer((host, port), _StubHandler)
+        self.host, self.port = self.server.server_address
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._coordinador_url = api.COORDINADOR_URL
+
+    def __enter__(self):
+        self._thread.start()
+        api.COORDINADOR_URL = f'http://{self.host}:{self.port}/costo-marginal/'
+        return self
+
+    def __exit__(self, *exc):
+        api.COORDINADOR_URL = self._coordinador_url
+        self.server.shutdown()
+        self.server.server_close()
+
+#########################################################################
+###################         Mediciones          #########################
+#########################################################################
+
+def medir_etapa(funcion, repeticiones):
+    """
+    Ejecuta funcion `repeticiones` veces y retorna (ultimo resultado, lista de tiempos en segundos).
+    """
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return resultado, tiempos
+
+def _fila_resultado(tamano, grupo, etapa, resultado, tiempos):
+    return {
+        'tamano_dias': tamano,
+        'grupo': grupo,
+        'etapa': etapa,
+        'filas': contar_filas(resultado),
+        'min': min(tiempos),
+        'mediana': statistics.median(tiempos),
+        'media': statistics.fmean(tiempos),
+    }
+
+def _render_png(df, costos):
+    "renderiza el grafico completo a PNG, igual que st.pyplot"
+    import matplotlib.pyplot as plt
+    figura = pipeline.render_grafico_cmg(df, costos, [(costos[0], 'r', 'CO')])
+    buffer = io.BytesIO()
+    figura.savefig(buffer, format='png')
+    plt.close(figura)
+    return buffer.getvalue()
+
+def ejecutar_tamano(engine_in, tamano, repeticiones, servidor, directorio=None):
+    """
+    Mide todas las etapas para una base sembrada con `tamano` dias de datos. Si se entrega `directorio`, tambien
+    mide la replicacion al espejo analitico y las lecturas historicas enrutadas a el.
+
+    Returns:
+        list of dict: una fila por etapa.
+    """
+    resultados = []
+    unixtime = FIN_UNIX
+    inicio_rango = FIN_UNIX - tamano * 86400
+    horas_rango = tamano * 24
+    fecha_referencia = datetime.fromtimestamp(FIN_UNIX)
+    fecha = fecha_referencia.strftime('%Y-%m-%d')
+
+    def registrar(grupo, etapa, funcion):
+        resultado, tiempos = medir_etapa(funcion, repeticiones)
+        resultados.append(_fila_resultado(tamano, grupo, etapa, resultado, tiempos))
+        return resultado
+
+    with cn.establecer_session(engine_in) as session:
+        # funciones de connection.py
+        registrar('connection', 'query_last_ins_tracking_coordinador', lambda: cn.query_last_ins_tracking_coordinador(session))
+        registrar('connection', 'query_values_last_desacople_bool', lambda: cn.query_values_last_desacople_bool(session, 'CHARRUA__220'))
+        registrar('connection', 'query_previous_modification_tracking_coordinador', lambda: cn.query_previous_modification_tracking_coordinador(session))
+        registrar('connection', 'evaluar_modificacion_rio', lambda: cn.evaluar_modificacion_rio(session, ''))
+        registrar('connection', 'query_ultima_modificacion_rio', lambda: cn.query_ultima_modificacion_rio(session))
+        registrar('connection', 'evaluar_cmg_hora', lambda: cn.evaluar_cmg_hora(session, unixtime - 3600, 'CHARRUA__220'))
+        registrar('connection', 'query_last_row_central', lambda: cn.query_last_row_central(session, 'Los Angeles'))
+        registrar('connection', 'query_values_last_desacople_bool_barras', lambda: cn.query_values_last_desacople_bool_barras(session, BARRAS))
+        historial_brent = registrar('connection', 'query_historial_precio_brent', lambda: cn.query_historial_precio_brent(session, 'Los Angeles'))
+        registrar('connection', 'query_last_row_centrales', lambda: cn.query_last_row_centrales(session, list(CENTRALES)))
+        df_central = registrar('connection', 'query_central_table', lambda: cn.query_central_table(session, num_entries=20))
+        df_central_mod = registrar('connection', 'query_central_table_modifications', lambda: cn.query_central_table_modifications(session, num_entries=20))
+        entries_96h = registrar('connection', 'query_cmg_ponderado_by_time[96h]', lambda: cn.query_cmg_ponderado_by_time(session, unixtime, 96))
+        entries_rango = registrar('connection', 'query_cmg_ponderado_by_time[rango]', lambda: cn.query_cmg_ponderado_by_time(session, unixtime, horas_rango))
+        registrar('connection', 'get_cmg_tiempo_real[rango]', lambda: cn.get_cmg_tiempo_real(session, inicio_rango))
+        registrar('connection', 'backtest_despacho[rango]', lambda: cn.backtest_despacho(session, CENTRALES, unixtime - horas_rango * 3600, unixtime))
+        registrar('connection', 'query_cmg_ponderado_rango[rango]', lambda: cn.query_cmg_ponderado_rango(session, inicio_rango, unixtime, BARRAS))
+
+    # espejo analitico: replicacion completa y lectura historica enrutada (todo el rango queda antes del corte)
+    if directorio is not None:
+        router = cn.EngineRouter(engine_in)
+        espejo_bench = espejo.EspejoAnalitico(os.path.join(directorio, f'espejo_{tamano}.db'))
+        with router.session_lectura() as session:
+            registrar('espejo', 'replicar[completa]', lambda: espejo_bench.replicar(session, completa=True))
+        router.conectar_espejo(espejo_bench)
+        registrar('espejo', 'ejecutar_rango[cmg_ponderado]', lambda: router.ejecutar_rango(cn.query_cmg_ponderado_rango, inicio_rango, unixtime, BARRAS))
+        espejo_bench.engine.dispose()
+
+    # etapas de app.py
+    cmg_96h = registrar('app', 'timestamp_parsing[96h]', lambda: pipeline.preparar_cmg_ponderado(entries_96h))
+    registrar('app', 'timestamp_parsing[rango]', lambda: pipeline.preparar_cmg_ponderado(entries_rango))
+    registrar('app', 'filtrar_modificaciones', lambda: pipeline.filtrar_modificaciones_recientes(df_central_mod, fecha_referencia))
+    registrar('app', 'merge', lambda: pipeline.merge_central_cmg_ponderado(cmg_96h, df_central))
+    registrar('app', 'chart', lambda: _render_png(cmg_96h, [80.0, 85.0]))
+    grilla_escenarios = {'porcentaje_brent': np.linspace(0.1, 0.2, 20), 'tasa_proveedor': np.linspace(3.0, 5.0, 10), 'factor_motor': 10.12,
+                         'tasa_central': np.linspace(8.0, 9.0, 5), 'margen_garantia': np.linspace(-30.0, 0.0, 10)}
+    cmg_escenarios = cmg_96h[cmg_96h['barra_transmision'] == 'CHARRUA__220']
+    registrar('app', 'escenarios[10000]', lambda: escenarios.simular(grilla_escenarios, historial_brent, cmg_escenarios))
+
+    # descargas de Tab3: construccion del artefacto (consulta, CSV y Parquet) y lectura desde disco
+    if directorio is not None:
+        servicio = descargas.ServicioDescargas(cn.EngineRouter(engine_in), os.path.join(directorio, f'descargas_{tamano}'))
+        for tabla in descargas.TABLAS:
+            registrar('descargas', f'construir[{tabla}]', lambda tabla=tabla: servicio.construir(tabla, 'CHARRUA__220', inicio_rango, unixtime))
+            registrar('descargas', f'obtener[{tabla}]', lambda tabla=tabla: servicio.obtener(tabla, 'CHARRUA__220', inicio_rango, unixtime))
+
+    # llamadas HTTP contra el stub
+    registrar('http', 'get_cmg_programados', lambda: api.get_cmg_programados('Quillota', fecha, servidor.host, servidor.port))
+    registrar('http', 'get_cmg_programados_centrales', lambda: api.get_cmg_programados_centrales(list(CENTRALES), fecha, servidor.host, servidor.port))
+    registrar('http', 'get_central', lambda: api.get_central('Quillota', servidor.host, servidor.port))
+    registrar('http', 'get_costo_marginal_online_hora', lambda: api.get_costo_marginal_online_hora(
+        fecha, fecha, ['Quillota', 'Charrua'], '10:00:00', 'benchmark'))
+
+    return resultados
+
+#########################################################################
+###################     Tiempo de arranque      #########################
+#########################################################################
+
+def medir_importacion(modulos=MODULOS_ARRANQUE, repeticiones=3, top=10):
+    """
+    Mide en procesos nuevos el tiempo de importar los modulos de arranque del dashboard, revisa que los modulos
+    pesados de MODULOS_DIFERIDOS no se hayan cargado y obtiene los imports mas costosos con -X importtime.
+
+    Returns:
+        dict: segundos (minimo entre repeticiones), modulos diferidos cargados y top de imports por tiempo acumulado.
+    """
+    directorio = os.path.dirname(os.path.abspath(__file__))
+    script = (
+        "import sys, time, json\n"
+        "inicio = time.perf_counter()\n"
+        f"import {', '.join(modulos)}\n"
+        "segundos = time.perf_counter() - inicio\n"
+        f"cargados = [m for m in {MODULOS_DIFERIDOS!r} if m in sys.modules]\n"
+        "print(json.dumps({'segundos': segundos, 'cargados': cargados}))\n"
+    )
+
+    tiempos, cargados, importtime = [], [], ''
+    for _ in range(repeticiones):
+        proceso = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=directorio,
+                                 capture_output=True, text=True, check=True)
+        salida = json.loads(proceso.stdout.strip().splitlines()[-1])
+        tiempos.append(salida['segundos'])
+        cargados = salida['cargados']
+        importtime = proceso.stderr
+
+    # lineas "import time: self [us] | cumulative | imported package"; solo paquetes raiz (sin submodulos)
+    costosos = []
+    for linea in importtime.splitlines():
+        partes = linea.split('|')
+        nombre = partes[-1].strip()
+        if len(partes) != 3 or not partes[0].startswith('import time:') or '.' in nombre:
+            continue
+        try:
+            costosos.append((nombre, int(partes[1]) / 1e6))
+        except ValueError:
+            continue
+    costosos.sort(key=lambda item: -item[1])
+
+    return {'segundos': min(tiempos), 'tiempos': tiempos, 'diferidos_cargados': cargados, 'top': costosos[:top]}
+
+def ejecutar_benchmark(tamanos, repeticiones=5, url=None):
+    """
+    Ejecuta el benchmark para cada tamaño (dias de historia).
+
+    Args:
+        tamanos (list of int): dias de datos sembrados en cada corrida.
+        repeticiones (int): repeticiones por etapa.
+        url (str, optional): URL de SQLAlchemy de la base de pruebas. Por defecto un SQLite temporal por tamaño.
+            La base indicada se borra y se vuelve a crear en cada tamaño.
+
+    Returns:
+        dict: reporte con metadatos y resultados.
+    """
+    resultados = []
+    sembrado = {}
+    directorio = tempfile.mkdtemp(prefix='benchmark_')
+
+    try:
+        with ServidorStub() as servidor:
+            for tamano in tamanos:
+                engine = create_engine(url or f'sqlite:///{os.path.join(directorio, f"bench_{tamano}.db")}')
+                inicio = time.perf_counter()
+                sembrado[tamano] = sembrar_base_datos(engine, tamano)
+                logging.info(f"Sembrados {tamano} dias en {time.perf_counter() - inicio:.1f}s: {sembrado[tamano]}")
+                resultados.extend(ejecutar_tamano(engine, tamano, repeticiones, servidor, directorio))
+                engine.dispose()
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    importacion = medir_importacion()
+    resultados.append({
+        'tamano_dias': 0,
+        'grupo': 'import',
+        'etapa': 'arranque',
+        'filas': None,
+        'min': importacion['segundos'],
+        'mediana': statistics.median(importacion['tiempos']),
+        'media': statistics.fmean(importacion['tiempos']),
+    })
+
+    return {
+        'meta': {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'plataforma': platform.platform(),
+            'base_datos': 'sqlite' if url is None else urlparse(url).scheme,
+            'repeticiones': repeticiones,
+            'filas_sembradas': sembrado,
+            'importacion': importacion,
+        },
+        'resultados': resultados
+    }
+
+def comparar_reportes(base, actual, tolerancia=0.25, piso_segundos=0.001):
+    """
+    Compara la mediana de cada etapa contra un reporte base.
+
+    Args:
+        base (dict): reporte anterior.
+        actual (dict): reporte actual.
+        tolerancia (float): aumento relativo permitido (0.25 = 25%).
+        piso_segundos (float): diferencias absolutas menores a este valor no se consideran regresion.
+
+    Returns:
+        list of dict: filas con la comparacion, marcadas con 'regresion'.
+    """
+    indice_base = {(r['tamano_dias'], r['grupo'], r['etapa']): r for r in base['resultados']}
+    comparacion = []
+    for r in actual['resultados']:
+        llave = (r['tamano_dias'], r['grupo'], r['etapa'])
+        anterior = indice_base.get(llave)
+        if anterior is None:
+            continue
+        ratio = r['mediana'] / anterior['mediana'] if anterior['mediana'] > 0 else float('inf')
+        comparacion.append({
+            'tamano_dias': r['tamano_dias'],
+            'grupo': r['grupo'],
+            'etapa': r['etapa'],
+            'base': anterior['mediana'],
+            'actual': r['mediana'],
+            'ratio': ratio,
+            'regresion': ratio > 1 + tolerancia and r['mediana'] - anterior['mediana'] > piso_segundos
+        })
+    return comparacion
+
+def imprimir_reporte(reporte, comparacion=None):
+    "imprime el reporte como tabla"
+    df = pd.DataFrame(reporte['resultados'])
+    df['mediana_ms'] = (df['mediana'] * 1000).round(3)
+    df['min_ms'] = (df['min'] * 1000).round(3)
+    print(df[['tamano_dias', 'grupo', 'etapa', 'filas', 'min_ms', 'mediana_ms']].to_string(index=False))
+
+    if comparacion:
+        df_comp = pd.DataFrame(comparacion)
+        df_comp['ratio'] = df_comp['ratio'].round(2)
+        print()
+        print(df_comp[['tamano_dias', 'grupo', 'etapa', 'ratio', 'regresion']].to_string(index=False))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Benchmark offline del pipeline de datos del dashboard')
+    parser.add_argument('--tamanos', nargs='+', type=int, default=[30, 365, 730], help='dias de historia sembrados')
+    parser.add_argument('--repeticiones', type=int, default=5)
+    parser.add_argument('--url', default=None, help='URL SQLAlchemy de una base de pruebas (se borra)')
+    parser.add_argument('--salida', default=None, help='archivo JSON del reporte')
+    parser.add_argument('--comparar', default=None, help='reporte JSON base para detectar regresiones')
+    parser.add_argument('--tolerancia', type=float, default=0.25)
+    parser.add_argument('--presupuesto-importacion', type=float, default=None,
+                        help='segundos maximos para importar los modulos de arranque')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # sqlite no tiene DECIMAL nativo; el aviso de SQLAlchemy no aplica a las mediciones
+    warnings.filterwarnings('ignore', message='Dialect sqlite')
+
+    import matplotlib
+    matplotlib.use('Agg')
+
+    reporte = ejecutar_benchmark(args.tamanos, args.repeticiones, args.url)
+
+    comparacion = None
+    if args.comparar:
+        with open(args.comparar, 'r') as file:
+            comparacion = comparar_reportes(json.load(file), reporte, args.tolerancia)
+
+    imprimir_reporte(reporte, comparacion)
+
+    if args.salida:
+        with open(args.salida, 'w') as file:
+            json.dump(reporte, file, indent=2)
+
+    importacion = reporte['meta']['importacion']
+    print()
+    print(f"Arranque: {importacion['segundos']:.3f}s; imports mas costosos: "
+          + ', '.join(f'{nombre} {segundos:.3f}s' for nombre, segundos in importacion['top'][:5]))
+
+    fallas = []
+    if importacion['diferidos_cargados']:
+        fallas.append(f"modulos diferidos cargados al arrancar: {importacion['diferidos_cargados']}")
+    if args.presupuesto_importacion is not None and importacion['segundos'] > args.presupuesto_importacion:
+        fallas.append(f"arranque {importacion['segundos']:.3f}s supera el presupuesto de {args.presupuesto_importacion}s")
+    if comparacion and any(c['regresion'] for c in comparacion):
+        fallas.append('regresiones respecto al reporte base')
+
+    for falla in fallas:
+        print(f'FALLA: {falla}')
+    if fallas:
+        sys.exit(1)
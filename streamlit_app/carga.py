@@ -0,0 +1,535 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Prueba de carga de sesiones concurrentes del dashboard. Levanta app.py con `streamlit run` en modo headless
+contra una base SQLite sembrada (benchmark.sembrar_base_datos) y el servidor stub de la API flask / coordinador.cl,
+y conecta N sesiones simuladas por el websocket de streamlit (/_stcore/stream). Cada sesion ejecuta una mezcla de
+acciones: recargas de la pagina, submits de Atributos, descargas y cambios del backtest. Los cambios de tab son del
+lado del navegador (st.tabs ejecuta todas las tabs en cada rerun), por lo que su costo esta incluido en cada rerun
+completo. Las acciones sobre widgets de un st.fragment envian su fragment_id, igual que el navegador, y solo
+re-ejecutan ese panel.
+
+Por cantidad de sesiones reporta la latencia p50 / p95 de los reruns (desde el envio del rerun hasta script_finished),
+las conexiones a la base de datos abiertas por el servidor y la memoria RSS del proceso y por sesion.
+
+Con --grabar / --reproducir el servidor graba su I/O o la sirve desde un archivo de grabacion.py.
+
+Uso:
+    python carga.py --sesiones 1 5 10 20 --acciones 20 --dias 90 --salida carga.json
+    python carga.py --sesiones 1 --acciones 10 --reproducir grabacion.pkl.gz --sin-latencia
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+
+import benchmark
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+RUTA_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+
+# peso relativo de cada accion de una sesion simulada
+ACCIONES = {'recarga': 4, 'atributos': 1, 'descarga': 2, 'backtest': 2}
+
+# etiquetas de los widgets que usan las acciones (ver app.py)
+ETIQUETA_DESCARGA = 'Seleccionar periodo CMg ponderados para descargar'
+ETIQUETA_PERIODO = 'Periodo'
+ETIQUETA_HIPOTETICOS = 'Usar parametros hipoteticos'
+ETIQUETA_SUBMIT = 'Submit'
+
+# ScriptFinishedStatus.FINISHED_EARLY_FOR_RERUN: la ejecucion fue reemplazada por otra (ej: st.rerun)
+FINALIZADO_POR_RERUN = 2
+
+TIEMPO_MAXIMO_RERUN = 120
+
+#########################################################################
+###################       Servidor streamlit      #######################
+#########################################################################
+
+SECRETS = """[AWS_MYSQL]
+DATABASE = "carga"
+HOST = "localhost"
+USER = "carga"
+USER_PASSWORD = "carga"
+PORT = 3306
+CONNECTION_STRING = "{connection_string}"
+
+[COORDINADOR]
+USER_KEY = "carga"
+
+[API]
+HOST = "{api_host}"
+PORT = {api_port}
+
+[ESPEJO]
+RUTA = ""
+"""
+
+def _puerto_libre():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class ServidorStreamlit:
+    """
+    Proceso `streamlit run app.py` headless. Los secrets apuntan a la base SQLite y al servidor stub; el cwd es un
+    directorio temporal con .streamlit/secrets.toml.
+    """
+    def __init__(self, ruta_db, servidor_stub, ruta_app=RUTA_APP, tiempo_arranque=60, env_extra=None):
+        self.ruta_db = ruta_db
+        self.ruta_app = ruta_app
+        self.tiempo_arranque = tiempo_arranque
+        self.port = _puerto_libre()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.directorio = tempfile.TemporaryDirectory(prefix='carga_')
+
+        os.makedirs(os.path.join(self.directorio.name, '.streamlit'))
+        with open(os.path.join(self.directorio.name, '.streamlit', 'secrets.toml'), 'w') as file:
+            file.write(SECRETS.format(connection_string=f'sqlite:///{ruta_db}', api_host=servidor_stub.host,
+                                      api_port=servidor_stub.port))
+
+        self.env = dict(os.environ, COORDINADOR_URL=f'http://{servidor_stub.host}:{servidor_stub.port}/costo-marginal/',
+                        PYTHONPATH=os.path.dirname(os.path.abspath(ruta_app)), **(env_extra or {}))
+        self.proceso = None
+
+    def __enter__(self):
+        comando = [sys.executable, '-m', 'streamlit', 'run', self.ruta_app, '--server.headless', 'true',
+                   '--server.port', str(self.port), '--server.fileWatcherType', 'none',
+                   '--browser.gatherUsageStats', 'false', '--logger.level', 'error']
+        self.proceso = subprocess.Popen(comando, cwd=self.directorio.name, env=self.env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        limite = time.monotonic() + self.tiempo_arranque
+        while time.monotonic() < limite:
+            if self.proceso.poll() is not None:
+                raise RuntimeError(f"streamlit exited: {self.proceso.stderr.read().decode(errors='replace')[-2000:]}")
+            try:
+                with urllib.request.urlopen(f'{self.url}/_stcore/health', timeout=1) as respuesta:
+                    if respuesta.status == 200:
+                        return self
+            except OSError:
+                time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError(f"streamlit did not start in {self.tiempo_arranque}s")
+
+    def __exit__(self, *exc):
+        if self.proceso is not None and self.proceso.poll() is None:
+            self.proceso.terminate()
+            try:
+                self.proceso.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.proceso.kill()
+        self.directorio.cleanup()
+
+    def rss_mb(self):
+        "memoria residente del proceso de streamlit (VmRSS de /proc)"
+        try:
+            with open(f'/proc/{self.proceso.pid}/status') as file:
+                for linea in file:
+                    if linea.startswith('VmRSS:'):
+                        return int(linea.split()[1]) / 1024
+        except OSError:
+            pass
+        return float('nan')
+
+    def conexiones_db(self):
+        "descriptores abiertos por el servidor hacia el archivo SQLite (una conexion por cada uno)"
+        directorio_fd = f'/proc/{self.proceso.pid}/fd'
+        total = 0
+        try:
+            for fd in os.listdir(directorio_fd):
+                try:
+                    if os.readlink(os.path.join(directorio_fd, fd)) == self.ruta_db:
+                        total += 1
+                except OSError:
+                    continue
+        except OSError:
+            pass
+        return total
+
+class MuestreoConexiones:
+    "muestrea servidor.conexiones_db() en un thread mientras corre un nivel de carga"
+    def __init__(self, servidor, intervalo=0.1):
+        self.servidor = servidor
+        self.intervalo = intervalo
+        self.muestras = []
+        self._detener = threading.Event()
+        self._thread = threading.Thread(target=self._muestrear, daemon=True)
+
+    def _muestrear(self):
+        while not self._detener.is_set():
+            self.muestras.append(self.servidor.conexiones_db())
+            self._detener.wait(self.intervalo)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        self._thread.join()
+
+#########################################################################
+###################        Sesion simulada        #######################
+#########################################################################
+
+class SesionSimulada:
+    """
+    Cliente minimo del protocolo de streamlit: envia BackMsg.rerun_script con el estado de los widgets y lee los
+    ForwardMsg hasta script_finished. Los widgets de cada ejecucion se registran por etiqueta para que las acciones
+    puedan cambiar su valor como lo haria el navegador.
+    """
+    def __init__(self, url, semilla=0, pausa=0.5):
+        self.url = url
+        self.rng = random.Random(semilla)
+        self.pausa = pausa
+        self.websocket = None
+        self.page_script_hash = ''
+        self.session_id = ''
+        self.widgets = {}        # (tipo, etiqueta) -> proto del elemento
+        self.fragmentos = {}     # (tipo, etiqueta) -> fragment_id del st.fragment que dibujo el widget ('' si no hay)
+        self.estados = {}        # id -> WidgetState enviado en cada rerun
+        self.latencias = []      # (accion, segundos)
+        self.errores = []
+
+    async def conectar(self):
+        from websockets.asyncio.client import connect
+        url_ws = self.url.replace('http://', 'ws://') + '/_stcore/stream'
+        self.websocket = await connect(url_ws, subprotocols=['streamlit'], max_size=None, open_timeout=30)
+
+    async def cerrar(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+
+    async def rerun(self, accion, disparadores=(), fragmento=''):
+        """
+        Ejecuta la pagina (o solo el fragmento, si se indica fragment_id) con el estado actual de los widgets mas los
+        disparadores (botones) de esta accion y registra la latencia hasta que la ultima ejecucion termina.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        mensaje = BackMsg()
+        mensaje.rerun_script.page_script_hash = self.page_script_hash
+        mensaje.rerun_script.fragment_id = fragmento
+        for estado in list(self.estados.values()) + list(disparadores):
+            mensaje.rerun_script.widget_states.widgets.append(estado)
+
+        inicio = time.perf_counter()
+        await self.websocket.send(mensaje.SerializeToString())
+
+        while True:
+            datos = await asyncio.wait_for(self.websocket.recv(), TIEMPO_MAXIMO_RERUN)
+            forward = ForwardMsg()
+            forward.ParseFromString(datos)
+            tipo = forward.WhichOneof('type')
+            if tipo == 'new_session':
+                self.page_script_hash = forward.new_session.page_script_hash
+                self.session_id = forward.new_session.initialize.session_id
+            elif tipo == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                self._registrar_elemento(forward.delta.new_element, forward.delta.fragment_id)
+            elif tipo == 'script_finished' and forward.script_finished != FINALIZADO_POR_RERUN:
+                break
+
+        self.latencias.append((accion, time.perf_counter() - inicio))
+
+    def _registrar_elemento(self, elemento, fragmento=''):
+        tipo = elemento.WhichOneof('type')
+        if tipo == 'exception':
+            self.errores.append(elemento.exception.message)
+        elif tipo == 'dataframe' and elemento.dataframe.id:
+            self.widgets[('data_editor', '')] = elemento.dataframe
+            self.fragmentos[('data_editor', '')] = fragmento
+        elif tipo in ('button', 'checkbox', 'date_input', 'download_button'):
+            widget = getattr(elemento, tipo)
+            self.widgets[(tipo, widget.label)] = widget
+            self.fragmentos[(tipo, widget.label)] = fragmento
+
+    def _estado(self, tipo, etiqueta):
+        "WidgetState persistente del widget (se envia en todos los reruns siguientes)"
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        widget = self.widgets[(tipo, etiqueta)]
+        estado = WidgetState(id=widget.id)
+        self.estados[widget.id] = estado
+        return estado
+
+    def _disparador(self, tipo, etiqueta):
+        "WidgetState de un boton, solo para el rerun siguiente"
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+        return WidgetState(id=self.widgets[(tipo, etiqueta)].id, trigger_value=True)
+
+    def _filas_editor(self):
+        "filas de la tabla de Atributos (una por central del registro que cargo el servidor)"
+        import pyarrow as pa
+        datos = self.widgets[('data_editor', '')].arrow_data.data
+        return pa.ipc.open_stream(datos).read_all().num_rows
+
+    ############# Acciones #############
+
+    async def recarga(self):
+        await self.rerun('recarga')
+
+    async def atributos(self):
+        "edita el Margen Garantia de una central en la tabla de Atributos y presiona Submit"
+        fila = self.rng.randrange(self._filas_editor())
+        cambios = {'edited_rows': {str(fila): {'Margen Garantia': round(self.rng.uniform(-30, -20), 2)}},
+                   'added_rows': [], 'deleted_rows': []}
+        self._estado('data_editor', '').string_value = json.dumps(cambios)
+        await self.rerun('atributos', [self._disparador('button', ETIQUETA_SUBMIT)], self.fragmentos[('button', ETIQUETA_SUBMIT)])
+        # el navegador limpia la tabla despues de un submit exitoso
+        del self.estados[self.widgets[('data_editor', '')].id]
+
+    async def descarga(self):
+        "elige una fecha de descarga y descarga los archivos de sus botones"
+        fecha = datetime.now().date() - timedelta(days=self.rng.randint(1, 30))
+        self._estado('date_input', ETIQUETA_DESCARGA).string_array_value.data[:] = [fecha.strftime('%Y/%m/%d')]
+        await self.rerun('descarga', fragmento=self.fragmentos[('date_input', ETIQUETA_DESCARGA)])
+
+        inicio = time.perf_counter()
+        botones = [widget for (tipo, _), widget in self.widgets.items() if tipo == 'download_button']
+        urls = [widget.url for widget in botones if widget.url]
+        urls += await self._resolver_diferidos([widget.deferred_file_id for widget in botones if widget.deferred_file_id])
+        await asyncio.gather(*[asyncio.to_thread(self._descargar, url) for url in urls])
+        self.latencias.append(('descarga_csv', time.perf_counter() - inicio))
+
+    async def _resolver_diferidos(self, file_ids):
+        """
+        URLs de los download_button con data diferida: como el navegador al hacer click, envia un
+        BackMsg.backend_operation_request por archivo y espera las respuestas.
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        pendientes = {}
+        for file_id in file_ids:
+            mensaje = BackMsg()
+            mensaje.backend_operation_request.session_id = self.session_id
+            mensaje.backend_operation_request.request_id = f'descarga-{len(pendientes)}-{file_id}'
+            mensaje.backend_operation_request.deferred_file.file_id = file_id
+            pendientes[mensaje.backend_operation_request.request_id] = file_id
+            await self.websocket.send(mensaje.SerializeToString())
+
+        urls = []
+        while pendientes:
+            forward = ForwardMsg()
+            forward.ParseFromString(await asyncio.wait_for(self.websocket.recv(), TIEMPO_MAXIMO_RERUN))
+            if forward.WhichOneof('type') != 'backend_operation_response':
+                continue
+            respuesta = forward.backend_operation_response
+            file_id = pendientes.pop(respuesta.request_id, None)
+            if file_id is None:
+                continue
+            if respuesta.error_msg:
+                self.errores.append(f'download {file_id}: {respuesta.error_msg}')
+            else:
+                urls.append(respuesta.deferred_file.url)
+        return urls
+
+    def _descargar(self, url):
+        try:
+            with urllib.request.urlopen(self.url + url, timeout=TIEMPO_MAXIMO_RERUN) as respuesta:
+                respuesta.read()
+        except OSError as exception:
+            self.errores.append(f'download {url}: {exception}')
+
+    async def backtest(self):
+        "cambia el periodo del backtest o alterna los parametros hipoteticos"
+        if self.rng.random() < 0.5:
+            widget = ('date_input', ETIQUETA_PERIODO)
+            fin = datetime.now().date()
+            inicio = fin - timedelta(days=self.rng.choice([7, 30, 90]))
+            self._estado('date_input', ETIQUETA_PERIODO).string_array_value.data[:] = [
+                inicio.strftime('%Y/%m/%d'), fin.strftime('%Y/%m/%d')]
+        else:
+            widget = ('checkbox', ETIQUETA_HIPOTETICOS)
+            estado = self._estado('checkbox', ETIQUETA_HIPOTETICOS)
+            estado.bool_value = not self.widgets[('checkbox', ETIQUETA_HIPOTETICOS)].value
+            self.widgets[('checkbox', ETIQUETA_HIPOTETICOS)].value = estado.bool_value
+        await self.rerun('backtest', fragmento=self.fragmentos[widget])
+
+    async def ejecutar(self, acciones):
+        """
+        Primera carga de la pagina y luego `acciones` acciones elegidas segun ACCIONES, con una pausa exponencial
+        de media self.pausa segundos entre ellas (tiempo de lectura del usuario).
+        """
+        await self.conectar()
+        try:
+            await self.rerun('carga_inicial')
+            nombres, pesos = list(ACCIONES), list(ACCIONES.values())
+            for _ in range(acciones):
+                await asyncio.sleep(self.rng.expovariate(1 / self.pausa) if self.pausa else 0)
+                accion = self.rng.choices(nombres, pesos)[0]
+                try:
+                    await getattr(self, accion)()
+                except KeyError as exception:
+                    self.errores.append(f'{accion}: widget not found {exception}')
+        except Exception as exception:
+            self.errores.append(f'{type(exception).__name__}: {exception}')
+        finally:
+            await self.cerrar()
+
+#########################################################################
+###################         Mediciones          #########################
+#########################################################################
+
+def _percentiles(tiempos):
+    if not tiempos:
+        return {'n': 0, 'p50_ms': None, 'p95_ms': None, 'max_ms': None}
+    tiempos = np.asarray(tiempos) * 1000
+    return {'n': len(tiempos), 'p50_ms': round(float(np.percentile(tiempos, 50)), 1),
+            'p95_ms': round(float(np.percentile(tiempos, 95)), 1), 'max_ms': round(float(tiempos.max()), 1)}
+
+async def _correr_sesiones(url, sesiones, acciones, pausa, semilla):
+    simuladas = [SesionSimulada(url, semilla=semilla + i, pausa=pausa) for i in range(sesiones)]
+    await asyncio.gather(*[sesion.ejecutar(acciones) for sesion in simuladas])
+    return simuladas
+
+def ejecutar_nivel(servidor, sesiones, acciones, pausa=0.5, semilla=0, rss_base=None):
+    """
+    Corre `sesiones` sesiones simuladas concurrentes contra el servidor.
+
+    Returns:
+        dict: latencias por accion (p50 / p95 / max en ms), errores, conexiones a la base de datos
+        (maximo y promedio muestreado) y memoria RSS del servidor al terminar y por sesion.
+    """
+    inicio = time.perf_counter()
+    with MuestreoConexiones(servidor) as muestreo:
+        simuladas = asyncio.run(_correr_sesiones(servidor.url, sesiones, acciones, pausa, semilla))
+        rss = servidor.rss_mb()
+    duracion = time.perf_counter() - inicio
+
+    latencias = [latencia for sesion in simuladas for latencia in sesion.latencias]
+    reruns = [segundos for accion, segundos in latencias if accion != 'descarga_csv']
+    por_accion = {accion: _percentiles([s for a, s in latencias if a == accion])
+                  for accion in sorted({a for a, _ in latencias})}
+    errores = [error for sesion in simuladas for error in sesion.errores]
+
+    return {
+        'sesiones': sesiones,
+        'duracion_s': round(duracion, 2),
+        'reruns': _percentiles(reruns),
+        'por_accion': por_accion,
+        'errores': len(errores),
+        'ejemplos_errores': sorted(set(errores))[:5],
+        'conexiones_db_max': max(muestreo.muestras, default=0),
+        'conexiones_db_promedio': round(float(np.mean(muestreo.muestras)), 2) if muestreo.muestras else 0.0,
+        'rss_mb': round(rss, 1),
+        'rss_por_sesion_mb': round((rss - rss_base) / sesiones, 2) if rss_base is not None else None
+    }
+
+def entorno_grabacion(grabar=None, reproducir=None, sin_latencia=False):
+    "variables de entorno de grabacion.py para el servidor de streamlit"
+    if grabar:
+        return {'GRABACION_MODO': 'grabar', 'GRABACION_RUTA': os.path.abspath(grabar)}
+    if reproducir:
+        return {'GRABACION_MODO': 'reproducir', 'GRABACION_RUTA': os.path.abspath(reproducir),
+                'GRABACION_LATENCIA': 'ninguna' if sin_latencia else 'original'}
+    return {}
+
+def ejecutar_carga(niveles, acciones=20, dias=90, pausa=0.5, semilla=0, env_extra=None):
+    """
+    Siembra la base SQLite, levanta el stub y el servidor de streamlit y corre cada nivel de sesiones concurrentes.
+    Antes de medir, una sesion de calentamiento llena los caches compartidos (st.cache_resource / st.cache_data).
+    env_extra (ej: entorno_grabacion) se agrega al entorno del servidor.
+
+    Returns:
+        dict: {'meta': ..., 'resultados': [una fila por nivel]}
+    """
+    with tempfile.TemporaryDirectory(prefix='carga_db_') as directorio, benchmark.ServidorStub() as stub:
+        ruta_db = os.path.join(directorio, 'carga.db')
+        engine = create_engine(f'sqlite:///{ruta_db}')
+        fin_unix = int(time.time()) // 3600 * 3600
+        filas = benchmark.sembrar_base_datos(engine, dias, fin_unix=fin_unix, semilla=semilla)
+        engine.dispose()
+
+        with ServidorStreamlit(ruta_db, stub, env_extra=env_extra) as servidor:
+            rss_inicial = servidor.rss_mb()
+            calentamiento = ejecutar_nivel(servidor, 1, 0, pausa=0, semilla=semilla)
+            rss_base = servidor.rss_mb()
+            logging.info(f"warm-up rerun {calentamiento['reruns']['p50_ms']} ms, RSS {rss_base:.1f} MB")
+
+            resultados = []
+            for sesiones in niveles:
+                resultado = ejecutar_nivel(servidor, sesiones, acciones, pausa=pausa, semilla=semilla, rss_base=rss_base)
+                logging.info(f"{sesiones} sessions: p95 rerun {resultado['reruns']['p95_ms']} ms, {resultado['errores']} errors")
+                resultados.append(resultado)
+
+    return {
+        'meta': {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'dias': dias,
+            'filas': filas,
+            'acciones_por_sesion': acciones,
+            'pausa_media_s': pausa,
+            'mezcla_acciones': ACCIONES,
+            'rss_inicial_mb': round(rss_inicial, 1),
+            'rss_base_mb': round(rss_base, 1),
+            'calentamiento': calentamiento['reruns']
+        },
+        'resultados': resultados
+    }
+
+def imprimir_reporte(reporte):
+    "imprime el reporte como tabla"
+    filas = [{'sesiones': r['sesiones'], 'reruns': r['reruns']['n'], 'p50_ms': r['reruns']['p50_ms'],
+              'p95_ms': r['reruns']['p95_ms'], 'max_ms': r['reruns']['max_ms'], 'errores': r['errores'],
+              'conexiones_db_max': r['conexiones_db_max'], 'conexiones_db_prom': r['conexiones_db_promedio'],
+              'rss_mb': r['rss_mb'], 'rss_por_sesion_mb': r['rss_por_sesion_mb']}
+             for r in reporte['resultados']]
+    print(pd.DataFrame(filas).to_string(index=False))
+
+    acciones = [{'sesiones': r['sesiones'], 'accion': accion, **valores}
+                for r in reporte['resultados'] for accion, valores in r['por_accion'].items()]
+    if acciones:
+        print()
+        print(pd.DataFrame(acciones).to_string(index=False))
+
+    for r in reporte['resultados']:
+        for error in r['ejemplos_errores']:
+            print(f"ERROR ({r['sesiones']} sesiones): {error}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Prueba de carga de sesiones concurrentes del dashboard')
+    parser.add_argument('--sesiones', nargs='+', type=int, default=[1, 5, 10, 20], help='sesiones concurrentes por nivel')
+    parser.add_argument('--acciones', type=int, default=20, help='acciones por sesion')
+    parser.add_argument('--dias', type=int, default=90, help='dias de historia sembrados')
+    parser.add_argument('--pausa', type=float, default=0.5, help='segundos promedio entre acciones de una sesion')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--salida', default=None, help='archivo JSON del reporte')
+    parser.add_argument('--grabar', default=None, help='graba la I/O del servidor en este archivo (grabacion.py)')
+    parser.add_argument('--reproducir', default=None, help='sirve la I/O del servidor desde este archivo (grabacion.py)')
+    parser.add_argument('--sin-latencia', action='store_true', help='al reproducir, sin la latencia original')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    reporte = ejecutar_carga(args.sesiones, args.acciones, args.dias, args.pausa, args.semilla,
+                             env_extra=entorno_grabacion(args.grabar, args.reproducir, args.sin_latencia))
+    imprimir_reporte(reporte)
+
+    if args.salida:
+        with open(args.salida, 'w') as file:
+            json.dump(reporte, file, indent=2)
+
+    if any(r['errores'] for r in reporte['resultados']):
+        sys.exit(1)
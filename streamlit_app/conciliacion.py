@@ -0,0 +1,296 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Conciliacion horaria de costos marginales. Alinea en un indice horario comun (central x hora) el CMg online
+del coordinador.cl, el CMg programado de la API flask y el cmg_ponderado calculado, para un rango de fechas arbitrario,
+y calcula de forma vectorizada el sesgo (error medio), MAE, RMSE y error maximo de cada par de fuentes por central.
+
+Las fuentes externas se consultan por dia (en paralelo) y se guardan en CacheDias: los dias cerrados no cambian, por lo
+que una comparacion de un mes solo consulta los dias que faltan.
+"""
+
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import api
+from instrumentation import propagar, trazar
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+ZONA_HORARIA = 'America/Santiago'
+
+FUENTES = ('cmg_online', 'cmg_programado', 'cmg_ponderado')
+
+# (fuente, referencia): error = fuente - referencia
+PARES = (('cmg_ponderado', 'cmg_online'), ('cmg_programado', 'cmg_online'), ('cmg_ponderado', 'cmg_programado'))
+
+COLUMNAS_RESUMEN = ['central', 'fuente', 'referencia', 'horas', 'sesgo', 'mae', 'rmse', 'error_max']
+
+# consultas simultaneas a cada API externa
+MAX_CONSULTAS = 8
+
+#########################################################################
+##############                Classes                 ###################
+#########################################################################
+
+class CacheDias:
+    """
+    Cache en memoria de respuestas diarias de las APIs externas, por (fuente, fecha); la fuente incluye las barras o
+    centrales consultadas. Los dias anteriores a hoy (hora de Chile) no expiran; el dia en curso expira despues de
+    `ttl` segundos porque sigue recibiendo horas nuevas. Las respuestas vacias o con error no se guardan.
+    """
+    def __init__(self, ttl=300, max_dias=2000):
+        self.ttl = ttl
+        self.max_dias = max_dias
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, fuente, fecha):
+        "respuesta guardada, o None si no existe o expiro"
+        with self._lock:
+            entrada = self._datos.get((fuente, fecha))
+        if entrada is None:
+            return None
+        valor, instante = entrada
+        if fecha >= hoy() and time.monotonic() - instante > self.ttl:
+            return None
+        return valor
+
+    def guardar(self, fuente, fecha, valor):
+        with self._lock:
+            if len(self._datos) >= self.max_dias:
+                # se descarta la entrada mas antigua
+                self._datos.pop(min(self._datos, key=lambda llave: self._datos[llave][1]))
+            self._datos[(fuente, fecha)] = (valor, time.monotonic())
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def hoy():
+    "fecha de hoy en Chile (YYYY-MM-DD)"
+    return pd.Timestamp.now(tz=ZONA_HORARIA).strftime('%Y-%m-%d')
+
+def fechas_rango(fecha_inicio, fecha_fin):
+    "lista de fechas YYYY-MM-DD entre fecha_inicio y fecha_fin (inclusive)"
+    return [fecha.strftime('%Y-%m-%d') for fecha in pd.date_range(fecha_inicio, fecha_fin, freq='D')]
+
+def unix_hora_local(fechas):
+    """
+    Convierte timestamps de hora de Chile ('YYYY-MM-DD HH:MM[:SS]') a unix_time de forma vectorizada, con las mismas
+    convenciones de cambio de horario que despacho.unix_fecha_registro.
+    """
+    fechas = pd.to_datetime(pd.Series(fechas, dtype=object), format='mixed')
+    fechas = fechas.dt.tz_localize(ZONA_HORARIA, ambiguous=np.zeros(len(fechas), dtype=bool), nonexistent='shift_forward')
+    return (fechas.dt.tz_convert('UTC').dt.tz_localize(None) - pd.Timestamp('1970-01-01')).dt.total_seconds().to_numpy(dtype=np.int64)
+
+def _fuente_online(centrales):
+    "llave de CacheDias del CMg online de las centrales"
+    return ('online', tuple(sorted(central['barra_online'] for central in centrales)))
+
+def _fuente_programado(centrales):
+    "llave de CacheDias del CMg programado de las centrales"
+    return ('programado', tuple(sorted(central['nombre_api'] for central in centrales)))
+
+def _consultar_dias(cache, fuente, fechas, consultar):
+    """
+    Respuestas por fecha desde la cache; las fechas faltantes se consultan en paralelo con consultar(fecha).
+
+    Returns:
+        dict: fecha -> respuesta (las consultas vacias o con error quedan como None).
+    """
+    respuestas = {fecha: cache.obtener(fuente, fecha) for fecha in fechas}
+    faltantes = [fecha for fecha, respuesta in respuestas.items() if respuesta is None]
+    if faltantes:
+        with ThreadPoolExecutor(max_workers=min(MAX_CONSULTAS, len(faltantes))) as executor:
+            for fecha, respuesta in zip(faltantes, executor.map(propagar(consultar), faltantes)):
+                respuestas[fecha] = respuesta
+                if respuesta:
+                    cache.guardar(fuente, fecha, respuesta)
+    return respuestas
+
+@trazar('http')
+def cargar_online(cache, centrales, fechas, user_key):
+    """
+    CMg online del coordinador.cl de las barras de las centrales, un request por dia.
+
+    Returns:
+        pd.DataFrame: columnas central, unix_time y cmg_online.
+    """
+    barras = [central['barra_online'] for central in centrales]
+    central_por_barra = {central['barra_online']: central['nombre'] for central in centrales}
+
+    def consultar(fecha):
+        return api.get_json_costo_marginal_online(fecha, fecha, barras, user_key)
+
+    respuestas = _consultar_dias(cache, _fuente_online(centrales), fechas, consultar)
+    filas = [fila for respuesta in respuestas.values() if respuesta for fila in respuesta if fila['barra'] in central_por_barra]
+    if not filas:
+        return pd.DataFrame(columns=['central', 'unix_time', 'cmg_online'])
+
+    df = pd.DataFrame(filas)
+    # el request de un dia puede traer horas de otro dia: se dejan solo las fechas pedidas
+    df = df[df['fecha'].str[:10].isin(set(fechas))]
+    return pd.DataFrame({'central': df['barra'].map(central_por_barra).to_numpy(),
+                         'unix_time': unix_hora_local(df['fecha']),
+                         'cmg_online': pd.to_numeric(df['cmg'], errors='coerce').to_numpy(dtype=np.float64)})
+
+@trazar('http')
+def cargar_programado(cache, centrales, fechas, host, port):
+    """
+    CMg programado de la API flask, un request por central y dia (las centrales de un dia en paralelo).
+
+    Returns:
+        pd.DataFrame: columnas central, unix_time y cmg_programado.
+    """
+    nombres_api = {central['nombre_api']: central['nombre'] for central in centrales}
+
+    def consultar(fecha):
+        respuestas = api.get_cmg_programados_centrales(list(nombres_api), date_in=fecha, host=host, port=port)
+        # un dia con alguna central fallida no se guarda en la cache
+        if any(not isinstance(respuesta, dict) or 'error' in respuesta for respuesta in respuestas.values()):
+            logging.error(f"cmg_programados incomplete for {fecha}")
+            return None
+        return respuestas
+
+    respuestas = _consultar_dias(cache, _fuente_programado(centrales), fechas, consultar)
+    centrales_col, fechas_col, valores = [], [], []
+    for fecha, por_central in respuestas.items():
+        for nombre_api, horas in (por_central or {}).items():
+            if nombre_api not in nombres_api:
+                continue
+            for hora, valor in horas.items():
+                centrales_col.append(nombres_api[nombre_api])
+                fechas_col.append(f'{fecha} {hora}')
+                valores.append(valor)
+
+    if not valores:
+        return pd.DataFrame(columns=['central', 'unix_time', 'cmg_programado'])
+    return pd.DataFrame({'central': centrales_col, 'unix_time': unix_hora_local(fechas_col),
+                         'cmg_programado': pd.to_numeric(pd.Series(valores), errors='coerce').to_numpy(dtype=np.float64)})
+
+def serie_ponderado(cmg_ponderado, centrales):
+    """
+    Args:
+        cmg_ponderado (dict): salida de query_cmg_ponderado_rango.
+        centrales (list of dict): centrales del registro.
+
+    Returns:
+        pd.DataFrame: columnas central, unix_time y cmg_ponderado.
+    """
+    central_por_barra = {central['barra_transmision']: central['nombre'] for central in centrales}
+    df = pd.DataFrame({'barra_transmision': cmg_ponderado['barra_transmision'], 'unix_time': cmg_ponderado['unix_time'],
+                       'cmg_ponderado': cmg_ponderado['cmg']})
+    df = df[df['barra_transmision'].isin(central_por_barra)]
+    return pd.DataFrame({'central': df['barra_transmision'].map(central_por_barra).to_numpy(),
+                         'unix_time': df['unix_time'].to_numpy(dtype=np.int64),
+                         'cmg_ponderado': df['cmg_ponderado'].to_numpy(dtype=np.float64)})
+
+@trazar('pandas')
+def alinear(series, nombres_centrales, unix_inicio, unix_fin):
+    """
+    Alinea las series en un indice horario comun central x hora entre unix_inicio y unix_fin. Los unix_time se
+    truncan a la hora; si una fuente tiene varios valores en la misma hora se usa el ultimo.
+
+    Args:
+        series (dict): fuente -> DataFrame (central, unix_time, <fuente>).
+        nombres_centrales (list of str): centrales del indice.
+        unix_inicio, unix_fin (int): rango del indice.
+
+    Returns:
+        pd.DataFrame: columnas central, unix_time y una columna por fuente de FUENTES (NaN si no hay dato).
+    """
+    horas = np.arange(unix_inicio - unix_inicio % 3600, unix_fin + 1, 3600, dtype=np.int64)
+    indice = pd.MultiIndex.from_product([list(nombres_centrales), horas], names=['central', 'unix_time'])
+
+    columnas = {}
+    for fuente in FUENTES:
+        df = series.get(fuente)
+        if df is None or df.empty:
+            columnas[fuente] = np.full(len(indice), np.nan)
+            continue
+        hora = df['unix_time'].to_numpy(dtype=np.int64)
+        serie = pd.Series(df[fuente].to_numpy(dtype=np.float64),
+                          index=pd.MultiIndex.from_arrays([df['central'].to_numpy(), hora - hora % 3600], names=['central', 'unix_time']))
+        serie = serie[~serie.index.duplicated(keep='last')]
+        columnas[fuente] = serie.reindex(indice).to_numpy()
+
+    return pd.DataFrame({'central': indice.get_level_values('central'), 'unix_time': indice.get_level_values('unix_time'), **columnas})
+
+def resumir(alineado):
+    """
+    Errores por central y par de fuentes (PARES), sobre las horas en que ambas fuentes tienen dato.
+
+    Returns:
+        pd.DataFrame: columnas COLUMNAS_RESUMEN. sesgo = media de (fuente - referencia).
+    """
+    filas = []
+    for fuente, referencia in PARES:
+        error = alineado[fuente] - alineado[referencia]
+        agrupado = pd.DataFrame({'central': alineado['central'], 'error': error, 'abs': error.abs(), 'cuadrado': error ** 2}).groupby('central', sort=False)
+        metricas = agrupado.agg(horas=('error', 'count'), sesgo=('error', 'mean'), mae=('abs', 'mean'),
+                                mse=('cuadrado', 'mean'), error_max=('abs', 'max'))
+        metricas['rmse'] = np.sqrt(metricas['mse'])
+        metricas['fuente'] = fuente
+        metricas['referencia'] = referencia
+        filas.append(metricas.reset_index())
+
+    return pd.concat(filas, ignore_index=True)[COLUMNAS_RESUMEN]
+
+def conciliar(centrales, fecha_inicio, fecha_fin, cmg_ponderado, cache, user_key, host, port):
+    """
+    Conciliacion horaria de las tres fuentes para un rango de fechas (hora de Chile).
+
+    Args:
+        centrales (list of dict): centrales del registro a conciliar.
+        fecha_inicio, fecha_fin (str): fechas YYYY-MM-DD (inclusive).
+        cmg_ponderado (dict): salida de query_cmg_ponderado_rango para las barras de las centrales y el rango
+            fechas_unix(fecha_inicio, fecha_fin).
+        cache (CacheDias): cache de las respuestas de las APIs externas.
+        user_key (str): user_key del coordinador.cl.
+        host, port: API flask.
+
+    Returns:
+        tuple: (alineado, resumen). alineado tiene una fila por central y hora con las tres fuentes; resumen las
+        metricas de error de resumir.
+    """
+    fechas = fechas_rango(fecha_inicio, fecha_fin)
+    unix_inicio, unix_fin = fechas_unix(fecha_inicio, fecha_fin)
+
+    # las dos APIs externas en paralelo
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        online = executor.submit(propagar(cargar_online), cache, centrales, fechas, user_key)
+        programado = executor.submit(propagar(cargar_programado), cache, centrales, fechas, host, port)
+        series = {'cmg_online': online.result(), 'cmg_programado': programado.result(),
+                  'cmg_ponderado': serie_ponderado(cmg_ponderado, centrales)}
+
+    alineado = alinear(series, [central['nombre'] for central in centrales], unix_inicio, unix_fin)
+    return alineado, resumir(alineado)
+
+def dias_pendientes(cache, centrales, fecha_inicio, fecha_fin):
+    """
+    Fechas del rango sin respuesta vigente en la cache para alguna de las APIs externas: dias que fallaron o volvieron
+    vacios en la ultima conciliacion, o el dia en curso ya expirado.
+
+    Returns:
+        list: fechas YYYY-MM-DD pendientes (vacia si la conciliacion esta completa).
+    """
+    fuentes = (_fuente_online(centrales), _fuente_programado(centrales))
+    return [fecha for fecha in fechas_rango(fecha_inicio, fecha_fin)
+            if any(cache.obtener(fuente, fecha) is None for fuente in fuentes)]
+
+def fechas_unix(fecha_inicio, fecha_fin):
+    "unix_time de la primera y la ultima hora del rango de fechas (hora de Chile)"
+    inicio, fin = unix_hora_local([f'{fecha_inicio} 00:00:00', f'{fecha_fin} 23:00:00'])
+    return int(inicio), int(fin)
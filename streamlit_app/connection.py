@@ -6,22 +6,29 @@ Description: Script para establecer conexion con base de datos MySQL
 
 # general modules
 import os
+import time
+import queue
+import logging
+import threading
 import numpy as np
 import pandas as pd
-import logging
-from datetime import timedelta
 
-# mysql
-import mysql.connector
-from mysql.connector import Error
+# El driver mysql.connector lo carga SQLAlchemy al crear el engine (mysql+mysqlconnector)
 
 # sqlalchemy
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Table, select, MetaData, desc, asc
+from sqlalchemy import Table, select, MetaData, desc, asc, func
 from sqlalchemy import Column, Integer, String, Boolean, Text, DECIMAL
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.exc import OperationalError, InterfaceError, DisconnectionError, TimeoutError as PoolTimeoutError
+
+# instrumentacion
+from instrumentation import medir, instrumentar_engine, span, REGISTRO, BUCKETS_FILAS
+import despacho
 
 #########################################################################
 ###################           Settings         ##########################
@@ -31,6 +38,68 @@ from sqlalchemy.orm.exc import NoResultFound
 # log_dir = os.path.join(parent_dir, 'log')
 # connection_path = os.path.join(log_dir, 'connection.log')
 
+# Las columnas DECIMAL de los modelos se declaran con asdecimal=False: el esquema en MySQL no cambia, pero SQLAlchemy
+# entrega float en vez de Decimal, por lo que las consultas no convierten fila a fila.
+
+# Archivo Parquet de los meses cerrados de cmg_tiempo_real y cmg_ponderado (archivo.ArchivoParquet), ver configurar_archivo
+ARCHIVO_CMG = None
+
+# Argumento de connect_args con el timeout de conexion de cada driver (establecer_engine). Con otros drivers no se
+# envia: cada DBAPI rechaza los argumentos que no conoce.
+ARGUMENTO_TIMEOUT_DRIVER = {
+    'mysql+mysqlconnector': 'connection_timeout',
+    'mysql+pymysql': 'connect_timeout',
+    'mysql+mysqldb': 'connect_timeout',
+    'mysql': 'connect_timeout',
+    'postgresql+psycopg2': 'connect_timeout',
+    'postgresql+psycopg': 'connect_timeout',
+    'postgresql': 'connect_timeout',
+}
+
+# Tipos de los DataFrames que entrega el data layer, por tabla (ver aplicar_esquema). Nombres de barra / central como
+# category (pocos valores repetidos en todas las filas), timestamps de texto como datetime64 (FORMATO_FECHA, hora de
+# Chile sin zona) y 'hora' de cmg_tiempo_real como segundos desde medianoche. Tasas y factores van en float32; cmg,
+# costos y precios quedan en float64 porque se exportan y se comparan con 3-4 decimales.
+FORMATO_FECHA = '%d.%m.%y %H:%M:%S'
+ESQUEMAS = {
+    'central': {
+        'id': 'int32',
+        'nombre': 'category',
+        'generando': 'bool',
+        'tasa_proveedor': 'float32',
+        'porcentaje_brent': 'float32',
+        'tasa_central': 'float32',
+        'precio_brent': 'float64',
+        # el formato de fecha_referencia_brent depende de la fuente del precio: se deja como texto
+        'fecha_referencia_brent': 'object',
+        'costo_operacional': 'float64',
+        'fecha_registro': 'datetime64',
+        'margen_garantia': 'float32',
+        'factor_motor': 'float32',
+        'external_update': 'bool',
+        'editor': 'category',
+    },
+    'cmg_ponderado': {
+        'id': 'int32',
+        'barra_transmision': 'category',
+        'timestamp': 'datetime64',
+        'unix_time': 'int64',
+        'cmg_ponderado': 'float64',
+    },
+    'cmg_tiempo_real': {
+        'id_tracking': 'int32',
+        'barra_transmision': 'category',
+        'año': 'int16',
+        'mes': 'int8',
+        'dia': 'int8',
+        'hora': 'segundos_dia',
+        'unix_time': 'int64',
+        'desacople_bool': 'bool',
+        'cmg': 'float64',
+        'central_referencia': 'category',
+    },
+}
+
 #########################################################################
 ##############                Classes                 ###################
 #########################################################################
@@ -71,6 +140,7 @@ class CmgTiempoReal(Base):
         unix_time (int): Representa el tiempo unix.
         desacople_bool (bool): Un valor booleano para el desacople.
         cmg (DECIMAL(7,3)): Representa el valor cmg con precisión decimal de 7 dígitos en total, de los cuales 3 son decimales.
+            Se lee como float (asdecimal=False), igual que todas las columnas DECIMAL de los modelos.
         central_referencia (str): Referencia de la central. En MySQL se utiliza 'text' que puede representarse como Text en SQLAlchemy.
     """
     __tablename__ = 'cmg_tiempo_real'
@@ -85,7 +155,7 @@ class CmgTiempoReal(Base):
     hora = Column(String(255))
     unix_time = Column(Integer)
     desacople_bool = Column(Boolean)
-    cmg = Column(DECIMAL(7, 3))
+    cmg = Column(DECIMAL(7, 3, asdecimal=False))
     central_referencia = Column(Text)
 
     def as_list(self):
@@ -104,7 +174,7 @@ class CmgPonderado(Base):
     # tinytext puede ser representado como un String
     timestamp = Column(String(255))
     unix_time = Column(Integer)
-    cmg_ponderado = Column(DECIMAL(7, 4))
+    cmg_ponderado = Column(DECIMAL(7, 4, asdecimal=False))
 
     def as_list(self):
         "return a list representation of the object"
@@ -119,15 +189,15 @@ class CentralTable(Base):
     id = Column(Integer, primary_key=True)
     nombre = Column(String(255))
     generando = Column(Boolean)
-    tasa_proveedor = Column(DECIMAL(7, 4))
-    porcentaje_brent = Column(DECIMAL(7, 4))
-    tasa_central = Column(DECIMAL(7, 4))
-    precio_brent = Column(DECIMAL(7, 3))
+    tasa_proveedor = Column(DECIMAL(7, 4, asdecimal=False))
+    porcentaje_brent = Column(DECIMAL(7, 4, asdecimal=False))
+    tasa_central = Column(DECIMAL(7, 4, asdecimal=False))
+    precio_brent = Column(DECIMAL(7, 3, asdecimal=False))
     fecha_referencia_brent = Column(Text)
-    costo_operacional = Column(DECIMAL(7, 3))
+    costo_operacional = Column(DECIMAL(7, 3, asdecimal=False))
     fecha_registro = Column(Text)
-    margen_garantia = Column(DECIMAL(7, 3), nullable=False)
-    factor_motor = Column(DECIMAL(7, 3), nullable=False)
+    margen_garantia = Column(DECIMAL(7, 3, asdecimal=False), nullable=False)
+    factor_motor = Column(DECIMAL(7, 3, asdecimal=False), nullable=False)
     external_update = Column(Boolean, default=False)
     editor = Column(String(60), nullable=True, default=None)
 
@@ -142,7 +212,7 @@ class CentralTable(Base):
 ###################           functions         #########################
 #########################################################################
 
-def establecer_engine(database_in, user_in, password_in, host_in, port_in, verbose=False, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800):
+def establecer_engine(database_in, user_in, password_in, host_in, port_in, verbose=False, pool_size=5, max_overflow=10, pool_timeout=30, pool_recycle=1800, read_only=False, connection_string_in=None, connect_timeout=5, umbral_fallos=3, enfriamiento=30):
     """
     Establecer un motor de SQLAlchemy para conectarse a la base de datos de MySQL.
 
@@ -157,20 +227,51 @@ def establecer_engine(database_in, user_in, password_in, host_in, port_in, verbo
         max_overflow: The number of connections to allow in connection pool overflow. Default is 10.
         pool_timeout: Specifies the connection timeout in seconds for the pool. Default is 30.
         pool_recycle: Specifies the maximum number of seconds between connections to the pool. Default is 1800.
+        read_only: si es True, cada conexion del pool queda en modo solo lectura. Por defecto es False.
+        connection_string_in: URL de SQLAlchemy que reemplaza a la de MySQL (ej: sqlite para pruebas locales).
+        connect_timeout: segundos maximos para abrir una conexion nueva, con el argumento propio del driver
+            (ARGUMENTO_TIMEOUT_DRIVER); con drivers que no estan en la tabla no se aplica. Por defecto es 5.
+        umbral_fallos, enfriamiento: parametros del CircuitBreaker del engine (engine.circuit_breaker).
     Returns:
         engine: objeto de conexion a la base de datos
         metadata: objeto de metadata para la base de datos
     """
     try:
-        connection_string = f"mysql+mysqlconnector://{user_in}:{password_in}@{host_in}:{port_in}/{database_in}"
+        connection_string = connection_string_in or f"mysql+mysqlconnector://{user_in}:{password_in}@{host_in}:{port_in}/{database_in}"
         #connection_string = f'mysql://{user_in}:{password_in}@{host_in}:{port_in}/{database_in}'
 
-        engine = create_engine(
-            connection_string,
-            pool_size=pool_size,
-            max_overflow=max_overflow,
-            pool_timeout=pool_timeout,
-            pool_recycle=pool_recycle)
+        # pool_pre_ping descarta conexiones muertas del pool antes de entregarlas
+        if connection_string.startswith('sqlite') and make_url(connection_string).database in (None, '', ':memory:'):
+            # sqlite en memoria: una sola conexion por thread, los parametros del pool no aplican
+            engine = create_engine(connection_string, pool_pre_ping=True)
+        elif connection_string.startswith('sqlite'):
+            # sqlite en archivo (pruebas locales, carga.py): QueuePool con los mismos parametros que MySQL, para que
+            # las conexiones abiertas y la espera del pool se comporten como en produccion
+            engine = create_engine(
+                connection_string,
+                poolclass=QueuePool,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=pool_timeout,
+                pool_recycle=pool_recycle,
+                pool_pre_ping=True,
+                connect_args={'check_same_thread': False})
+        else:
+            argumento_timeout = ARGUMENTO_TIMEOUT_DRIVER.get(make_url(connection_string).drivername)
+            engine = create_engine(
+                connection_string,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_timeout=pool_timeout,
+                pool_recycle=pool_recycle,
+                pool_pre_ping=True,
+                connect_args={argumento_timeout: connect_timeout} if argumento_timeout else {})
+
+        if read_only:
+            _configurar_solo_lectura(engine)
+
+        instrumentar_engine(engine, 'lectura' if read_only else 'primario')
+        instalar_circuit_breaker(engine, CircuitBreaker(umbral_fallos=umbral_fallos, enfriamiento=enfriamiento))
 
         metadata_out = MetaData(bind=engine)
 
@@ -185,6 +286,112 @@ def establecer_engine(database_in, user_in, password_in, host_in, port_in, verbo
                 print("Coul not connect to MySQL DB successful")
             return None, None
 
+class CircuitoAbierto(DisconnectionError):
+    "la base de datos se considera caida: se rechaza la conexion sin intentarla"
+
+class CircuitBreaker:
+    """
+    Circuit breaker de conexiones a la base de datos.
+
+    cerrado: las conexiones pasan. Tras `umbral_fallos` fallos consecutivos de conexion pasa a abierto.
+    abierto: toda conexion se rechaza de inmediato con CircuitoAbierto durante `enfriamiento` segundos.
+    semi_abierto: terminado el enfriamiento se deja pasar una sola conexion de prueba; si funciona el circuito se
+    cierra, si falla vuelve a abrirse por otro enfriamiento.
+    """
+    def __init__(self, umbral_fallos=3, enfriamiento=30):
+        self.umbral_fallos = umbral_fallos
+        self.enfriamiento = enfriamiento
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._abierto_desde = None
+        self._prueba_en_curso = False
+        self.ultimo_error = None
+        self.ultimo_exito = None
+
+    def permitir(self):
+        "True si se puede intentar una conexion"
+        with self._lock:
+            if self._abierto_desde is None:
+                return True
+            if time.monotonic() - self._abierto_desde < self.enfriamiento or self._prueba_en_curso:
+                return False
+            self._prueba_en_curso = True
+            return True
+
+    def registrar_exito(self):
+        with self._lock:
+            self._fallos = 0
+            self._abierto_desde = None
+            self._prueba_en_curso = False
+            self.ultimo_exito = time.time()
+
+    def registrar_fallo(self, exception):
+        with self._lock:
+            self._fallos += 1
+            self.ultimo_error = str(exception)
+            if self._prueba_en_curso or self._fallos >= self.umbral_fallos:
+                if self._abierto_desde is None:
+                    logging.error(f"Database circuit opened after {self._fallos} failures: {exception}")
+                self._abierto_desde = time.monotonic()
+            self._prueba_en_curso = False
+
+    def estado(self):
+        "cerrado, abierto o semi_abierto"
+        with self._lock:
+            if self._abierto_desde is None:
+                return 'cerrado'
+            if time.monotonic() - self._abierto_desde < self.enfriamiento:
+                return 'abierto'
+            return 'semi_abierto'
+
+    def resumen(self):
+        "estado, fallos consecutivos, ultimo error y ultimo exito (unix time)"
+        estado = self.estado()
+        with self._lock:
+            return {'estado': estado, 'fallos': self._fallos, 'ultimo_error': self.ultimo_error, 'ultimo_exito': self.ultimo_exito}
+
+def instalar_circuit_breaker(engine_in, breaker):
+    """
+    Conecta el breaker al engine: el checkout del pool se rechaza mientras el circuito esta abierto, los fallos al
+    conectar (incluido el pre-ping) y las desconexiones durante una sentencia cuentan como fallo, y cada conexion
+    obtenida cuenta como exito.
+    """
+    engine_in.circuit_breaker = breaker
+    pool = engine_in.pool
+    connect_original = pool.connect
+
+    def connect_protegido(*args, **kwargs):
+        if not breaker.permitir():
+            raise CircuitoAbierto(f"Database unavailable, retrying in at most {breaker.enfriamiento}s: {breaker.ultimo_error}")
+        try:
+            conexion = connect_original(*args, **kwargs)
+        except Exception as exception:
+            breaker.registrar_fallo(exception)
+            raise
+        breaker.registrar_exito()
+        return conexion
+
+    pool.connect = connect_protegido
+
+    # los fallos al conectar ya se registran en connect_protegido; aqui solo las desconexiones de conexiones abiertas
+    @event.listens_for(engine_in, "handle_error")
+    def registrar_desconexion(exception_context):
+        if exception_context.is_disconnect and exception_context.connection is not None:
+            breaker.registrar_fallo(exception_context.original_exception)
+
+def _configurar_solo_lectura(engine_in):
+    "deja cada nueva conexion del engine en modo solo lectura"
+    if engine_in.dialect.name == 'sqlite':
+        sentencia = "PRAGMA query_only = ON"
+    else:
+        sentencia = "SET SESSION TRANSACTION READ ONLY"
+
+    @event.listens_for(engine_in, "connect")
+    def set_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(sentencia)
+        cursor.close()
+
 def establecer_session(engine_in):
     """
     Crea y retorna una nueva sesión de SQLAlchemy.
@@ -198,6 +405,420 @@ def establecer_session(engine_in):
     session_in = sessionmaker(bind=engine_in)
     return session_in()
 
+class EngineRouter:
+    """
+    Enruta las sesiones entre un engine primario (escrituras) y un engine de solo lectura opcional (réplica).
+
+    Las funciones query_*, get_* y evaluar_* se ejecutan contra el engine de lectura; insert_*, bulk_upsert_* y
+    las subrutinas del scheduler contra el primario. Si no hay engine de lectura, todo va al primario.
+
+    Con un espejo analitico conectado (ver espejo.py), las lecturas por rango de unix_time de cmg_tiempo_real y
+    cmg_ponderado (ejecutar_rango) toman la parte historica del espejo local y solo la parte reciente de MySQL.
+    """
+    PREFIJOS_ESCRITURA = ('insert_', 'bulk_upsert_', 'process_and_insert', 'registro_')
+
+    def __init__(self, engine_primario, engine_lectura=None):
+        self.primario = engine_primario
+        self.lectura = engine_lectura if engine_lectura is not None else engine_primario
+        self.espejo = None
+        self._session_primario = sessionmaker(bind=self.primario)
+        self._session_lectura = sessionmaker(bind=self.lectura)
+
+    def session_escritura(self):
+        "sesión contra el engine primario"
+        return self._session_primario()
+
+    def session_lectura(self):
+        "sesión contra el engine de lectura"
+        return self._session_lectura()
+
+    def es_escritura(self, funcion):
+        "True si la funcion del data layer escribe en la base de datos"
+        return funcion.__name__.startswith(self.PREFIJOS_ESCRITURA)
+
+    def session_para(self, funcion):
+        "sesión adecuada para la funcion del data layer"
+        return self.session_escritura() if self.es_escritura(funcion) else self.session_lectura()
+
+    def ejecutar(self, funcion, *args, **kwargs):
+        """
+        Ejecuta una funcion del data layer (que recibe la sesión como primer argumento) en el engine que le
+        corresponde. Las escrituras se confirman con commit al terminar.
+        """
+        with self.session_para(funcion) as session:
+            resultado = funcion(session, *args, **kwargs)
+            if self.es_escritura(funcion):
+                session.commit()
+            return resultado
+
+    def conectar_espejo(self, espejo):
+        "conecta un espejo analitico (espejo.EspejoAnalitico) para las lecturas historicas por rango"
+        self.espejo = espejo
+
+    def ejecutar_rango(self, funcion, unix_time_inicio, unix_time_fin, *args, **kwargs):
+        """
+        Ejecuta una consulta por rango de unix_time (query_cmg_ponderado_rango, query_cmg_tiempo_real_rango,
+        query_filas_rango) repartiendola entre el espejo analitico y el engine de lectura.
+
+        El tramo anterior al corte del espejo (hasta donde esta replicado y ya no cambia) se lee del espejo y el
+        resto de MySQL; ambos resultados se unen en orden de unix_time. Si no hay espejo, o el espejo falla,
+        todo el rango se lee de MySQL.
+
+        Args:
+            funcion: funcion del data layer con firma (session, unix_time_inicio, unix_time_fin, *args).
+            unix_time_inicio (int): unix_time inicial (inclusive).
+            unix_time_fin (int): unix_time final (inclusive).
+
+        Returns:
+            resultado de la funcion para todo el rango, o None si ocurre un error.
+        """
+        with span(f'ejecutar_rango {funcion.__name__}', 'db') as atributos_span:
+            corte = self.espejo.corte() if self.espejo is not None else None
+            if atributos_span is not None:
+                atributos_span['corte_espejo'] = corte
+            if corte is None or unix_time_inicio >= corte:
+                return self.ejecutar(funcion, unix_time_inicio, unix_time_fin, *args, **kwargs)
+
+            with self.espejo.session() as session:
+                historico = funcion(session, unix_time_inicio, min(unix_time_fin, corte - 1), *args, **kwargs)
+            if historico is None:
+                logging.error(f"Analytical mirror failed for {funcion.__name__}, reading the whole range from MySQL")
+                return self.ejecutar(funcion, unix_time_inicio, unix_time_fin, *args, **kwargs)
+            if unix_time_fin < corte:
+                return historico
+
+            reciente = self.ejecutar(funcion, corte, unix_time_fin, *args, **kwargs)
+            if reciente is None:
+                return None
+            if isinstance(historico, dict):
+                return {columna: historico[columna] + reciente[columna] for columna in historico}
+            return historico + reciente
+
+    def salud(self):
+        "estado del circuit breaker de cada engine y del espejo analitico"
+        salud = {'primario': self.primario.circuit_breaker.resumen()}
+        if self.lectura is not self.primario:
+            salud['lectura'] = self.lectura.circuit_breaker.resumen()
+        if self.espejo is not None:
+            salud['espejo'] = self.espejo.estado()
+        return salud
+
+    def disponible(self, escritura=False):
+        "False si el circuito del engine esta abierto (la base de datos se considera caida)"
+        engine = self.primario if escritura else self.lectura
+        return engine.circuit_breaker.estado() != 'abierto'
+
+    def dispose(self):
+        "cierra los pools de ambos engines"
+        self.primario.dispose()
+        if self.lectura is not self.primario:
+            self.lectura.dispose()
+        if self.espejo is not None:
+            self.espejo.engine.dispose()
+
+# errores de conexion / pool que justifican reintentar un lote completo
+ERRORES_TRANSITORIOS = (OperationalError, InterfaceError, DisconnectionError, PoolTimeoutError)
+
+class ColaEscritura:
+    """
+    Cola de escritura diferida (write-behind) para la ingesta del scheduler.
+
+    Las filas se encolan sin tocar la base de datos y un thread en segundo plano las escribe en lotes, cada uno en
+    una sola transaccion corta, cuando se alcanzan `tamano_lote` filas o pasan `intervalo_flush` segundos desde la
+    primera fila pendiente. Asi ninguna transaccion queda abierta durante descargas HTTP.
+
+    Las filas de cmg_tiempo_real y cmg_ponderado se escriben con _bulk_upsert por (barra_transmision, unix_time) y
+    las de tracking_coordinador con bulk_upsert_tracking_coordinador por timestamp, por lo que reintentar un lote es
+    idempotente. Los errores transitorios (conexion, pool) se reintentan con espera
+    exponencial; un error de datos hace que el lote se escriba fila a fila para descartar solo las filas invalidas.
+    """
+    COLUMNAS = {
+        'tracking_coordinador': ('timestamp', 'archivo_rio', 'last_modification', 'rio_mod'),
+        'cmg_tiempo_real': ('barra_transmision', 'año', 'mes', 'dia', 'hora', 'unix_time', 'desacople_bool', 'cmg', 'central_referencia'),
+        'cmg_ponderado': ('barra_transmision', 'timestamp', 'unix_time', 'cmg_ponderado')
+    }
+
+    def __init__(self, engine_in, tamano_lote=500, intervalo_flush=2.0, max_reintentos=5, espera_reintento=0.5, capacidad=100000):
+        self.tamano_lote = tamano_lote
+        self.intervalo_flush = intervalo_flush
+        self.max_reintentos = max_reintentos
+        self.espera_reintento = espera_reintento
+        self._session_factory = sessionmaker(bind=engine_in)
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._detener = threading.Event()
+        self._lock = threading.Lock()
+        self.escritas = 0
+        self.descartadas = 0
+        self.reintentos = 0
+        self.lotes = 0
+        self.ultimo_error = None
+        self._thread = threading.Thread(target=self._ejecutar, name='cola_escritura', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def encolar(self, tabla, row_in, timeout=None):
+        """
+        Encola una fila. row_in puede ser la tupla / lista que reciben las funciones insert_row_* o un dict con
+        las columnas de la tabla. Si la cola esta llena espera hasta `timeout` segundos (queue.Full al vencer).
+        """
+        if tabla not in self.COLUMNAS:
+            raise ValueError(f"Unknown table for write queue: {tabla}")
+        if self._detener.is_set():
+            raise RuntimeError("Write queue is closed")
+        fila = dict(row_in) if isinstance(row_in, dict) else dict(zip(self.COLUMNAS[tabla], row_in))
+        self._cola.put((tabla, fila), timeout=timeout)
+
+    def profundidad(self):
+        "filas pendientes de escribir"
+        return self._cola.qsize()
+
+    def vaciar(self):
+        "bloquea hasta que todas las filas encoladas hasta ahora esten escritas o descartadas"
+        self._cola.join()
+
+    def cerrar(self, timeout=None):
+        "escribe las filas pendientes y detiene el thread"
+        self._detener.set()
+        self._thread.join(timeout)
+
+    def estado(self):
+        "profundidad de la cola y contadores de escritura"
+        with self._lock:
+            return {'profundidad': self.profundidad(), 'escritas': self.escritas, 'descartadas': self.descartadas,
+                    'reintentos': self.reintentos, 'lotes': self.lotes, 'ultimo_error': self.ultimo_error}
+
+    def _ejecutar(self):
+        lote = []
+        limite = None
+        while True:
+            espera = self.intervalo_flush if limite is None else max(0.0, limite - time.monotonic())
+            try:
+                lote.append(self._cola.get(timeout=espera))
+                # se toman sin esperar todas las filas ya disponibles
+                while len(lote) < self.tamano_lote:
+                    lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                pass
+
+            if lote and limite is None:
+                limite = time.monotonic() + self.intervalo_flush
+
+            if lote and (len(lote) >= self.tamano_lote or time.monotonic() >= limite or self._detener.is_set()):
+                try:
+                    self._flush(lote)
+                finally:
+                    for _ in lote:
+                        self._cola.task_done()
+                lote, limite = [], None
+
+            if self._detener.is_set() and not lote and self._cola.empty():
+                return
+
+    def _escribir(self, session_in, lote):
+        "escribe un lote en la sesion, agrupado por tabla"
+        grupos = {}
+        for tabla, fila in lote:
+            grupos.setdefault(tabla, []).append(fila)
+
+        if 'tracking_coordinador' in grupos:
+            # dentro del lote gana la ultima fila de cada timestamp
+            unicas = {fila['timestamp']: fila for fila in grupos['tracking_coordinador']}
+            bulk_upsert_tracking_coordinador(session_in, list(unicas.values()))
+        for tabla, modelo, pk_name, defaults in (('cmg_tiempo_real', CmgTiempoReal, 'id_tracking', {'desacople_bool': False}),
+                                                 ('cmg_ponderado', CmgPonderado, 'id', None)):
+            if tabla in grupos:
+                # dentro del lote gana la ultima fila de cada (barra_transmision, unix_time)
+                unicas = {(fila['barra_transmision'], fila['unix_time']): fila for fila in grupos[tabla]}
+                _bulk_upsert(session_in, modelo, pk_name, list(unicas.values()), defaults_in=defaults)
+
+    def _flush(self, lote):
+        inicio = time.perf_counter()
+        REGISTRO.observar('write_queue_depth', {}, self.profundidad() + len(lote), buckets=BUCKETS_FILAS,
+                          ayuda='Filas pendientes en la cola de escritura al iniciar un flush')
+
+        for intento in range(self.max_reintentos + 1):
+            try:
+                with self._session_factory() as session:
+                    self._escribir(session, lote)
+                    session.commit()
+                with self._lock:
+                    self.escritas += len(lote)
+                    self.lotes += 1
+                REGISTRO.observar('write_queue_flush_seconds', {'estado': 'ok'}, time.perf_counter() - inicio,
+                                  ayuda='Tiempo de escritura de un lote de la cola de escritura')
+                return
+
+            except ERRORES_TRANSITORIOS as exception:
+                with self._lock:
+                    self.reintentos += 1
+                    self.ultimo_error = str(exception)
+                logging.error(f"Transient error while flushing write queue (attempt {intento + 1}): {exception}")
+                if intento < self.max_reintentos:
+                    time.sleep(self.espera_reintento * 2 ** intento)
+
+            except Exception as exception:
+                with self._lock:
+                    self.ultimo_error = str(exception)
+                logging.error(f"Error while flushing write queue, writing rows one by one: {exception}")
+                self._flush_fila_a_fila(lote)
+                return
+
+        with self._lock:
+            self.descartadas += len(lote)
+        logging.error(f"Discarding {len(lote)} rows from write queue after {self.max_reintentos + 1} attempts")
+        REGISTRO.observar('write_queue_flush_seconds', {'estado': 'error'}, time.perf_counter() - inicio,
+                          ayuda='Tiempo de escritura de un lote de la cola de escritura')
+
+    def _flush_fila_a_fila(self, lote):
+        for item in lote:
+            try:
+                with self._session_factory() as session:
+                    self._escribir(session, [item])
+                    session.commit()
+                with self._lock:
+                    self.escritas += 1
+            except Exception as exception:
+                with self._lock:
+                    self.descartadas += 1
+                    self.ultimo_error = str(exception)
+                logging.error(f"Discarding row {item}: {exception}")
+
+class DetectorModificacionRio:
+    """
+    Deteccion de nuevas modificaciones de archivos RIO sin leer filas completas de tracking_coordinador.
+
+    Cada consulta lee solo max(id) de tracking_coordinador (resuelto con el indice de la clave primaria) y, unicamente
+    si el id cambio, el last_modification de esa fila. El ultimo id y last_modification vistos quedan en memoria, por
+    lo que una instancia compartida (scheduler, st.cache_resource del dashboard) consulta a lo mas una vez por
+    `intervalo` segundos sin importar cuantos threads esperen.
+    """
+    def __init__(self, session_factory, intervalo=5.0):
+        """
+        Args:
+            session_factory: callable que retorna una sesión usable como context manager (ej: router.session_lectura).
+            intervalo (float): segundos minimos entre consultas a la base de datos.
+        """
+        self._session_factory = session_factory
+        self.intervalo = intervalo
+        self.ultimo_id = None
+        self.ultima_modificacion = None
+        self.modificaciones = 0
+        self._ultima_consulta = None
+        self._condicion = threading.Condition()
+
+    def registrar(self, id_tracking, last_modification):
+        """
+        Actualiza el ultimo valor visto. Retorna True si last_modification cambio respecto al valor anterior (la
+        primera lectura solo inicializa el estado). Los threads bloqueados en esperar_modificacion se despiertan.
+        El scheduler puede llamarlo directamente despues de insertar una fila de tracking_coordinador.
+        """
+        with self._condicion:
+            cambio = self.ultimo_id is not None and last_modification != self.ultima_modificacion
+            self.ultimo_id = id_tracking
+            self.ultima_modificacion = last_modification
+            if cambio:
+                self.modificaciones += 1
+                self._condicion.notify_all()
+            return cambio
+
+    def consultar(self, forzar=False):
+        """
+        Consulta la base de datos si pasaron `intervalo` segundos desde la ultima consulta (o si forzar es True).
+
+        Returns:
+            bool: True si se detecto una modificacion RIO nueva en esta consulta.
+        """
+        with self._condicion:
+            ahora = time.monotonic()
+            if not forzar and self._ultima_consulta is not None and ahora - self._ultima_consulta < self.intervalo:
+                return False
+            self._ultima_consulta = ahora
+            ultimo_id = self.ultimo_id
+
+        try:
+            with self._session_factory() as session:
+                resultado = query_ultima_modificacion_rio(session, ultimo_id)
+        except Exception as exception:
+            logging.error(f"Error while checking RIO modifications: {exception}")
+            return False
+
+        if resultado is None or resultado[0] == ultimo_id:
+            return False
+        return self.registrar(*resultado)
+
+    def hubo_modificacion(self, timestamp):
+        """
+        Equivalente a evaluar_modificacion_rio: True si el ultimo last_modification es distinto al timestamp ingresado.
+        """
+        self.consultar()
+        with self._condicion:
+            return self.ultima_modificacion is not None and self.ultima_modificacion != timestamp
+
+    def esperar_modificacion(self, timeout, intervalo=None):
+        """
+        Bloquea hasta que se detecte una modificacion RIO posterior a la llamada o hasta que pase timeout.
+
+        Args:
+            timeout (float): segundos maximos de espera.
+            intervalo (float, optional): segundos entre consultas. Por defecto self.intervalo.
+
+        Returns:
+            str o None: nuevo last_modification, o None si no hubo modificaciones dentro del timeout.
+        """
+        intervalo = self.intervalo if intervalo is None else intervalo
+        limite = time.monotonic() + timeout
+        if self.ultimo_id is None:
+            self.consultar(forzar=True)
+        with self._condicion:
+            modificaciones = self.modificaciones
+
+        while True:
+            self.consultar()
+            with self._condicion:
+                if self.modificaciones != modificaciones:
+                    return self.ultima_modificacion
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                # despierta antes si otro thread (o registrar) detecta la modificacion
+                self._condicion.wait(min(intervalo, restante))
+
+def establecer_router(database_in, user_in, password_in, host_in, port_in, host_lectura=None, port_lectura=None, connection_string_lectura=None, verbose=False, **kwargs_engine):
+    """
+    Establece el engine primario y, si se entrega host_lectura, un engine de solo lectura hacia la réplica.
+
+    Args:
+        database_in, user_in, password_in, host_in, port_in: parametros de conexion del primario.
+        host_lectura (str, optional): host de la réplica de lectura.
+        port_lectura (str, optional): puerto de la réplica. Por defecto el mismo del primario.
+        connection_string_lectura (str, optional): URL de SQLAlchemy de la réplica (ej: sqlite para pruebas locales).
+        verbose (bool): imprime el estado de conexion.
+        **kwargs_engine: parametros adicionales para establecer_engine (pool_size, connection_string_in, ...).
+
+    Returns:
+        EngineRouter: router con ambos engines, o None si no se pudo crear el engine primario.
+        metadata: objeto de metadata del engine primario.
+    """
+    engine_primario, metadata_out = establecer_engine(database_in, user_in, password_in, host_in, port_in, verbose=verbose, **kwargs_engine)
+    if engine_primario is None:
+        return None, None
+
+    engine_lectura = None
+    if host_lectura is not None or connection_string_lectura is not None:
+        kwargs_lectura = dict(kwargs_engine, connection_string_in=connection_string_lectura)
+        engine_lectura, _ = establecer_engine(database_in, user_in, password_in, host_lectura, port_lectura or port_in,
+                                              verbose=verbose, read_only=True, **kwargs_lectura)
+        if engine_lectura is None:
+            logging.error("Could not create read engine, falling back to primary engine for reads")
+
+    return EngineRouter(engine_primario, engine_lectura), metadata_out
+
+@medir
 def check_unixtime_barra_row_exists(session_in, metadata_in, unix_time, barra_transmision, tabla_in):
     """
     Verifica si existe una entrada en la tabla 'cmg_tiempo_real' u otra inputada, con un unix_time específico para una barra de transmision.
@@ -236,6 +857,7 @@ def check_unixtime_barra_row_exists(session_in, metadata_in, unix_time, barra_tr
 ##############            inserts con sessions              #############
 #########################################################################
 
+@medir
 def insert_row_tracking_coordinador(session_in, row_in):
     """
     Agregar fila a la tabla tracking_coordinador_mod
@@ -266,6 +888,7 @@ def insert_row_tracking_coordinador(session_in, row_in):
         logging.error(f"Error while inserting row into table: {exception}")
         raise
 
+@medir
 def insert_row_cmg_tiempo_real(session_in, row_in):
     """
     Insertar fila en cmg_tiempo_real
@@ -301,6 +924,7 @@ def insert_row_cmg_tiempo_real(session_in, row_in):
         logging.error(f"Error while inserting row into table: {exception}")
         raise
 
+@medir
 def insert_row_cmg_ponderadon(session_in, row_in):
     """
     Insertar fila en cmg_ponderado
@@ -330,6 +954,7 @@ def insert_row_cmg_ponderadon(session_in, row_in):
         logging.error(f"Error while inserting row into table: {exception}")
         raise
 
+@medir
 def insert_or_replace_row_cmg_ponderado(session_in, barra_transmision, unix_time, cmg_ponderado):
     """
     Inserta una fila en la tabla cmg_ponderado si la fila no existe, o reemplaza una fila existente con los mismos
@@ -377,10 +1002,134 @@ def insert_or_replace_row_cmg_ponderado(session_in, barra_transmision, unix_time
         logging.error(f"Error while inserting row into table: {othererror}")
         session_in.rollback()
 
+#########################################################################
+##############            inserts masivos (bulk)            #############
+#########################################################################
+
+def _bulk_upsert(session_in, modelo, pk_name, rows_in, defaults_in=None):
+    """
+    Inserta o actualiza en bloque filas identificadas por (barra_transmision, unix_time).
+
+    Las filas existentes se actualizan con bulk_update_mappings (conservando las columnas no
+    incluidas en rows_in) y las nuevas se insertan con bulk_insert_mappings.
+
+    Args:
+        session_in (sqlalchemy.orm.Session): SQLAlchemy Session object.
+        modelo: clase ORM de la tabla destino.
+        pk_name (str): nombre de la clave primaria de la tabla.
+        rows_in (list of dict): filas a insertar, con llaves iguales a las columnas de la tabla.
+        defaults_in (dict, optional): valores por defecto para columnas ausentes en filas nuevas.
+
+    Returns:
+        tuple: (filas insertadas, filas actualizadas)
+    """
+    if not rows_in:
+        return 0, 0
+
+    try:
+        pk = getattr(modelo, pk_name)
+        existentes = {}
+        barras = {row['barra_transmision'] for row in rows_in}
+        for barra in barras:
+            unix_barra = [row['unix_time'] for row in rows_in if row['barra_transmision'] == barra]
+            query = session_in.query(pk, modelo.unix_time).filter(
+                modelo.barra_transmision == barra,
+                modelo.unix_time >= min(unix_barra),
+                modelo.unix_time <= max(unix_barra))
+            for id_row, unix_time in query:
+                existentes[(barra, unix_time)] = id_row
+
+        nuevas, actualizar = [], []
+        for row in rows_in:
+            id_row = existentes.get((row['barra_transmision'], row['unix_time']))
+            if id_row is None:
+                nuevas.append(dict(defaults_in or {}, **row))
+            else:
+                actualizar.append(dict(row, **{pk_name: id_row}))
+
+        if nuevas:
+            session_in.bulk_insert_mappings(modelo, nuevas)
+        if actualizar:
+            session_in.bulk_update_mappings(modelo, actualizar)
+
+        return len(nuevas), len(actualizar)
+
+    except Exception as exception:
+        session_in.rollback()
+        logging.error(f"Error while bulk inserting rows into {modelo.__tablename__}: {exception}")
+        raise
+
+@medir
+def bulk_upsert_cmg_tiempo_real(session_in, rows_in):
+    """
+    Inserta o reemplaza en bloque filas de cmg_tiempo_real. Las filas se identifican por
+    (barra_transmision, unix_time); en filas existentes se conserva desacople_bool si no viene en rows_in.
+
+    Args:
+        session_in (sqlalchemy.orm.Session): SQLAlchemy Session object.
+        rows_in (list of dict): filas con llaves barra_transmision, año, mes, dia, hora, unix_time, cmg,
+            central_referencia y opcionalmente desacople_bool.
+
+    Returns:
+        tuple: (filas insertadas, filas actualizadas)
+    """
+    return _bulk_upsert(session_in, CmgTiempoReal, 'id_tracking', rows_in, defaults_in={'desacople_bool': False})
+
+@medir
+def bulk_upsert_cmg_ponderado(session_in, rows_in):
+    """
+    Inserta o reemplaza en bloque filas de cmg_ponderado identificadas por (barra_transmision, unix_time).
+
+    Args:
+        session_in (sqlalchemy.orm.Session): SQLAlchemy Session object.
+        rows_in (list of dict): filas con llaves barra_transmision, timestamp, unix_time y cmg_ponderado.
+
+    Returns:
+        tuple: (filas insertadas, filas actualizadas)
+    """
+    return _bulk_upsert(session_in, CmgPonderado, 'id', rows_in)
+
+@medir
+def bulk_upsert_tracking_coordinador(session_in, rows_in):
+    """
+    Inserta o reemplaza en bloque filas de tracking_coordinador. Cada fila es una revision del scheduler y se
+    identifica por su timestamp: una fila que ya existe (lote reintentado) se actualiza en vez de duplicarse.
+
+    Args:
+        session_in (sqlalchemy.orm.Session): SQLAlchemy Session object.
+        rows_in (list of dict): filas con llaves timestamp, archivo_rio, last_modification y rio_mod.
+
+    Returns:
+        tuple: (filas insertadas, filas actualizadas)
+    """
+    if not rows_in:
+        return 0, 0
+
+    try:
+        query = session_in.query(TrackingCoordinador.id, TrackingCoordinador.timestamp).filter(
+            TrackingCoordinador.timestamp.in_({row['timestamp'] for row in rows_in}))
+        existentes = {timestamp: id_row for id_row, timestamp in query}
+
+        nuevas = [row for row in rows_in if row['timestamp'] not in existentes]
+        actualizar = [dict(row, id=existentes[row['timestamp']]) for row in rows_in if row['timestamp'] in existentes]
+
+        if nuevas:
+            session_in.bulk_insert_mappings(TrackingCoordinador, nuevas)
+        if actualizar:
+            session_in.bulk_update_mappings(TrackingCoordinador, actualizar)
+
+        return len(nuevas), len(actualizar)
+
+    except Exception as exception:
+        session_in.rollback()
+        logging.error(f"Error while bulk inserting rows into tracking_coordinador: {exception}")
+        raise
+
 #########################################################################
 ##############            query functions             ###################
 #########################################################################
 
+@medir
 def query_last_ins_tracking_coordinador(session_in):
     """
     Retorna la última fila insertada en la tabla tracking_coordinador
@@ -399,6 +1148,7 @@ def query_last_ins_tracking_coordinador(session_in):
             f"Error while querying last inserted row from table: {exception}")
         raise
 
+@medir
 def query_values_last_desacople_bool(session_in, barra_transmision):
     """
     Recupera la última entrada de "desacople_bool" para una "barra de transmision" específica en la tabla "cmg_tiempo_real".
@@ -431,6 +1181,35 @@ def query_values_last_desacople_bool(session_in, barra_transmision):
             f"Error while getting last desacople_bool for {barra_transmision}: {exception}")
         return None
 
+@medir
+def query_values_last_desacople_bool_barras(session_in, barras_transmision):
+    """
+    Version por lotes de query_values_last_desacople_bool: ultima entrada de "cmg_tiempo_real" de cada barra en una
+    sola consulta (max(id_tracking) agrupado por barra y join con la tabla).
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        barras_transmision (list): barras a consultar.
+
+    Returns:
+        dict: barra -> (central_referencia, afecto_desacople, cmg). Las barras sin datos no se incluyen.
+        None si ocurre un error.
+    """
+    try:
+        ultimos = session_in.query(func.max(CmgTiempoReal.id_tracking).label('id_tracking')).filter(
+            CmgTiempoReal.barra_transmision.in_(list(barras_transmision))).group_by(CmgTiempoReal.barra_transmision).subquery()
+
+        result = session_in.query(CmgTiempoReal.barra_transmision, CmgTiempoReal.central_referencia,
+                                  CmgTiempoReal.desacople_bool, CmgTiempoReal.cmg).join(
+            ultimos, CmgTiempoReal.id_tracking == ultimos.c.id_tracking).all()
+
+        return {barra: (central_referencia, afecto_desacople, cmg) for barra, central_referencia, afecto_desacople, cmg in result}
+
+    except Exception as exception:
+        logging.error(f"Error while getting last desacople_bool for {barras_transmision}: {exception}")
+        return None
+
+@medir
 def query_previous_modification_tracking_coordinador(session_in):
     """
     Recupera la pen-última fila de la tabla "tracking_coordinador" con el valor "rio_mod" en True.
@@ -438,47 +1217,232 @@ def query_previous_modification_tracking_coordinador(session_in):
         session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
 
     Returns:
-        tuple o None: Retorna una tupla con los valores de la fila seleccionada, o None si no se seleccionan filas.
+        list o None: Retorna una lista con los valores de la fila seleccionada, o None si no se seleccionan filas.
 
     """
     try:
-        result = session_in.query(TrackingCoordinador).filter_by(
-            rio_mod=True).order_by(desc(TrackingCoordinador.id)).limit(2)
-        rows = result.all()
+        # solo las columnas, sin objetos ORM, y solo la fila pedida (offset 1)
+        row = session_in.query(*TrackingCoordinador.__table__.columns).filter(
+            TrackingCoordinador.rio_mod == True).order_by(desc(TrackingCoordinador.id)).offset(1).limit(1).first()
 
-        if len(rows) == 2:
-            return rows[1].as_list()
+        if row is not None:
+            return list(row)
 
     except Exception as exception:
         logging.error(
             f"Error while getting previous modification: {exception}")
         return None
 
+@medir
+def query_ultima_modificacion_rio(session_in, id_conocido=None):
+    """
+    id y last_modification de la ultima fila de "tracking_coordinador". max(id) se resuelve con el indice de la
+    clave primaria; si es igual a id_conocido no se lee ninguna fila.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        id_conocido (int, optional): ultimo id ya visto.
+
+    Returns:
+        tuple: (id, last_modification); (id_conocido, None) si no hay filas nuevas. None si la tabla esta vacia o
+        ocurre un error.
+    """
+    try:
+        ultimo_id = session_in.execute(select([func.max(TrackingCoordinador.id)])).scalar()
+        if ultimo_id is None:
+            return None
+        if ultimo_id == id_conocido:
+            return ultimo_id, None
+        last_modification = session_in.execute(select([TrackingCoordinador.last_modification]).where(
+            TrackingCoordinador.id == ultimo_id)).scalar()
+        return ultimo_id, last_modification
+
+    except Exception as exception:
+        logging.error(f"Error while getting last RIO modification: {exception}")
+        return None
+
+@medir
+def query_change_token(session_in):
+    """
+    Token de cambios: id maximo de "tracking_coordinador", "cmg_tiempo_real" y "central" en una sola consulta.
+    Cada max() se resuelve con el indice de la clave primaria, sin leer filas.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+
+    Returns:
+        dict: id maximo por tabla (0 si la tabla esta vacia), o None si ocurre un error.
+    """
+    try:
+        query = select([
+            select([func.max(TrackingCoordinador.id)]).scalar_subquery(),
+            select([func.max(CmgTiempoReal.id_tracking)]).scalar_subquery(),
+            select([func.max(CentralTable.id)]).scalar_subquery()
+        ])
+        tracking, tiempo_real, central = session_in.execute(query).one()
+        return {
+            'tracking_coordinador': tracking or 0,
+            'cmg_tiempo_real': tiempo_real or 0,
+            'central': central or 0
+        }
+
+    except Exception as exception:
+        logging.error(f"Error while getting change token: {exception}")
+        return None
+
+@medir
+def query_revisiones_rio(session_in):
+    """
+    Recupera todas las revisiones de archivos RIO registradas en "tracking_coordinador" (filas con "rio_mod" en True).
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+
+    Returns:
+        list: Lista de tuplas (id, timestamp, archivo_rio, last_modification) ordenadas por id, o None si ocurre un error.
+    """
+    try:
+        query = session_in.query(TrackingCoordinador.id, TrackingCoordinador.timestamp, TrackingCoordinador.archivo_rio,
+                                 TrackingCoordinador.last_modification).filter_by(rio_mod=True).order_by(asc(TrackingCoordinador.id))
+        return [tuple(row) for row in query]
+
+    except Exception as exception:
+        logging.error(f"Error while getting RIO revisions: {exception}")
+        return None
+
+def aplicar_esquema(df, tabla):
+    """
+    Convierte las columnas de un DataFrame a los tipos declarados en ESQUEMAS[tabla]. Las columnas fuera del esquema no
+    se modifican. Los enteros y booleanos con nulos pasan a su version nullable (Int32, boolean).
+
+    Args:
+        df (pd.DataFrame): DataFrame con columnas de la tabla.
+        tabla (str): 'central', 'cmg_ponderado' o 'cmg_tiempo_real'.
+
+    Returns:
+        pd.DataFrame: el mismo DataFrame, con las columnas convertidas.
+    """
+    for columna, tipo in ESQUEMAS[tabla].items():
+        if columna not in df.columns or tipo == 'object':
+            continue
+        serie = df[columna]
+        if tipo == 'datetime64':
+            if not pd.api.types.is_datetime64_any_dtype(serie):
+                df[columna] = pd.to_datetime(serie, format=FORMATO_FECHA, errors='coerce')
+            continue
+        if tipo == 'segundos_dia':
+            if not pd.api.types.is_integer_dtype(serie):
+                serie = pd.to_timedelta(serie, errors='coerce').dt.total_seconds()
+            tipo = 'int32'
+        if tipo in ('bool', 'int8', 'int16', 'int32', 'int64') and serie.isna().any():
+            tipo = 'boolean' if tipo == 'bool' else tipo.capitalize()
+        df[columna] = serie.astype(tipo)
+    return df
+
+def _dataframe_tabla(session_in, query, tabla):
+    "ejecuta un select de columnas de la tabla y entrega el DataFrame con el esquema aplicado"
+    resultado = session_in.execute(query)
+    return aplicar_esquema(pd.DataFrame(resultado.fetchall(), columns=list(resultado.keys())), tabla)
+
+@medir
 def get_cmg_tiempo_real(session_in, unix_time_in):
+    """
+    Recupera las entradas de "cmg_tiempo_real" con unix_time mayor o igual a unix_time_in.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        unix_time_in (int): unix_time minimo.
+
+    Returns:
+        pd.DataFrame: todas las columnas de la tabla con ESQUEMAS['cmg_tiempo_real'], o None si ocurre un error.
+    """
+    try:
+        query = select(CmgTiempoReal.__table__.columns).where(CmgTiempoReal.unix_time >= unix_time_in)
+        return _dataframe_tabla(session_in, query, 'cmg_tiempo_real')
+
+    except Exception as e:
+        logging.error(f"Error while getting cmg_tiempo_real entries: {e}")
+        return None
+
+@medir
+def query_cmg_tiempo_real_rango(session_in, unix_time_inicio, unix_time_fin, barras_transmision):
+    """
+    Recupera las entradas de "cmg_tiempo_real" entre dos unix_time (inclusive) para las barras indicadas.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        unix_time_inicio (int): unix_time inicial.
+        unix_time_fin (int): unix_time final.
+        barras_transmision (list of str): barras de transmision a consultar.
+
+    Returns:
+        list: Lista de diccionarios con barra_transmision, unix_time, desacople_bool, cmg y central_referencia, o None si ocurre un error.
+    """
     try:
-        query = session_in.query(CmgTiempoReal).filter(CmgTiempoReal.unix_time >= unix_time_in).all()
-        entries = []
-        for row in query:
-            entry = {
-                'id_tracking': row.id_tracking,
-                'barra_transmision': row.barra_transmision,
-                'año': row.año,
-                'mes': row.mes,
-                'dia': row.dia,
-                'hora': row.hora,
-                'unix_time': row.unix_time,
-                'desacople_bool': row.desacople_bool,
-                'cmg': float(row.cmg),
-                'central_referencia': row.central_referencia
+        columnas = ['barra_transmision', 'unix_time', 'desacople_bool', 'cmg', 'central_referencia']
+        archivado, unix_time_inicio = _tramo_archivado(CmgTiempoReal, unix_time_inicio, unix_time_fin, barras_transmision, columnas)
+        query = session_in.query(CmgTiempoReal.barra_transmision, CmgTiempoReal.unix_time, CmgTiempoReal.desacople_bool,
+                                 CmgTiempoReal.cmg, CmgTiempoReal.central_referencia).filter(
+            CmgTiempoReal.unix_time >= unix_time_inicio,
+            CmgTiempoReal.unix_time <= unix_time_fin,
+            CmgTiempoReal.barra_transmision.in_(barras_transmision)
+        ).order_by(asc(CmgTiempoReal.unix_time))
+        entries = [{
+            'barra_transmision': row.barra_transmision,
+            'unix_time': row.unix_time,
+            'desacople_bool': row.desacople_bool,
+            'cmg': row.cmg,
+            'central_referencia': row.central_referencia
+        } for row in query]
+        return entries if archivado is None else archivado.to_dict('records') + entries
+
+    except Exception as e:
+        logging.error(f"Error while getting cmg_tiempo_real entries: {e}")
+        return None
+
+@medir
+def query_cmg_ponderado_rango(session_in, unix_time_inicio, unix_time_fin, barras_transmision):
+    """
+    Recupera las entradas de "cmg_ponderado" entre dos unix_time (inclusive) para las barras indicadas, como listas
+    por columna.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        unix_time_inicio (int): unix_time inicial.
+        unix_time_fin (int): unix_time final.
+        barras_transmision (list of str): barras de transmision a consultar.
+
+    Returns:
+        dict: columnas barra_transmision, unix_time y cmg como listas, o None si ocurre un error.
+    """
+    try:
+        archivado, unix_time_inicio = _tramo_archivado(CmgPonderado, unix_time_inicio, unix_time_fin, barras_transmision,
+                                                       ['barra_transmision', 'unix_time', 'cmg_ponderado'])
+        query = select([CmgPonderado.barra_transmision, CmgPonderado.unix_time, CmgPonderado.cmg_ponderado]).where(
+            CmgPonderado.unix_time >= unix_time_inicio).where(
+            CmgPonderado.unix_time <= unix_time_fin).where(
+            CmgPonderado.barra_transmision.in_(list(barras_transmision))).order_by(asc(CmgPonderado.unix_time))
+        rows = session_in.execute(query).fetchall()
+        columnas = list(zip(*rows)) if rows else [[]] * 3
+        salida = {
+            'barra_transmision': list(columnas[0]),
+            'unix_time': list(columnas[1]),
+            'cmg': list(columnas[2])
+        }
+        if archivado is not None:
+            salida = {
+                'barra_transmision': archivado['barra_transmision'].tolist() + salida['barra_transmision'],
+                'unix_time': archivado['unix_time'].tolist() + salida['unix_time'],
+                'cmg': archivado['cmg_ponderado'].tolist() + salida['cmg']
             }
-            entries.append(entry)
-        return entries
-    
+        return salida
+
     except Exception as e:
         logging.error(f"Error while getting cmg_ponderado entries: {e}")
         return None
 
 
+@medir
 def evaluar_cmg_hora(session_in, unix_time_in, barra_transmision_in="CHARRUA__220"):
     """
     Obtiene el costo marginal horario promedio para una central dada en la base de datos.
@@ -511,7 +1475,7 @@ def evaluar_cmg_hora(session_in, unix_time_in, barra_transmision_in="CHARRUA__22
         arr_intermediario = np.array(
             [(row.unix_time - unix_time_in) for row in rows] + [duration+1])
         arr_weight = np.diff(arr_intermediario) / (duration+1)
-        arr_cmg = np.array([float(row.cmg) for row in rows])
+        arr_cmg = np.array([row.cmg for row in rows], dtype=np.float64)
 
         cmg_hora_out = np.sum(np.multiply(arr_weight, arr_cmg))
 
@@ -528,6 +1492,42 @@ def evaluar_cmg_hora(session_in, unix_time_in, barra_transmision_in="CHARRUA__22
         raise RuntimeError(
             "Error al ejecutar la consulta o calcular el costo marginal horario.")
 
+def calcular_cmg_ponderado_horas(df_in):
+    """
+    Calcula el costo marginal horario ponderado de todas las horas y barras de un DataFrame de cmg_tiempo_real en una
+    sola pasada vectorizada. Usa la misma ponderacion que evaluar_cmg_hora: cada lectura pesa el tiempo que transcurre
+    hasta la siguiente lectura de la misma hora, y la ultima lectura hasta el final de la hora.
+
+    Args:
+        df_in (pd.DataFrame): DataFrame con columnas 'barra_transmision', 'unix_time' y 'cmg'.
+
+    Returns:
+        pd.DataFrame: DataFrame con columnas 'barra_transmision', 'unix_time' (inicio de hora) y 'cmg_ponderado'.
+    """
+    duration = 3600
+
+    if df_in.empty:
+        return pd.DataFrame(columns=['barra_transmision', 'unix_time', 'cmg_ponderado'])
+
+    df = df_in[['barra_transmision', 'unix_time', 'cmg']].sort_values(['barra_transmision', 'unix_time'], kind='mergesort')
+    unix_time = df['unix_time'].to_numpy(dtype=np.int64)
+    hora = unix_time - unix_time % duration
+    barra = df['barra_transmision'].to_numpy()
+
+    # La lectura siguiente solo cuenta si pertenece a la misma barra y hora
+    siguiente = np.append(unix_time[1:] - hora[:-1], duration)
+    misma_hora = np.append((hora[1:] == hora[:-1]) & (barra[1:] == barra[:-1]), False)
+    siguiente = np.where(misma_hora, siguiente, duration)
+
+    peso = (siguiente - (unix_time - hora)) / duration
+    df_out = pd.DataFrame({
+        'barra_transmision': barra,
+        'unix_time': hora,
+        'cmg_ponderado': peso * df['cmg'].to_numpy(dtype=np.float64)
+    })
+    return df_out.groupby(['barra_transmision', 'unix_time'], as_index=False, sort=True)['cmg_ponderado'].sum()
+
+@medir
 def evaluar_modificacion_rio(session_in, timestamp):
     """ Evalua si hubo una modificacion posterior a el timestamp ingresado.
 
@@ -539,18 +1539,17 @@ def evaluar_modificacion_rio(session_in, timestamp):
         bool: True si hubo una modificacion posterior a el timestamp ingresado, FALSE en caso contrario.
     """
     try:
-        last_row = query_last_ins_tracking_coordinador(session_in)
-        ultima_entrada = last_row[3]
-
-        if ultima_entrada == timestamp:
+        # solo last_modification de la ultima fila, sin cargar la fila completa
+        resultado = query_ultima_modificacion_rio(session_in)
+        if resultado is None:
             return False
-        else:
-            return True
+        return resultado[1] != timestamp
 
     except Exception as exception:
         logging.error(f"Error while getting last modification: {exception}")
         return False
 
+@medir
 def query_cmg_ponderado_by_time(session_in, unixtime, delta_hours=48):
     """
     Recupera la última entrada de "cmg_ponderado" para todas las  "barra_transmision" en la tabla "cmg_ponderado" que tengan un unixtime 48 horas menor al unixtime inputado.
@@ -561,23 +1560,167 @@ def query_cmg_ponderado_by_time(session_in, unixtime, delta_hours=48):
         delta_hours (int, optional): Cantidad de horas previas a la hora de referencia. Por defecto es 48.
 
     Returns:
-        dict: Un diccionario con las barras de transmisión como llaves y los valores de cmg_ponderado como valores.
+        pd.DataFrame: columnas barra_transmision, timestamp, unix_time y cmg_ponderado con ESQUEMAS['cmg_ponderado'],
+            o None si ocurre un error.
     """
     try:
         unixtime_minus_delta = unixtime - (delta_hours * 3600)
-        query = session_in.query(CmgPonderado).filter(CmgPonderado.unix_time >= unixtime_minus_delta).all()
-        entries = [{ 
-            'barra_transmision': row.barra_transmision,
-            'timestamp': row.timestamp,
-            'unix_time': row.unix_time,
-            'cmg_ponderado': float(row.cmg_ponderado)
-        } for row in query]
-        return entries
+        query = select([CmgPonderado.barra_transmision, CmgPonderado.timestamp, CmgPonderado.unix_time,
+                        CmgPonderado.cmg_ponderado]).where(CmgPonderado.unix_time >= unixtime_minus_delta)
+        return _dataframe_tabla(session_in, query, 'cmg_ponderado')
     
     except Exception as e:
         logging.error(f"Error while getting cmg_ponderado entries: {e}")
         return None
-    
+
+@medir
+def query_cmg_tiempo_real_desde_id(session_in, id_desde, unix_time_desde=0):
+    """
+    Recupera las filas de "cmg_tiempo_real" con id_tracking mayor a id_desde y unix_time mayor o igual a unix_time_desde,
+    como arreglos por columna (sin objetos ORM), ordenadas por id_tracking. Se usa para alimentar el store en memoria.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        id_desde (int): ultimo id_tracking ya cargado.
+        unix_time_desde (int, optional): unix_time minimo.
+
+    Returns:
+        dict: columnas id, barra_transmision, unix_time, desacople_bool, cmg y central_referencia como listas, o None si ocurre un error.
+    """
+    try:
+        query = select([CmgTiempoReal.id_tracking, CmgTiempoReal.barra_transmision, CmgTiempoReal.unix_time,
+                        CmgTiempoReal.desacople_bool, CmgTiempoReal.cmg, CmgTiempoReal.central_referencia]).where(
+            CmgTiempoReal.id_tracking > id_desde).where(CmgTiempoReal.unix_time >= unix_time_desde).order_by(
+            asc(CmgTiempoReal.id_tracking))
+        rows = session_in.execute(query).fetchall()
+        columnas = list(zip(*rows)) if rows else [[]] * 6
+        return {
+            'id': list(columnas[0]),
+            'barra_transmision': list(columnas[1]),
+            'unix_time': list(columnas[2]),
+            'desacople_bool': list(columnas[3]),
+            'cmg': list(columnas[4]),
+            'central_referencia': list(columnas[5])
+        }
+
+    except Exception as e:
+        logging.error(f"Error while getting cmg_tiempo_real entries by id: {e}")
+        return None
+
+@medir
+def query_cmg_ponderado_desde_id(session_in, id_desde, unix_time_desde=0):
+    """
+    Recupera las filas de "cmg_ponderado" con id mayor a id_desde y unix_time mayor o igual a unix_time_desde,
+    como arreglos por columna, ordenadas por id. Se usa para alimentar el store en memoria.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        id_desde (int): ultimo id ya cargado.
+        unix_time_desde (int, optional): unix_time minimo.
+
+    Returns:
+        dict: columnas id, barra_transmision, unix_time y cmg como listas, o None si ocurre un error.
+    """
+    try:
+        query = select([CmgPonderado.id, CmgPonderado.barra_transmision, CmgPonderado.unix_time,
+                        CmgPonderado.cmg_ponderado]).where(CmgPonderado.id > id_desde).where(
+            CmgPonderado.unix_time >= unix_time_desde).order_by(asc(CmgPonderado.id))
+        rows = session_in.execute(query).fetchall()
+        columnas = list(zip(*rows)) if rows else [[]] * 4
+        return {
+            'id': list(columnas[0]),
+            'barra_transmision': list(columnas[1]),
+            'unix_time': list(columnas[2]),
+            'cmg': list(columnas[3])
+        }
+
+    except Exception as e:
+        logging.error(f"Error while getting cmg_ponderado entries by id: {e}")
+        return None
+
+def configurar_archivo(archivo):
+    """
+    Activa la lectura transparente de meses archivados: las funciones de rango (query_cmg_tiempo_real_rango,
+    query_cmg_ponderado_rango, query_filas_rango) leen del archivo el tramo anterior a su limite y de la base de
+    datos solo el resto.
+
+    Args:
+        archivo (archivo.ArchivoParquet o None): archivo a usar; None lo desactiva.
+    """
+    global ARCHIVO_CMG
+    ARCHIVO_CMG = archivo
+
+def _tramo_archivado(modelo, unix_time_inicio, unix_time_fin, barras_transmision=None, columnas=None):
+    """
+    Parte archivada de un rango de unix_time.
+
+    Returns:
+        tuple: (pd.DataFrame con las filas archivadas o None, unix_time inicial para la consulta a la base de datos).
+    """
+    if ARCHIVO_CMG is None:
+        return None, unix_time_inicio
+    limite = ARCHIVO_CMG.limite(modelo.__tablename__)
+    if unix_time_inicio >= limite:
+        return None, unix_time_inicio
+    archivado = ARCHIVO_CMG.leer(modelo.__tablename__, unix_time_inicio, min(unix_time_fin, limite - 1), barras_transmision, columnas)
+    return archivado, limite
+
+@medir
+def query_filas_desde_id(session_in, modelo, id_desde, limite=50000):
+    """
+    Recupera hasta `limite` filas completas de la tabla del modelo con clave primaria mayor a id_desde, ordenadas por
+    clave primaria. Se usa para replicar las tablas de cmg al espejo analitico por marca de agua de id.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        modelo: clase ORM de la tabla (CmgTiempoReal o CmgPonderado).
+        id_desde (int): ultimo id ya replicado.
+        limite (int, optional): filas maximas por llamada. Por defecto es 50000.
+
+    Returns:
+        list: Lista de diccionarios con todas las columnas de la tabla, o None si ocurre un error.
+    """
+    try:
+        pk = list(modelo.__table__.primary_key.columns)[0]
+        query = select(modelo.__table__.columns).where(pk > id_desde).order_by(asc(pk)).limit(limite)
+        columnas = modelo.__table__.columns.keys()
+        return [dict(zip(columnas, row)) for row in session_in.execute(query)]
+
+    except Exception as e:
+        logging.error(f"Error while getting {modelo.__tablename__} rows by id: {e}")
+        return None
+
+@medir
+def query_filas_rango(session_in, unix_time_inicio, unix_time_fin, modelo, barras_transmision=None, usar_archivo=True):
+    """
+    Recupera las filas completas de la tabla del modelo entre dos unix_time (inclusive), ordenadas por unix_time.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        unix_time_inicio (int): unix_time inicial.
+        unix_time_fin (int): unix_time final.
+        modelo: clase ORM de la tabla (CmgTiempoReal o CmgPonderado).
+        barras_transmision (list of str, optional): barras a consultar. Por defecto todas.
+        usar_archivo (bool, optional): lee del archivo Parquet el tramo archivado (ver configurar_archivo). Por defecto es True.
+
+    Returns:
+        list: Lista de diccionarios con todas las columnas de la tabla, o None si ocurre un error.
+    """
+    try:
+        archivado, unix_time_inicio = _tramo_archivado(modelo, unix_time_inicio, unix_time_fin, barras_transmision) if usar_archivo else (None, unix_time_inicio)
+        query = select(modelo.__table__.columns).where(modelo.unix_time >= unix_time_inicio).where(
+            modelo.unix_time <= unix_time_fin)
+        if barras_transmision is not None:
+            query = query.where(modelo.barra_transmision.in_(list(barras_transmision)))
+        columnas = modelo.__table__.columns.keys()
+        filas = [dict(zip(columnas, row)) for row in session_in.execute(query.order_by(asc(modelo.unix_time)))]
+        return filas if archivado is None else archivado.to_dict('records') + filas
+
+    except Exception as e:
+        logging.error(f"Error while getting {modelo.__tablename__} rows by range: {e}")
+        return None
+
+@medir
 def query_last_row_central(session_in, name_central):
     """
     Retrieves the last entry from the 'central' table based on the provided name.
@@ -596,6 +1739,118 @@ def query_last_row_central(session_in, name_central):
         logging.error(f"Error while getting last entry by name: {e}")
         return None
 
+@medir
+def query_last_row_centrales(session_in, names_central):
+    """
+    Version por lotes de query_last_row_central: ultima entrada de la tabla 'central' de cada nombre en una sola
+    consulta.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        names_central (list): nombres de las centrales.
+
+    Returns:
+        dict: nombre -> fila (as_list). Las centrales sin entradas no se incluyen. None si ocurre un error.
+    """
+    try:
+        ultimos = session_in.query(func.max(CentralTable.id).label('id')).filter(
+            CentralTable.nombre.in_(list(names_central))).group_by(CentralTable.nombre).subquery()
+
+        entries = session_in.query(CentralTable).join(ultimos, CentralTable.id == ultimos.c.id).all()
+        return {entry.nombre: entry.as_list() for entry in entries}
+
+    except Exception as e:
+        logging.error(f"Error while getting last entries by name: {e}")
+        return None
+
+@medir
+def query_historial_precio_brent(session_in, name_central):
+    """
+    Historial de precio_brent de una central (solo las columnas necesarias, ordenado por id).
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        name_central (str): nombre de la central.
+
+    Returns:
+        dict: listas 'fecha_registro' (str, '%d.%m.%y %H:%M:%S') y 'precio_brent' (float). None si ocurre un error.
+    """
+    try:
+        result = session_in.query(CentralTable.fecha_registro, CentralTable.precio_brent).filter(
+            CentralTable.nombre == name_central).order_by(asc(CentralTable.id)).all()
+
+        return {
+            'fecha_registro': [fila[0] for fila in result],
+            'precio_brent': [np.nan if fila[1] is None else fila[1] for fila in result]
+        }
+
+    except Exception as e:
+        logging.error(f"Error while getting precio_brent history for {name_central}: {e}")
+        return None
+
+@medir
+def query_historial_central(session_in, names_central):
+    """
+    Historial completo de parametros de las centrales indicadas, como listas por columna ordenadas por id.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        names_central (list): nombres de las centrales.
+
+    Returns:
+        dict: columnas nombre, fecha_registro, generando, parametros de despacho.PARAMETROS, precio_brent y
+        costo_operacional (numericas como float, NaN si son nulas). None si ocurre un error.
+    """
+    columnas_numericas = despacho.PARAMETROS + ('precio_brent', 'costo_operacional')
+    try:
+        query = select([CentralTable.nombre, CentralTable.fecha_registro, CentralTable.generando] +
+                       [getattr(CentralTable, columna) for columna in columnas_numericas]).where(
+            CentralTable.nombre.in_(list(names_central))).order_by(asc(CentralTable.id))
+        rows = session_in.execute(query).fetchall()
+        columnas = list(zip(*rows)) if rows else [[]] * (3 + len(columnas_numericas))
+
+        historial = {'nombre': list(columnas[0]), 'fecha_registro': list(columnas[1]),
+                     'generando': [bool(valor) for valor in columnas[2]]}
+        for columna, valores in zip(columnas_numericas, columnas[3:]):
+            historial[columna] = [np.nan if valor is None else valor for valor in valores]
+        return historial
+
+    except Exception as e:
+        logging.error(f"Error while getting central history for {names_central}: {e}")
+        return None
+
+@medir
+def backtest_despacho(session_in, centrales, unix_time_inicio, unix_time_fin, parametros=None, detalle=False, cmg_ponderado=None):
+    """
+    Backtest de despacho: con el historial de la tabla central (as-of por fecha_registro) y el cmg_ponderado horario
+    de cada barra, calcula horas GENERANDO, margen y encendidos / apagados de cada central (ver despacho.backtest).
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        centrales (dict): nombre de central -> barra_transmision.
+        unix_time_inicio (int): unix_time inicial.
+        unix_time_fin (int): unix_time final.
+        parametros (dict, optional): parametros hipoteticos, comunes o por central.
+        detalle (bool): si es True tambien retorna el resultado hora a hora.
+        cmg_ponderado (dict, optional): salida de query_cmg_ponderado_rango ya consultada (ej: con
+            EngineRouter.ejecutar_rango desde el espejo analitico). Por defecto se consulta con session_in.
+
+    Returns:
+        pd.DataFrame o tuple: salida de despacho.backtest, o None si ocurre un error.
+    """
+    try:
+        historial = query_historial_central(session_in, list(centrales))
+        if cmg_ponderado is None:
+            cmg_ponderado = query_cmg_ponderado_rango(session_in, unix_time_inicio, unix_time_fin, list(centrales.values()))
+        if historial is None or cmg_ponderado is None:
+            return None
+        return despacho.backtest(historial, cmg_ponderado, centrales, parametros=parametros, detalle=detalle)
+
+    except Exception as e:
+        logging.error(f"Error while running dispatch backtest: {e}")
+        return None
+
+@medir
 def query_central_table(session_in, num_entries=6):
     """
     Retrieves the specified number of entries from the 'central' table.
@@ -605,22 +1860,17 @@ def query_central_table(session_in, num_entries=6):
         num_entries (int): Number of entries to retrieve.
 
     Returns:
-        pd.DataFrame: DataFrame containing the retrieved entries.
+        pd.DataFrame: DataFrame containing the retrieved entries, typed with ESQUEMAS['central'].
     """
     try:
-        query = session_in.query(CentralTable).order_by(desc(CentralTable.id)).limit(num_entries)
-        entries = query.all()
-        if entries:
-            data = [entry.as_list() for entry in entries]
-            df = pd.DataFrame(data, columns=CentralTable.__table__.columns.keys())
-            return df
-        else:
-            return pd.DataFrame()
+        query = select(CentralTable.__table__.columns).order_by(desc(CentralTable.id)).limit(num_entries)
+        return _dataframe_tabla(session_in, query, 'central')
 
     except Exception as e:
         logging.error(f"Error while retrieving entries from 'central' table: {e}")
         return None
 
+@medir
 def query_central_table_modifications(session_in, num_entries=10):
     """
     Retrieves the specified number of entries from the 'central' table where external_update is True.
@@ -630,17 +1880,12 @@ def query_central_table_modifications(session_in, num_entries=10):
         num_entries (int): Number of entries to retrieve.
 
     Returns:
-        pd.DataFrame: DataFrame containing the retrieved entries.
+        pd.DataFrame: DataFrame containing the retrieved entries, typed with ESQUEMAS['central'].
     """
     try:
-        query = session_in.query(CentralTable).filter(CentralTable.external_update == True).order_by(desc(CentralTable.id)).limit(num_entries)
-        entries = query.all()
-        if entries:
-            data = [entry.as_list() for entry in entries]
-            df = pd.DataFrame(data, columns=CentralTable.__table__.columns.keys())
-            return df
-        else:
-            return pd.DataFrame()
+        query = select(CentralTable.__table__.columns).where(CentralTable.external_update == True).order_by(
+            desc(CentralTable.id)).limit(num_entries)
+        return _dataframe_tabla(session_in, query, 'central')
 
     except Exception as e:
         logging.error(f"Error while retrieving entries from 'central' table: {e}")
@@ -651,9 +1896,10 @@ def query_central_table_modifications(session_in, num_entries=10):
 ##################### FUNCION PARA sintetizar subrutinas #########################
 ##################################################################################
 
-def process_and_insert_data(barra_transimsion_in, timestamp_rio_mod, df_tco, df_fp, df_rio, session_in, bool_desacople=False):
+def process_and_insert_data(barra_transimsion_in, timestamp_rio_mod, df_tco, df_fp, df_rio, session_in, bool_desacople=False, cola_escritura=None):
     """
     procesa dataframes importados e inserta datos en base de datos.
+    Con cola_escritura (ColaEscritura) la fila se encola en vez de agregarse a session_in.
     """
     try:
         # 6.4) Obtain cmg_central
@@ -665,13 +1911,16 @@ def process_and_insert_data(barra_transimsion_in, timestamp_rio_mod, df_tco, df_
 
         # 6.5) Insert records into the database
 
-        insert_row_cmg_tiempo_real(session_in, row_in=[
-                                   barra_transimsion_in, int_year, int_month, int_day, str_time, int_unix_time, bool_desacople, flt_cmg_corregido, central_ref])
+        row_cmg_tiempo_real = [barra_transimsion_in, int_year, int_month, int_day, str_time, int_unix_time, bool_desacople, flt_cmg_corregido, central_ref]
+        if cola_escritura is not None:
+            cola_escritura.encolar('cmg_tiempo_real', row_cmg_tiempo_real)
+        else:
+            insert_row_cmg_tiempo_real(session_in, row_in=row_cmg_tiempo_real)
 
     except Exception as exception:
         print(exception)
 
-def registro_inicio_hora(auth, path, session_in, barra_transmision, timestamp_current_hour, metadata):
+def registro_inicio_hora(auth, path, session_in, barra_transmision, timestamp_current_hour, metadata, cola_escritura=None):
     """
     Registra el inicio de hora en la tabla de seguimiento de cmg_ponderado.
 
@@ -681,6 +1930,8 @@ def registro_inicio_hora(auth, path, session_in, barra_transmision, timestamp_cu
         session_in: sqlalchemy session object.
         barra_transmision (list of str): Lista con los códigos de barra de transmisión.
         timestamp_current_hour (int): Timestamp del inicio de hora.
+        cola_escritura (ColaEscritura, optional): si se entrega, las filas se encolan y session_in solo se usa para
+            lecturas; su transaccion se cierra antes de cada descarga para no mantener locks durante el HTTP.
 
     Returns:
         None.
@@ -706,6 +1957,9 @@ def registro_inicio_hora(auth, path, session_in, barra_transmision, timestamp_cu
         # verificar si ya se encuentra la hora actual en la tabla cmg_ponderado para esta barra_transmision
         if not check_unixtime_barra_row_exists(session_in=session_in, metadata_in=metadata,unix_time=unixtime_current_hour, barra_transmision=barra, tabla_in="cmg_ponderado"):
 
+            if cola_escritura is not None:
+                session_in.commit()
+
             try:
                 # descargar el archivo HTML de coordinación
                 html_coordinador, _ = screener.get_html_coordinador(auth, path, timestamp_in=datestamp)
@@ -726,14 +1980,19 @@ def registro_inicio_hora(auth, path, session_in, barra_transmision, timestamp_cu
                 # obtener la última entrada para la barra_transmision actual
                 ref_central, bool_desacople, cmg_pasado = query_values_last_desacople_bool(
                     session_in, barra)
+                if cola_escritura is not None:
+                    session_in.commit()
 
                 if not disponible_rio_hoy:
                     # si el archivo RIO del día actual no está disponible, copiar cmg_pasado como el valor actual de CMG
                     row_cmg_tiempo_real = (barra, int_year, int_month, int_day, str_time,
                                             unixtime_current_hour, bool_desacople, cmg_pasado, ref_central)
 
-                    insert_row_cmg_tiempo_real(
-                        session_in, row_cmg_tiempo_real)
+                    if cola_escritura is not None:
+                        cola_escritura.encolar('cmg_tiempo_real', row_cmg_tiempo_real)
+                    else:
+                        insert_row_cmg_tiempo_real(
+                            session_in, row_cmg_tiempo_real)
 
                 else:
                     # descargar e importar los archivos necesarios para el cálculo de CMG corregido
@@ -747,7 +2006,10 @@ def registro_inicio_hora(auth, path, session_in, barra_transmision, timestamp_cu
                     # insertar la entrada en la tabla cmg_tiempo_real
                     row_tracking_cmg = (barra, int_year, int_month, int_day, str_time,
                                         unixtime_current_hour, bool_desacople, flt_cmg_corregido, central_ref)
-                    insert_row_cmg_tiempo_real(session_in, row_tracking_cmg)
+                    if cola_escritura is not None:
+                        cola_escritura.encolar('cmg_tiempo_real', row_tracking_cmg)
+                    else:
+                        insert_row_cmg_tiempo_real(session_in, row_tracking_cmg)
 
                     # eliminar los archivos temporales si es necesario
                     if arr_temp_files is not None:
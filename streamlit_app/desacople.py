@@ -0,0 +1,332 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Indice de intervalos de desacople por barra. cmg_tiempo_real guarda el desacople como un booleano por
+lectura, por lo que preguntas como "cuando estuvo CHARRUA__220 en desacople el mes pasado y con que central de
+referencia" requieren recorrer toda la tabla. Este modulo mantiene la tabla desacople_intervalos con los tramos
+continuos (barra, inicio, fin, central_referencia) de lecturas en desacople, calculados con run-length encoding
+vectorizado y actualizados de forma incremental por marca de agua de id_tracking.
+
+Un tramo se corta cuando cambia el desacople, cambia la central de referencia o pasan mas de GAP_MAXIMO segundos
+entre dos lecturas de la barra (datos faltantes). inicio_unix y fin_unix son los unix_time de la primera y ultima
+lectura del tramo.
+
+Uso:
+    python desacople.py --intervalo 300
+    python desacople.py --completa   # reconstruye el indice (ej: despues de un backfill)
+"""
+
+import os
+import time
+import logging
+import argparse
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import MetaData, Table, Column, Integer, String, Boolean, Index, select, delete, update, and_, asc
+
+import connection as cn
+from instrumentation import medir
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+# segundos maximos entre dos lecturas de una barra para considerarlas parte del mismo tramo
+GAP_MAXIMO = 2 * 3600
+
+TAMANO_LOTE = 50000
+
+COLUMNAS_INTERVALOS = ['barra_transmision', 'inicio_unix', 'fin_unix', 'central_referencia', 'lecturas']
+
+metadata_desacople = MetaData()
+
+intervalos_desacople = Table(
+    'desacople_intervalos', metadata_desacople,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('barra_transmision', String(255), nullable=False),
+    Column('inicio_unix', Integer, nullable=False),
+    Column('fin_unix', Integer, nullable=False),
+    Column('central_referencia', String(255)),
+    Column('lecturas', Integer, nullable=False),
+    Index('ix_desacople_intervalos_barra_inicio', 'barra_transmision', 'inicio_unix'),
+    Index('ix_desacople_intervalos_barra_fin', 'barra_transmision', 'fin_unix')
+)
+
+# ultima lectura procesada de cada barra: permite extender el tramo abierto con el lote siguiente
+estado_desacople = Table(
+    'desacople_estado', metadata_desacople,
+    Column('barra_transmision', String(255), primary_key=True),
+    Column('ultimo_id', Integer, nullable=False),
+    Column('ultimo_unix', Integer, nullable=False),
+    Column('desacople_bool', Boolean, nullable=False),
+    Column('central_referencia', String(255)),
+    # inicio_unix del tramo de desacople que termina en la ultima lectura (None si la barra no esta en desacople)
+    Column('inicio_abierto', Integer)
+)
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def tramos(barras, unix_time, desacople, central_referencia, gap_maximo=GAP_MAXIMO):
+    """
+    Run-length encoding vectorizado de las lecturas de cmg_tiempo_real.
+
+    Args:
+        barras, unix_time, desacople, central_referencia (array-like): columnas de las lecturas, en cualquier orden.
+        gap_maximo (int): segundos maximos entre lecturas consecutivas de un tramo.
+
+    Returns:
+        pd.DataFrame: un tramo por fila (todos los estados, no solo desacople) con columnas barra_transmision,
+        inicio_unix, fin_unix, desacople_bool, central_referencia, lecturas y primera (posicion, en el orden original,
+        de la primera lectura del tramo). Ordenado por barra e inicio.
+    """
+    barras = np.asarray(barras, dtype=object)
+    unix_time = np.asarray(unix_time, dtype=np.int64)
+    desacople = np.asarray(desacople, dtype=bool)
+    # fuera de desacople la central de referencia no corta tramos
+    central = np.where(desacople, np.asarray(central_referencia, dtype=object), None)
+
+    if len(barras) == 0:
+        return pd.DataFrame(columns=['barra_transmision', 'inicio_unix', 'fin_unix', 'desacople_bool',
+                                     'central_referencia', 'lecturas', 'primera'])
+
+    codigos, barras_unicas = pd.factorize(barras)
+    orden = np.lexsort((unix_time, codigos))
+    codigos, unix_ord, desacople_ord, central_ord = codigos[orden], unix_time[orden], desacople[orden], central[orden]
+
+    cambio = np.ones(len(orden), dtype=bool)
+    cambio[1:] = ((codigos[1:] != codigos[:-1]) | (desacople_ord[1:] != desacople_ord[:-1])
+                  | (central_ord[1:] != central_ord[:-1]) | (unix_ord[1:] - unix_ord[:-1] > gap_maximo))
+
+    inicios = np.flatnonzero(cambio)
+    finales = np.append(inicios[1:], len(orden)) - 1
+
+    return pd.DataFrame({
+        'barra_transmision': np.asarray(barras_unicas, dtype=object)[codigos[inicios]],
+        'inicio_unix': unix_ord[inicios],
+        'fin_unix': unix_ord[finales],
+        'desacople_bool': desacople_ord[inicios],
+        'central_referencia': central_ord[inicios],
+        'lecturas': finales - inicios + 1,
+        'primera': orden[inicios]
+    })
+
+def crear_tablas(engine_in):
+    "crea desacople_intervalos y desacople_estado si no existen"
+    metadata_desacople.create_all(engine_in, checkfirst=True)
+
+def _leer_estado(session_in):
+    return {fila.barra_transmision: dict(fila._mapping) for fila in session_in.execute(select(estado_desacople))}
+
+def _guardar_estado(session_in, estados):
+    "reemplaza el estado de las barras entregadas"
+    if not estados:
+        return
+    session_in.execute(delete(estado_desacople).where(estado_desacople.c.barra_transmision.in_(list(estados))))
+    session_in.execute(estado_desacople.insert(), list(estados.values()))
+
+def _estado_final(df_tramos, filas):
+    "estado de cada barra a partir de su ultimo tramo y la ultima lectura (filas: DataFrame del lote)"
+    ultimos = df_tramos.groupby('barra_transmision', sort=False).tail(1)
+    ultimo_id = filas.groupby('barra_transmision')['id_tracking'].max()
+    return {fila.barra_transmision: {
+        'barra_transmision': fila.barra_transmision,
+        'ultimo_id': int(ultimo_id[fila.barra_transmision]),
+        'ultimo_unix': int(fila.fin_unix),
+        'desacople_bool': bool(fila.desacople_bool),
+        'central_referencia': fila.central_referencia,
+        'inicio_abierto': int(fila.inicio_unix) if fila.desacople_bool else None
+    } for fila in ultimos.itertuples()}
+
+def _insertar_tramos(session_in, df_tramos):
+    "inserta los tramos de desacople del DataFrame"
+    desacoples = df_tramos[df_tramos['desacople_bool']]
+    if desacoples.empty:
+        return 0
+    session_in.execute(intervalos_desacople.insert(), [
+        {'barra_transmision': fila.barra_transmision, 'inicio_unix': int(fila.inicio_unix), 'fin_unix': int(fila.fin_unix),
+         'central_referencia': fila.central_referencia, 'lecturas': int(fila.lecturas)}
+        for fila in desacoples.itertuples()])
+    return len(desacoples)
+
+def reconstruir_barras(session_in, barras_transmision, gap_maximo=GAP_MAXIMO):
+    """
+    Vuelve a calcular todos los tramos de las barras desde cmg_tiempo_real (incluido el tramo archivado en Parquet).
+    Se usa cuando llegan lecturas anteriores a la ultima procesada (backfill) o al reconstruir el indice.
+
+    Returns:
+        int: tramos de desacople insertados.
+    """
+    barras_transmision = list(barras_transmision)
+    filas = cn.query_filas_rango(session_in, 0, 2 ** 31 - 1, cn.CmgTiempoReal, barras_transmision)
+    if filas is None:
+        raise RuntimeError(f"Could not read cmg_tiempo_real for {barras_transmision}")
+
+    session_in.execute(delete(intervalos_desacople).where(intervalos_desacople.c.barra_transmision.in_(barras_transmision)))
+    session_in.execute(delete(estado_desacople).where(estado_desacople.c.barra_transmision.in_(barras_transmision)))
+    if not filas:
+        return 0
+
+    df = pd.DataFrame(filas)
+    df_tramos = tramos(df['barra_transmision'], df['unix_time'], df['desacople_bool'], df['central_referencia'], gap_maximo)
+    insertados = _insertar_tramos(session_in, df_tramos)
+    _guardar_estado(session_in, _estado_final(df_tramos, df))
+    return insertados
+
+def actualizar_indice(session_in, tamano_lote=TAMANO_LOTE, completa=False, gap_maximo=GAP_MAXIMO):
+    """
+    Actualizacion incremental del indice con las lecturas de cmg_tiempo_real con id_tracking mayor a la marca de
+    agua (el mayor ultimo_id de desacople_estado). Cada lote se confirma en su propia transaccion.
+
+    Para cada barra la ultima lectura procesada se antepone al lote, por lo que un tramo de desacople que sigue
+    abierto se extiende (UPDATE de fin_unix y lecturas) en vez de duplicarse. Si el lote trae lecturas de una barra
+    con unix_time anterior o igual a su ultima lectura procesada (backfill), la barra se reconstruye completa.
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): sesión con lectura de cmg_tiempo_real y escritura de las tablas
+            del indice (primario).
+        tamano_lote (int): lecturas por consulta.
+        completa (bool): borra el indice y lo reconstruye desde cero.
+        gap_maximo (int): ver tramos.
+
+    Returns:
+        dict: lecturas, tramos_nuevos, tramos_extendidos y barras_reconstruidas.
+    """
+    resumen = {'lecturas': 0, 'tramos_nuevos': 0, 'tramos_extendidos': 0, 'barras_reconstruidas': []}
+
+    if completa:
+        # por barra y no por id: asi se incluyen los meses ya archivados en Parquet
+        session_in.execute(delete(intervalos_desacople))
+        session_in.execute(delete(estado_desacople))
+        barras = [barra for barra, in session_in.execute(select([cn.CmgTiempoReal.barra_transmision]).distinct())]
+        for barra in barras:
+            resumen['tramos_nuevos'] += reconstruir_barras(session_in, [barra], gap_maximo)
+            session_in.commit()
+        resumen['barras_reconstruidas'].extend(barras)
+
+    estado = _leer_estado(session_in)
+    marca_agua = max((fila['ultimo_id'] for fila in estado.values()), default=0)
+
+    while True:
+        filas = cn.query_filas_desde_id(session_in, cn.CmgTiempoReal, marca_agua, tamano_lote)
+        if filas is None:
+            raise RuntimeError("Could not read cmg_tiempo_real")
+        if not filas:
+            break
+
+        df = pd.DataFrame(filas)
+        marca_agua = int(df['id_tracking'].max())
+        resumen['lecturas'] += len(df)
+
+        # barras con lecturas fuera de orden: se reconstruyen completas
+        ultimo_unix = df['barra_transmision'].map({barra: fila['ultimo_unix'] for barra, fila in estado.items()})
+        fuera_de_orden = sorted(df.loc[df['unix_time'] <= ultimo_unix, 'barra_transmision'].unique())
+        if fuera_de_orden:
+            resumen['tramos_nuevos'] += reconstruir_barras(session_in, fuera_de_orden, gap_maximo)
+            resumen['barras_reconstruidas'].extend(fuera_de_orden)
+            df = df[~df['barra_transmision'].isin(fuera_de_orden)]
+
+        if not df.empty:
+            # ultima lectura procesada de cada barra como primera fila (id_tracking -1) para continuar su tramo
+            previas = pd.DataFrame([{'id_tracking': -1, 'barra_transmision': barra, 'unix_time': fila['ultimo_unix'],
+                                     'desacople_bool': fila['desacople_bool'], 'central_referencia': fila['central_referencia']}
+                                    for barra, fila in estado.items() if barra in set(df['barra_transmision'])],
+                                   columns=['id_tracking', 'barra_transmision', 'unix_time', 'desacople_bool', 'central_referencia'])
+            lote = pd.concat([previas, df[previas.columns]], ignore_index=True)
+            df_tramos = tramos(lote['barra_transmision'], lote['unix_time'], lote['desacople_bool'],
+                               lote['central_referencia'], gap_maximo)
+
+            continua = lote['id_tracking'].to_numpy()[df_tramos['primera'].to_numpy()] == -1
+            for fila in df_tramos[continua & df_tramos['desacople_bool'].to_numpy()].itertuples():
+                inicio_abierto = estado[fila.barra_transmision]['inicio_abierto']
+                session_in.execute(update(intervalos_desacople).where(and_(
+                    intervalos_desacople.c.barra_transmision == fila.barra_transmision,
+                    intervalos_desacople.c.inicio_unix == inicio_abierto)).values(
+                    fin_unix=int(fila.fin_unix), lecturas=intervalos_desacople.c.lecturas + int(fila.lecturas) - 1))
+                resumen['tramos_extendidos'] += 1
+
+            resumen['tramos_nuevos'] += _insertar_tramos(session_in, df_tramos[~continua])
+
+            # el tramo que continua conserva su inicio original
+            nuevo_estado = _estado_final(df_tramos, lote[lote['id_tracking'] >= 0])
+            for barra, fila in nuevo_estado.items():
+                ultimo_tramo = df_tramos[df_tramos['barra_transmision'] == barra].iloc[-1]
+                if fila['desacople_bool'] and lote['id_tracking'].iat[int(ultimo_tramo['primera'])] == -1:
+                    fila['inicio_abierto'] = estado[barra]['inicio_abierto']
+            _guardar_estado(session_in, nuevo_estado)
+            estado.update(nuevo_estado)
+
+        # estado de las barras reconstruidas para el lote siguiente
+        estado.update(_leer_estado(session_in))
+        session_in.commit()
+
+        if len(filas) < tamano_lote:
+            break
+
+    return resumen
+
+@medir
+def query_intervalos_desacople(session_in, barras_transmision, unix_time_inicio, unix_time_fin):
+    """
+    Tramos de desacople que se solapan con [unix_time_inicio, unix_time_fin] (inicio <= fin del rango y fin >= inicio
+    del rango). Usa los indices (barra_transmision, inicio_unix) / (barra_transmision, fin_unix).
+
+    Args:
+        session_in (sqlalchemy.orm.session.Session): SQLAlchemy Session object.
+        barras_transmision (list of str): barras a consultar.
+        unix_time_inicio (int): unix_time inicial del rango.
+        unix_time_fin (int): unix_time final del rango.
+
+    Returns:
+        dict: columnas COLUMNAS_INTERVALOS como listas, ordenadas por barra e inicio, o None si ocurre un error.
+    """
+    try:
+        query = select([getattr(intervalos_desacople.c, columna) for columna in COLUMNAS_INTERVALOS]).where(
+            intervalos_desacople.c.barra_transmision.in_(list(barras_transmision))).where(
+            intervalos_desacople.c.inicio_unix <= unix_time_fin).where(
+            intervalos_desacople.c.fin_unix >= unix_time_inicio).order_by(
+            asc(intervalos_desacople.c.barra_transmision), asc(intervalos_desacople.c.inicio_unix))
+        rows = session_in.execute(query).fetchall()
+        columnas = list(zip(*rows)) if rows else [[]] * len(COLUMNAS_INTERVALOS)
+        return {columna: list(valores) for columna, valores in zip(COLUMNAS_INTERVALOS, columnas)}
+
+    except Exception as e:
+        logging.error(f"Error while getting desacople intervals: {e}")
+        return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Indice incremental de intervalos de desacople por barra')
+    parser.add_argument('--intervalo', type=int, default=0, help='segundos entre actualizaciones; 0 actualiza una vez')
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='lecturas por consulta')
+    parser.add_argument('--completa', action='store_true', help='reconstruye el indice desde cero')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    host = os.environ.get("MYSQL_HOST")
+    database = os.environ.get("MYSQL_DATABASE")
+    user = os.environ.get("MYSQL_USER")
+    password = os.environ.get("MYSQL_USER_PASSWORD")
+    port = os.environ.get("MYSQL_PORT")
+
+    # el indice se escribe en el primario
+    router, _ = cn.establecer_router(database, user, password, host, port, verbose=True)
+    crear_tablas(router.primario)
+
+    completa = args.completa
+    while True:
+        try:
+            with router.session_escritura() as session:
+                print(actualizar_indice(session, tamano_lote=args.lote, completa=completa))
+            completa = False
+        except Exception as exception:
+            logging.error(f"Error while updating desacople index: {exception}")
+        if not args.intervalo:
+            break
+        time.sleep(args.intervalo)
+
+    router.dispose()
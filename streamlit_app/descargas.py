@@ -0,0 +1,221 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Artefactos de descarga (CSV / Parquet) de cmg_ponderado y cmg_tiempo_real por barra, compartidos por
+todas las sesiones. Cada artefacto se construye una sola vez por (tabla, barra, inicio, marca de agua) y se guarda en
+disco; el archivo se reconstruye solo cuando avanza la marca de agua. En cmg_ponderado la marca es el fin de la ultima
+hora cerrada con datos de la barra: la hora en curso no se incluye porque el scheduler actualiza en su lugar el
+cmg_ponderado de esa hora y el artefacto congelaria un valor parcial. En cmg_tiempo_real la marca sigue a la ultima
+lectura, que no se modifica. Servir una descarga es leer bytes del disco: sin consultas ni pandas por usuario.
+
+El directorio se puede reemplazar con la variable de entorno DESCARGAS_DASHBOARD.
+
+Uso:
+    servicio = ServicioDescargas(router)
+    datos = servicio.obtener('cmg_ponderado', barra, unix_inicio, marca_agua(store, 'cmg_ponderado', barra, unixtime))
+"""
+
+import os
+import re
+import io
+import logging
+import tempfile
+import threading
+
+import pandas as pd
+
+import connection as cn
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+# directorio de los artefactos, fuera del repositorio
+RUTA_DESCARGAS = os.environ.get('DESCARGAS_DASHBOARD', os.path.join(tempfile.gettempdir(), 'descargas_dashboard'))
+
+# columnas de cada tabla en el archivo descargado (cmg_ponderado sin id, como la descarga original)
+TABLAS = {
+    'cmg_ponderado': (cn.CmgPonderado, ['barra_transmision', 'timestamp', 'unix_time', 'cmg_ponderado']),
+    'cmg_tiempo_real': (cn.CmgTiempoReal, cn.CmgTiempoReal.__table__.columns.keys()),
+}
+
+# formato -> mime
+FORMATOS = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+# archivos en disco; al superarse se borran los menos usados
+MAX_ARTEFACTOS = 400
+
+SEGUNDOS_HORA = 3600
+
+#########################################################################
+##############                Classes                 ###################
+#########################################################################
+
+class ServicioDescargas:
+    """
+    Construye y sirve los artefactos de descarga. Thread safe: dos sesiones que piden el mismo artefacto esperan una
+    sola consulta; los archivos se escriben de forma atomica, por lo que varios procesos pueden compartir el directorio.
+    """
+    def __init__(self, router, directorio=RUTA_DESCARGAS, max_artefactos=MAX_ARTEFACTOS):
+        self.router = router
+        self.directorio = directorio
+        self.max_artefactos = max_artefactos
+        self._lock = threading.Lock()
+        self._locks_llave = {}
+        os.makedirs(directorio, exist_ok=True)
+
+    def ruta(self, tabla, barra, unix_inicio, marca, formato):
+        "archivo del artefacto; la barra se normaliza para usarla como nombre de archivo"
+        return os.path.join(self.directorio, f'{self._prefijo(tabla, barra, unix_inicio)}{int(marca)}.{formato}')
+
+    def obtener(self, tabla, barra, unix_inicio, marca, formato='csv'):
+        """
+        Bytes del artefacto, construyendolo si no existe.
+
+        Args:
+            tabla (str): 'cmg_ponderado' o 'cmg_tiempo_real'.
+            barra (str): barra_transmision.
+            unix_inicio (int): unix_time inicial (inclusive).
+            marca (int): marca de agua (ver marca_agua); se incluyen las lecturas con unix_time menor a la marca.
+            formato (str, optional): 'csv' o 'parquet'. Por defecto es 'csv'.
+
+        Returns:
+            bytes o None: contenido del archivo, o None si la consulta falla.
+        """
+        if tabla not in TABLAS or formato not in FORMATOS:
+            raise ValueError(f"invalid artifact: {tabla} / {formato}")
+
+        ruta = self.ruta(tabla, barra, unix_inicio, marca, formato)
+        datos = self._leer(ruta)
+        if datos is not None:
+            return datos
+
+        with self._lock_llave((tabla, barra, unix_inicio, marca)):
+            # otra sesion pudo construirlo mientras se esperaba el lock
+            datos = self._leer(ruta)
+            if datos is not None:
+                return datos
+            if not self.construir(tabla, barra, unix_inicio, marca):
+                return None
+        return self._leer(ruta)
+
+    def construir(self, tabla, barra, unix_inicio, marca):
+        """
+        Consulta una vez las filas de la barra y escribe el CSV y el Parquet del artefacto. Borra los artefactos de
+        marcas anteriores de la misma (tabla, barra, inicio).
+
+        Returns:
+            bool: True si se escribieron los archivos.
+        """
+        modelo, columnas = TABLAS[tabla]
+        filas = self.router.ejecutar_rango(cn.query_filas_rango, unix_inicio, marca - 1, modelo, [barra])
+        if filas is None:
+            logging.error(f"Error while building download {tabla} {barra}: query failed")
+            return False
+
+        df = pd.DataFrame(filas, columns=columnas)
+        contenidos = {'csv': df.to_csv().encode('utf-8')}
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        contenidos['parquet'] = buffer.getvalue()
+
+        try:
+            for formato, contenido in contenidos.items():
+                self._escribir(self.ruta(tabla, barra, unix_inicio, marca, formato), contenido)
+        except OSError as exception:
+            logging.error(f"Error while writing download {tabla} {barra}: {exception}")
+            return False
+
+        self._purgar(self._prefijo(tabla, barra, unix_inicio), int(marca))
+        return True
+
+    def _prefijo(self, tabla, barra, unix_inicio):
+        return f"{tabla}__{re.sub(r'[^A-Za-z0-9_.-]', '_', barra)}__{int(unix_inicio)}__"
+
+    def _lock_llave(self, llave):
+        with self._lock:
+            return self._locks_llave.setdefault(llave, threading.Lock())
+
+    def _leer(self, ruta):
+        try:
+            with open(ruta, 'rb') as file:
+                datos = file.read()
+        except FileNotFoundError:
+            return None
+        except OSError as exception:
+            logging.error(f"Error while reading download {ruta}: {exception}")
+            return None
+        # la fecha de acceso ordena la purga
+        try:
+            os.utime(ruta)
+        except OSError:
+            pass
+        return datos
+
+    def _escribir(self, ruta, contenido):
+        temporal = f'{ruta}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temporal, 'wb') as file:
+            file.write(contenido)
+        os.replace(temporal, ruta)
+
+    def _purgar(self, prefijo, marca):
+        "borra las marcas anteriores del prefijo y, sobre max_artefactos, los archivos menos usados"
+        try:
+            archivos = [nombre for nombre in os.listdir(self.directorio) if not nombre.endswith('.tmp')]
+        except OSError as exception:
+            logging.error(f"Error while listing {self.directorio}: {exception}")
+            return
+
+        borrar = [nombre for nombre in archivos if nombre.startswith(prefijo) and
+                  nombre[len(prefijo):].split('.')[0].isdigit() and int(nombre[len(prefijo):].split('.')[0]) < marca]
+        vigentes = [nombre for nombre in archivos if nombre not in borrar]
+        if len(vigentes) > self.max_artefactos:
+            vigentes.sort(key=lambda nombre: self._mtime(os.path.join(self.directorio, nombre)))
+            borrar += vigentes[:len(vigentes) - self.max_artefactos]
+
+        with self._lock:
+            for llave in [llave for llave in self._locks_llave if llave[3] < marca and
+                          self._prefijo(*llave[:3]) == prefijo]:
+                del self._locks_llave[llave]
+
+        for nombre in borrar:
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+            except OSError:
+                pass
+
+    @staticmethod
+    def _mtime(ruta):
+        try:
+            return os.path.getmtime(ruta)
+        except OSError:
+            return 0
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def marca_agua(store, tabla, barra, unixtime):
+    """
+    Marca de agua (exclusiva) del artefacto de la barra segun el store de series. En cmg_ponderado es el fin de la
+    ultima hora cerrada con datos: el final de la hora de la ultima lectura, o el inicio de la hora actual si esa hora
+    sigue en curso, porque el scheduler reemplaza su valor. Las lecturas de cmg_tiempo_real no se modifican, por lo que
+    la marca incluye la ultima lectura. Sin datos en el store es el inicio de la hora actual.
+
+    Args:
+        store (TimeSeriesStore): store de series compartido.
+        tabla (str): 'cmg_ponderado' o 'cmg_tiempo_real'.
+        barra (str): barra_transmision.
+        unixtime (int): unix_time actual.
+
+    Returns:
+        int: marca de agua.
+    """
+    hora_actual = int(unixtime) - int(unixtime) % SEGUNDOS_HORA
+    unix_times = store.ventana(tabla, barra)['unix_time']
+    if not len(unix_times):
+        return hora_actual
+    ultimo = int(unix_times.max())
+    if tabla != 'cmg_ponderado':
+        return ultimo + 1
+    return min(ultimo - ultimo % SEGUNDOS_HORA + SEGUNDOS_HORA, hora_actual)
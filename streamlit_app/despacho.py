@@ -0,0 +1,165 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Backtest de despacho. Alinea el historial de parametros de la tabla central (as-of por fecha_registro)
+con el cmg_ponderado horario de la barra de cada central y calcula, de forma vectorizada, las horas en que la central
+habria estado GENERANDO (cmg_ponderado >= costo operacional vigente), el margen obtenido y la cantidad de
+encendidos / apagados. Los parametros se pueden reemplazar por valores hipoteticos.
+"""
+
+import numpy as np
+import pandas as pd
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+ZONA_HORARIA = 'America/Santiago'
+
+PARAMETROS = ('porcentaje_brent', 'tasa_proveedor', 'factor_motor', 'tasa_central', 'margen_garantia')
+
+COLUMNAS_RESUMEN = ['central', 'barra_transmision', 'horas', 'horas_generando', 'fraccion_generando', 'margen_total',
+                    'margen_por_hora_generando', 'encendidos', 'apagados', 'costo_operacional_medio', 'coincidencia_real']
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def unix_hora_chile(fechas, formato=None):
+    """
+    Convierte fechas en hora de Chile sin zona (strings con `formato`, datetime o datetime64) a unix_time de forma
+    vectorizada, independiente de la zona horaria del servidor. Las horas inexistentes por cambio de horario se
+    desplazan hacia adelante y las ambiguas se toman como horario de invierno.
+    """
+    fechas = pd.to_datetime(pd.Series(fechas, dtype=object), format=formato)
+    fechas = fechas.dt.tz_localize(ZONA_HORARIA, ambiguous=np.zeros(len(fechas), dtype=bool), nonexistent='shift_forward')
+    return (fechas.dt.tz_convert('UTC').dt.tz_localize(None) - pd.Timestamp('1970-01-01')).dt.total_seconds().to_numpy(dtype=np.int64)
+
+def unix_fecha_registro(fechas_registro):
+    "convierte fecha_registro de la tabla central ('%d.%m.%y %H:%M:%S', hora de Chile) a unix_time"
+    return unix_hora_chile(fechas_registro, '%d.%m.%y %H:%M:%S')
+
+def costo_operacional_vigente(historial, indices, parametros=None):
+    """
+    Costo operacional vigente en cada hora.
+
+    Args:
+        historial (dict): columnas de query_historial_central de una central (arreglos numpy).
+        indices (np.ndarray): indice del registro vigente en cada hora (-1 si no hay registro previo).
+        parametros (dict, optional): parametro -> valor hipotetico. Si se entrega, el costo operacional se recalcula
+            con la formula usando el precio brent historico y los parametros historicos no reemplazados.
+
+    Returns:
+        np.ndarray: costo operacional por hora (NaN en horas sin registro vigente).
+    """
+    validos = indices >= 0
+    seguros = np.where(validos, indices, 0)
+
+    if not parametros:
+        co = historial['costo_operacional'][seguros]
+    else:
+        valores = {parametro: np.full(len(indices), float(parametros[parametro])) if parametro in parametros
+                   else historial[parametro][seguros] for parametro in PARAMETROS}
+        co = ((valores['porcentaje_brent'] * historial['precio_brent'][seguros]) + valores['tasa_proveedor']) \
+            * valores['factor_motor'] + valores['tasa_central'] + valores['margen_garantia']
+
+    return np.where(validos, co, np.nan)
+
+def simular_central(historial, unix_horas, cmg_horas, parametros=None):
+    """
+    Despacho hora a hora de una central.
+
+    Args:
+        historial (dict): columnas de la central (arreglos numpy ordenados por 'unix_time').
+        unix_horas (np.ndarray): unix_time de cada hora de cmg_ponderado, ordenado.
+        cmg_horas (np.ndarray): cmg_ponderado de cada hora.
+        parametros (dict, optional): parametros hipoteticos (ver costo_operacional_vigente).
+
+    Returns:
+        dict: arreglos por hora: costo_operacional, generando, margen y generando_real (estado registrado vigente).
+    """
+    indices = np.searchsorted(historial['unix_time'], unix_horas, side='right') - 1
+    co = costo_operacional_vigente(historial, indices, parametros)
+
+    # NaN >= x es False: sin registro vigente la central no despacha
+    generando = cmg_horas >= co
+    margen = np.where(generando, cmg_horas - co, 0.0)
+    generando_real = np.where(indices >= 0, historial['generando'][np.where(indices >= 0, indices, 0)], False)
+
+    return {'costo_operacional': co, 'generando': generando, 'margen': margen, 'generando_real': generando_real}
+
+def resumir(nombre, barra, unix_horas, resultado):
+    "fila de resumen de la simulacion de una central"
+    generando = resultado['generando']
+    cambios = np.diff(generando.astype(np.int8))
+    horas = len(unix_horas)
+    horas_generando = int(generando.sum())
+    margen_total = float(resultado['margen'].sum())
+
+    return {
+        'central': nombre,
+        'barra_transmision': barra,
+        'horas': horas,
+        'horas_generando': horas_generando,
+        'fraccion_generando': horas_generando / horas if horas else 0.0,
+        'margen_total': margen_total,
+        'margen_por_hora_generando': margen_total / horas_generando if horas_generando else 0.0,
+        'encendidos': int((cambios == 1).sum()),
+        'apagados': int((cambios == -1).sum()),
+        'costo_operacional_medio': float(np.nanmean(resultado['costo_operacional'])) if np.any(~np.isnan(resultado['costo_operacional'])) else np.nan,
+        'coincidencia_real': float((generando == resultado['generando_real']).mean()) if horas else np.nan
+    }
+
+def backtest(historial_central, cmg_ponderado, centrales, parametros=None, detalle=False):
+    """
+    Backtest de despacho de varias centrales.
+
+    Args:
+        historial_central (dict): salida de query_historial_central (listas por columna, todas las centrales).
+        cmg_ponderado (dict): salida de query_cmg_ponderado_rango (listas por columna, todas las barras).
+        centrales (dict): nombre de central -> barra_transmision.
+        parametros (dict, optional): parametros hipoteticos comunes a todas las centrales, o
+            nombre de central -> parametros hipoteticos de esa central.
+        detalle (bool): si es True tambien retorna el resultado hora a hora.
+
+    Returns:
+        pd.DataFrame: resumen por central (COLUMNAS_RESUMEN), o (resumen, detalle) si detalle es True.
+    """
+    nombres_hist = np.asarray(historial_central['nombre'], dtype=object)
+    unix_hist = unix_fecha_registro(historial_central['fecha_registro'])
+    columnas_hist = {columna: np.asarray(historial_central[columna], dtype=np.float64)
+                     for columna in PARAMETROS + ('precio_brent', 'costo_operacional')}
+    columnas_hist['generando'] = np.asarray(historial_central['generando'], dtype=bool)
+
+    barras_cmg = np.asarray(cmg_ponderado['barra_transmision'], dtype=object)
+    unix_cmg = np.asarray(cmg_ponderado['unix_time'], dtype=np.int64)
+    valores_cmg = np.asarray(cmg_ponderado['cmg'], dtype=np.float64)
+
+    por_central = bool(parametros) and set(parametros) <= set(centrales)
+
+    filas, partes = [], []
+    for nombre, barra in centrales.items():
+        mascara_hist = nombres_hist == nombre
+        orden_hist = np.argsort(unix_hist[mascara_hist], kind='stable')
+        historial = {columna: valores[mascara_hist][orden_hist] for columna, valores in columnas_hist.items()}
+        historial['unix_time'] = unix_hist[mascara_hist][orden_hist]
+
+        mascara_cmg = barras_cmg == barra
+        orden_cmg = np.argsort(unix_cmg[mascara_cmg], kind='stable')
+        unix_horas = unix_cmg[mascara_cmg][orden_cmg]
+        cmg_horas = valores_cmg[mascara_cmg][orden_cmg]
+
+        parametros_central = parametros.get(nombre) if por_central else parametros
+        resultado = simular_central(historial, unix_horas, cmg_horas, parametros_central)
+        filas.append(resumir(nombre, barra, unix_horas, resultado))
+
+        if detalle:
+            partes.append(pd.DataFrame({'central': nombre, 'unix_time': unix_horas, 'cmg_ponderado': cmg_horas, **resultado}))
+
+    resumen = pd.DataFrame(filas, columns=COLUMNAS_RESUMEN)
+    if not detalle:
+        return resumen
+
+    detalle_df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(
+        columns=['central', 'unix_time', 'cmg_ponderado', 'costo_operacional', 'generando', 'margen', 'generando_real'])
+    return resumen, detalle_df
@@ -0,0 +1,160 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Motor de escenarios de costo operacional. Evalua una grilla de combinaciones de parametros de la central
+(miles a cientos de miles) contra el historial de precio brent y la serie de cmg_ponderado, de forma vectorizada con
+numpy y sin escrituras en la base de datos.
+
+    Costo Operacional = ((Porcentaje Brent * Precio Brent) + Tasa Proveedor) * Factor Motor + Tasa Central + Margen de Garantia
+
+Para cada combinacion se calcula el costo operacional con el ultimo precio brent y, hora a hora, si la central
+hubiese estado en merito (cmg_ponderado >= costo operacional de esa hora).
+"""
+
+import numpy as np
+import pandas as pd
+
+from despacho import unix_fecha_registro, unix_hora_chile
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+PARAMETROS = ('porcentaje_brent', 'tasa_proveedor', 'factor_motor', 'tasa_central', 'margen_garantia')
+
+ETIQUETAS = {
+    'Porcentaje Brent': 'porcentaje_brent',
+    'Tasa Proveedor': 'tasa_proveedor',
+    'Factor Motor': 'factor_motor',
+    'Tasa Central': 'tasa_central',
+    'Margen Garantia': 'margen_garantia'
+}
+
+MAX_COMBINACIONES = 500000
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def grilla_parametros(valores):
+    """
+    Producto cartesiano de los valores de cada parametro.
+
+    Args:
+        valores (dict): parametro -> valor fijo o lista de valores. Deben estar todos los de PARAMETROS.
+
+    Returns:
+        dict: parametro -> np.ndarray de largo N (numero de combinaciones).
+
+    Raises:
+        ValueError: si la grilla supera MAX_COMBINACIONES.
+    """
+    ejes = [np.atleast_1d(np.asarray(valores[parametro], dtype=np.float64)) for parametro in PARAMETROS]
+    combinaciones = int(np.prod([len(eje) for eje in ejes]))
+    if combinaciones > MAX_COMBINACIONES:
+        raise ValueError(f"Scenario grid has {combinaciones} combinations, maximum is {MAX_COMBINACIONES}")
+
+    mallas = np.meshgrid(*ejes, indexing='ij')
+    return {parametro: malla.ravel() for parametro, malla in zip(PARAMETROS, mallas)}
+
+def coeficientes(grilla):
+    """
+    El costo operacional es lineal en el precio brent: CO = a * precio_brent + b, con
+    a = porcentaje_brent * factor_motor y b = tasa_proveedor * factor_motor + tasa_central + margen_garantia.
+    """
+    a = grilla['porcentaje_brent'] * grilla['factor_motor']
+    b = grilla['tasa_proveedor'] * grilla['factor_motor'] + grilla['tasa_central'] + grilla['margen_garantia']
+    return a, b
+
+def costo_operacional(grilla, precio_brent):
+    "costo operacional de cada combinacion para un precio brent"
+    a, b = coeficientes(grilla)
+    return a * precio_brent + b
+
+def precio_brent_por_hora(unix_registros, precios, unix_horas):
+    """
+    Precio brent vigente en cada hora (as-of): el del ultimo registro de la central en o antes de la hora.
+    Las horas anteriores al primer registro usan el primer precio; sin registros el precio es NaN.
+    """
+    if len(precios) == 0:
+        return np.full(len(unix_horas), np.nan)
+    indices = np.searchsorted(unix_registros, unix_horas, side='right') - 1
+    return precios[np.clip(indices, 0, None)]
+
+def _merito_precio_constante(co, cmg):
+    "horas en merito y margen por combinacion cuando el costo operacional no cambia en la ventana"
+    cmg_ordenado = np.sort(cmg)
+    # sumas de cola: suma de los cmg >= cmg_ordenado[i]
+    suma_cola = np.concatenate([np.cumsum(cmg_ordenado[::-1])[::-1], [0.0]])
+    inicio = np.searchsorted(cmg_ordenado, co, side='left')
+    horas = len(cmg_ordenado) - inicio
+    margen = suma_cola[inicio] - horas * co
+    return horas, margen
+
+def _merito_por_precio(a, b, brent, cmg):
+    """
+    horas en merito y margen por combinacion con precio brent variable. El precio brent es constante por tramos
+    (cambia a lo mas una vez por registro de la central), por lo que se agrupan las horas por precio y cada grupo
+    se resuelve con _merito_precio_constante: O(precios distintos x N log T) en vez de O(N x T).
+    """
+    horas = np.zeros(len(a), dtype=np.int64)
+    margen = np.zeros(len(a), dtype=np.float64)
+    for precio in np.unique(brent[~np.isnan(brent)]):
+        horas_grupo, margen_grupo = _merito_precio_constante(a * precio + b, cmg[brent == precio])
+        horas += horas_grupo
+        margen += margen_grupo
+    return horas, margen
+
+def evaluar_escenarios(grilla, unix_registros, precios_brent, unix_horas, cmg_horas):
+    """
+    Evalua todas las combinaciones de la grilla sobre la serie de cmg.
+
+    Args:
+        grilla (dict): salida de grilla_parametros.
+        unix_registros (np.ndarray): unix_time de los registros de precio brent, ordenados.
+        precios_brent (np.ndarray): precio brent de cada registro.
+        unix_horas (np.ndarray): unix_time de cada hora de cmg_ponderado.
+        cmg_horas (np.ndarray): cmg_ponderado de cada hora.
+
+    Returns:
+        pd.DataFrame: parametros de cada combinacion, costo_operacional (con el ultimo precio brent),
+        horas_en_merito, fraccion_merito y margen_en_merito (suma de cmg - CO en las horas en merito).
+    """
+    cmg_horas = np.asarray(cmg_horas, dtype=np.float64)
+    a, b = coeficientes(grilla)
+    brent = precio_brent_por_hora(np.asarray(unix_registros), np.asarray(precios_brent, dtype=np.float64), np.asarray(unix_horas))
+
+    if len(cmg_horas) and np.all(brent == brent[0]):
+        horas, margen = _merito_precio_constante(a * brent[0] + b, cmg_horas)
+    else:
+        horas, margen = _merito_por_precio(a, b, brent, cmg_horas)
+
+    resultado = pd.DataFrame(grilla)
+    resultado['costo_operacional'] = a * precios_brent[-1] + b if len(precios_brent) else np.nan
+    resultado['horas_en_merito'] = horas
+    resultado['fraccion_merito'] = horas / len(cmg_horas) if len(cmg_horas) else 0.0
+    resultado['margen_en_merito'] = margen
+    return resultado
+
+def simular(valores, historial_brent, cmg_ponderado):
+    """
+    Orquesta la simulacion a partir de las salidas del data layer.
+
+    Args:
+        valores (dict): parametro -> valor fijo o lista de valores.
+        historial_brent (dict): salida de query_historial_precio_brent.
+        cmg_ponderado (pd.DataFrame): columnas timestamp (hora de Chile sin zona) y cmg_ponderado de una barra.
+
+    Returns:
+        pd.DataFrame: salida de evaluar_escenarios.
+    """
+    validos = [i for i, precio in enumerate(historial_brent['precio_brent']) if not np.isnan(precio)]
+    unix_registros = unix_fecha_registro([historial_brent['fecha_registro'][i] for i in validos])
+    precios = np.array([historial_brent['precio_brent'][i] for i in validos], dtype=np.float64)
+    orden = np.argsort(unix_registros, kind='stable')
+
+    # timestamp y fecha_registro son hora de Chile: se convierten con las mismas reglas que el backtest de despacho
+    unix_horas = unix_hora_chile(cmg_ponderado['timestamp'])
+
+    return evaluar_escenarios(grilla_parametros(valores), unix_registros[orden], precios[orden], unix_horas,
+                              cmg_ponderado['cmg_ponderado'].to_numpy(dtype=np.float64))
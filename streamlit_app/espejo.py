@@ -0,0 +1,253 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Espejo analitico local (SQLite) de cmg_tiempo_real y cmg_ponderado. Un job de replicacion incremental
+copia las filas nuevas de MySQL por marca de agua de id y vuelve a copiar la ventana reciente (filas que el scheduler
+actualiza en su lugar). EngineRouter.ejecutar_rango lee del espejo los rangos historicos, por lo que las descargas,
+graficos de varios meses y backtests no compiten con la ingesta en el primario.
+
+Uso:
+    python espejo.py --ruta espejo_analitico.db --intervalo 300
+    python espejo.py --completa   # vuelve a copiar todo (ej: despues de un backfill)
+"""
+
+import os
+import time
+import logging
+import argparse
+
+from sqlalchemy import create_engine, event, select, func
+from sqlalchemy import MetaData, Table, Column, Integer, String, Index
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import connection as cn
+from instrumentation import instrumentar_engine
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+# se puede reemplazar con la variable de entorno ESPEJO_ANALITICO. Por defecto queda en el directorio de datos del
+# usuario ($XDG_DATA_HOME o ~/.local/share), junto al archivo Parquet y fuera del repositorio
+RUTA_ESPEJO = os.environ.get('ESPEJO_ANALITICO', os.path.join(
+    os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share'), 'dashboard_cmg', 'espejo_analitico.db'))
+
+TABLAS = {'cmg_tiempo_real': cn.CmgTiempoReal, 'cmg_ponderado': cn.CmgPonderado}
+
+# horas que se siguen leyendo de MySQL y se vuelven a copiar en cada replicacion: el scheduler reescribe
+# cmg_ponderado de la hora en curso y las lecturas recientes pueden corregirse
+HORAS_RECIENTES = 48
+
+TAMANO_LOTE = 50000
+
+metadata_espejo = MetaData()
+
+# marca de agua de cada tabla: ultimo id copiado y unix_time del inicio de la ultima replicacion completa
+estado_espejo = Table(
+    'espejo_estado', metadata_espejo,
+    Column('tabla', String(64), primary_key=True),
+    Column('ultimo_id', Integer, nullable=False),
+    Column('sincronizado_unix', Integer, nullable=False)
+)
+
+#########################################################################
+##############                Classes                 ###################
+#########################################################################
+
+class EspejoAnalitico:
+    """
+    Base SQLite local con el mismo esquema de cmg_tiempo_real y cmg_ponderado e indices por (barra_transmision,
+    unix_time). Las funciones query_* de connection.py se ejecutan sin cambios sobre sus sesiones.
+
+    El espejo es confiable para unix_time < corte(): filas replicadas que ya no se actualizan en MySQL.
+    """
+    def __init__(self, ruta=RUTA_ESPEJO, horas_recientes=HORAS_RECIENTES):
+        self.ruta = ruta
+        self.horas_recientes = horas_recientes
+        os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+        self.engine = create_engine(f'sqlite:///{ruta}', connect_args={'check_same_thread': False})
+
+        # WAL: la app puede leer mientras el job replica
+        @event.listens_for(self.engine, "connect")
+        def configurar_sqlite(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+        instrumentar_engine(self.engine, 'espejo')
+        self._session = sessionmaker(bind=self.engine)
+        self._crear_esquema()
+
+    def _crear_esquema(self):
+        "crea las tablas espejo, sus indices y la tabla de estado si no existen"
+        for nombre, modelo in TABLAS.items():
+            modelo.__table__.create(self.engine, checkfirst=True)
+            Index(f'ix_{nombre}_barra_unix', modelo.barra_transmision, modelo.unix_time).create(self.engine, checkfirst=True)
+        metadata_espejo.create_all(self.engine)
+
+    def session(self):
+        "sesión contra el espejo"
+        return self._session()
+
+    def estado(self):
+        "tabla -> {'ultimo_id', 'sincronizado_unix'} de las tablas ya replicadas"
+        try:
+            with self.engine.connect() as conn:
+                return {row.tabla: {'ultimo_id': row.ultimo_id, 'sincronizado_unix': row.sincronizado_unix}
+                        for row in conn.execute(select(estado_espejo))}
+        except Exception as exception:
+            logging.error(f"Error while reading analytical mirror state: {exception}")
+            return {}
+
+    def corte(self):
+        """
+        unix_time desde el cual las lecturas deben ir a MySQL: HORAS_RECIENTES antes de la replicacion mas antigua
+        entre las tablas. None si alguna tabla aun no se replica.
+        """
+        estado = self.estado()
+        if any(tabla not in estado for tabla in TABLAS):
+            return None
+        return min(fila['sincronizado_unix'] for fila in estado.values()) - self.horas_recientes * 3600
+
+    def _upsert(self, conn, modelo, filas):
+        "inserta o reemplaza filas por clave primaria"
+        if not filas:
+            return
+        sentencia = sqlite_insert(modelo.__table__)
+        pk = list(modelo.__table__.primary_key.columns)[0].name
+        sentencia = sentencia.on_conflict_do_update(
+            index_elements=[pk],
+            set_={columna: sentencia.excluded[columna] for columna in modelo.__table__.columns.keys() if columna != pk})
+        conn.execute(sentencia, filas)
+
+    def replicar(self, session_origen, tamano_lote=TAMANO_LOTE, completa=False):
+        """
+        Replicacion incremental de todas las tablas desde MySQL.
+
+        Para cada tabla copia las filas con id mayor a la marca de agua, en lotes de `tamano_lote` (cada lote en su
+        propia transaccion, por lo que una replicacion interrumpida se retoma desde el ultimo lote), y luego vuelve
+        a copiar las filas con unix_time dentro de HORAS_RECIENTES de la replicacion anterior, que MySQL pudo haber
+        actualizado en su lugar.
+
+        Args:
+            session_origen (sqlalchemy.orm.session.Session): sesión contra MySQL (idealmente la réplica de lectura).
+            tamano_lote (int): filas por consulta y por transaccion del espejo.
+            completa (bool): ignora las marcas de agua y vuelve a copiar todas las filas.
+
+        Returns:
+            dict: tabla -> {'nuevas', 'recientes', 'ultimo_id'}.
+
+        Raises:
+            RuntimeError: si falla una consulta a MySQL. Las marcas de agua quedan en el ultimo lote confirmado.
+        """
+        estado = {} if completa else self.estado()
+        resumen = {}
+
+        for nombre, modelo in TABLAS.items():
+            inicio = int(time.time())
+            anterior = estado.get(nombre)
+            ultimo_id = anterior['ultimo_id'] if anterior else 0
+            pk = list(modelo.__table__.primary_key.columns)[0].name
+            nuevas = 0
+
+            while True:
+                filas = cn.query_filas_desde_id(session_origen, modelo, ultimo_id, tamano_lote)
+                if filas is None:
+                    raise RuntimeError(f"Could not read {nombre} from MySQL")
+                if not filas:
+                    break
+                ultimo_id = filas[-1][pk]
+                with self.engine.begin() as conn:
+                    self._upsert(conn, modelo, filas)
+                    self._guardar_estado(conn, nombre, ultimo_id, anterior['sincronizado_unix'] if anterior else 0)
+                nuevas += len(filas)
+                if len(filas) < tamano_lote:
+                    break
+
+            recientes = 0
+            if anterior:
+                filas = cn.query_filas_rango(session_origen, anterior['sincronizado_unix'] - self.horas_recientes * 3600,
+                                             2 ** 31 - 1, modelo)
+                if filas is None:
+                    raise RuntimeError(f"Could not read recent {nombre} rows from MySQL")
+                recientes = len(filas)
+            else:
+                filas = []
+
+            with self.engine.begin() as conn:
+                self._upsert(conn, modelo, filas)
+                self._guardar_estado(conn, nombre, ultimo_id, inicio)
+
+            resumen[nombre] = {'nuevas': nuevas, 'recientes': recientes, 'ultimo_id': ultimo_id}
+
+        return resumen
+
+    def _guardar_estado(self, conn, tabla, ultimo_id, sincronizado_unix):
+        sentencia = sqlite_insert(estado_espejo).values(tabla=tabla, ultimo_id=ultimo_id, sincronizado_unix=sincronizado_unix)
+        conn.execute(sentencia.on_conflict_do_update(
+            index_elements=['tabla'], set_={'ultimo_id': ultimo_id, 'sincronizado_unix': sincronizado_unix}))
+
+    def filas(self):
+        "cantidad de filas por tabla espejo"
+        with self.engine.connect() as conn:
+            return {nombre: conn.execute(select(func.count()).select_from(modelo.__table__)).scalar()
+                    for nombre, modelo in TABLAS.items()}
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def abrir_espejo(ruta=RUTA_ESPEJO, horas_recientes=HORAS_RECIENTES):
+    """
+    Abre el espejo analitico si el job de replicacion ya lo creo.
+
+    Returns:
+        EspejoAnalitico, o None si el archivo no existe o no se puede abrir.
+    """
+    if not ruta or not os.path.exists(ruta):
+        return None
+    try:
+        return EspejoAnalitico(ruta, horas_recientes=horas_recientes)
+    except Exception as exception:
+        logging.error(f"Error while opening analytical mirror {ruta}: {exception}")
+        return None
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Replicacion incremental de cmg_tiempo_real y cmg_ponderado al espejo analitico')
+    parser.add_argument('--ruta', default=RUTA_ESPEJO, help='archivo SQLite del espejo')
+    parser.add_argument('--intervalo', type=int, default=0, help='segundos entre replicaciones; 0 replica una vez')
+    parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='filas por consulta')
+    parser.add_argument('--completa', action='store_true', help='vuelve a copiar todas las filas')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    host = os.environ.get("MYSQL_HOST")
+    database = os.environ.get("MYSQL_DATABASE")
+    user = os.environ.get("MYSQL_USER")
+    password = os.environ.get("MYSQL_USER_PASSWORD")
+    port = os.environ.get("MYSQL_PORT")
+
+    # la replicacion lee de la réplica si existe, para no cargar el primario
+    router, _ = cn.establecer_router(database, user, password, host, port, host_lectura=os.environ.get("MYSQL_READ_HOST"),
+                                     port_lectura=os.environ.get("MYSQL_READ_PORT"), verbose=True)
+    espejo = EspejoAnalitico(args.ruta)
+
+    completa = args.completa
+    while True:
+        try:
+            with router.session_lectura() as session:
+                print(espejo.replicar(session, tamano_lote=args.lote, completa=completa))
+            completa = False
+        except Exception as exception:
+            logging.error(f"Error while replicating analytical mirror: {exception}")
+        if not args.intervalo:
+            break
+        time.sleep(args.intervalo)
+
+    router.dispose()
+    espejo.engine.dispose()
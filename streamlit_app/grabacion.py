@@ -0,0 +1,276 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Grabacion y reproduccion de la I/O del dashboard. En modo 'grabar' se guarda el resultado y la duracion
+de cada llamada a las funciones de consulta de connection.py y desacople.py y a los clientes HTTP de api.py
+(get_central, get_cmg_programados, insert_central / insert_centrales y coordinador.cl) en un archivo local (pickle comprimido con gzip, un registro por
+llamada). En modo 'reproducir' esas funciones no tocan MySQL ni la red: entregan los resultados grabados, con su
+latencia original o sin latencia, para perfilar y medir la app completa de forma determinista.
+
+Las funciones se reemplazan en sus modulos (connection / desacople / api), por lo que tambien quedan cubiertas las llamadas
+internas (ej: backtest_despacho -> query_cmg_ponderado_rango, get_cmg_programados_centrales -> get_cmg_programados).
+Al reproducir, cada llamada se busca por funcion y argumentos (sin la sesion); si los argumentos no coinciden (ej:
+unix_time calculado con la hora actual) se entrega el siguiente resultado grabado de la misma funcion, en orden.
+
+En app.py se activa con variables de entorno:
+    GRABACION_MODO=grabar|reproducir  GRABACION_RUTA=/tmp/grabacion.pkl.gz  GRABACION_LATENCIA=original|ninguna
+
+Uso:
+    python grabacion.py /tmp/grabacion.pkl.gz
+"""
+
+import os
+import sys
+import gzip
+import time
+import pickle
+import tempfile
+import inspect
+import hashlib
+import logging
+import argparse
+import threading
+import functools
+from collections import defaultdict
+
+import pandas as pd
+
+import connection as cn
+import desacople
+import api
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+# archivo de grabacion, fuera del repositorio
+RUTA_GRABACION = os.environ.get('GRABACION_RUTA', os.path.join(tempfile.gettempdir(), 'grabacion_dashboard.pkl.gz'))
+
+# funciones de lectura de connection.py (las decoradas con medir); las escrituras no se graban
+PREFIJOS_CONNECTION = ('query_', 'get_', 'evaluar_', 'backtest_')
+
+# insert_centrales es el envio del formulario de Atributos: al reproducir no debe llegar a la API
+FUNCIONES_API = ['get_central', 'get_cmg_programados', 'insert_central', 'insert_centrales', 'get_json_costo_marginal_online']
+
+# consultas del indice de intervalos de desacople (tabla propia, fuera de connection.py)
+FUNCIONES_DESACOPLE = ['query_intervalos_desacople']
+
+# argumentos que no forman parte de la llave de una llamada
+ARGUMENTOS_IGNORADOS = {'session_in', 'session_http'}
+
+_grabacion_activa = None
+_lock_instalacion = threading.Lock()
+
+#########################################################################
+##############                Classes                 ###################
+#########################################################################
+
+class Grabacion:
+    """
+    Archivo de grabacion abierto en modo 'grabar' (agrega registros) o 'reproducir' (los carga en memoria).
+
+    Cada registro es un dict con funcion, llave (hash de los argumentos), duracion en segundos y resultado.
+    """
+    def __init__(self, ruta, modo, latencia=True):
+        if modo not in ('grabar', 'reproducir'):
+            raise ValueError(f"invalid mode: {modo}")
+        self.ruta = ruta
+        self.modo = modo
+        self.latencia = latencia
+        self.originales = {}
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._por_llave = {}
+        self._por_funcion = defaultdict(list)
+        self._posiciones = defaultdict(int)
+
+        if modo == 'grabar':
+            # cada flush deja el archivo legible hasta el ultimo registro aunque el proceso termine sin cerrarlo
+            self._archivo = gzip.open(ruta, 'ab')
+        else:
+            for registro in leer_grabacion(ruta):
+                self._por_funcion[registro['funcion']].append(registro)
+                self._por_llave.setdefault((registro['funcion'], registro['llave']), []).append(registro)
+
+    def envolver(self, nombre, funcion):
+        "version de funcion que graba o reproduce sus llamadas"
+        codigo = inspect.unwrap(funcion).__code__
+        parametros = codigo.co_varnames[:codigo.co_argcount]
+
+        @functools.wraps(funcion)
+        def wrapper(*args, **kwargs):
+            llave = llave_llamada(parametros, args, kwargs)
+            if self.modo == 'reproducir':
+                return self.reproducir(nombre, llave)
+            inicio = time.perf_counter()
+            resultado = funcion(*args, **kwargs)
+            self.grabar(nombre, llave, time.perf_counter() - inicio, resultado)
+            return resultado
+
+        return wrapper
+
+    def grabar(self, nombre, llave, duracion, resultado):
+        try:
+            datos = pickle.dumps({'funcion': nombre, 'llave': llave, 'duracion': duracion, 'resultado': resultado},
+                                 protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as exception:
+            logging.error(f"Error while recording {nombre}: {exception}")
+            return
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.write(datos)
+                self._archivo.flush()
+
+    def reproducir(self, nombre, llave):
+        """
+        Resultado grabado de la llamada. Con la misma llave se entregan en orden los resultados grabados (el ultimo se
+        repite); sin coincidencia se entrega el siguiente resultado de la funcion, en ciclo. None si la funcion no
+        tiene registros.
+        """
+        with self._lock:
+            registros = self._por_llave.get((nombre, llave))
+            if registros:
+                registro = registros.pop(0) if len(registros) > 1 else registros[0]
+            elif self._por_funcion.get(nombre):
+                registros = self._por_funcion[nombre]
+                registro = registros[self._posiciones[nombre] % len(registros)]
+                self._posiciones[nombre] += 1
+            else:
+                logging.error(f"No recorded calls for {nombre}")
+                return None
+
+        if self.latencia:
+            time.sleep(registro['duracion'])
+        return registro['resultado']
+
+    def cerrar(self):
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def llave_llamada(parametros, args, kwargs):
+    """
+    Hash de los argumentos de una llamada, sin las sesiones de base de datos / HTTP (ARGUMENTOS_IGNORADOS).
+
+    Args:
+        parametros (tuple): nombres de los parametros posicionales de la funcion.
+
+    Returns:
+        str o None: hash, o None si los argumentos no se pueden serializar.
+    """
+    argumentos = [(nombre, valor) for nombre, valor in zip(parametros, args) if nombre not in ARGUMENTOS_IGNORADOS]
+    argumentos += sorted((nombre, valor) for nombre, valor in kwargs.items() if nombre not in ARGUMENTOS_IGNORADOS)
+    try:
+        return hashlib.sha1(pickle.dumps(argumentos, protocol=4)).hexdigest()
+    except Exception:
+        return None
+
+def funciones_connection():
+    "nombres de las funciones de lectura de connection.py que se graban"
+    return sorted(nombre for nombre in dir(cn) if nombre.startswith(PREFIJOS_CONNECTION)
+                  and callable(getattr(cn, nombre)) and hasattr(getattr(cn, nombre), '__wrapped__'))
+
+def instalar(ruta=RUTA_GRABACION, modo='grabar', latencia=True):
+    """
+    Reemplaza las funciones de connection.py, desacople.py y api.py por versiones que graban o reproducen sus llamadas. Solo una
+    grabacion puede estar activa por proceso: si ya hay una, se retorna esa.
+
+    Args:
+        ruta (str): archivo de grabacion.
+        modo (str): 'grabar' o 'reproducir'.
+        latencia (bool, optional): al reproducir, espera la duracion original de cada llamada. Por defecto es True.
+
+    Returns:
+        Grabacion: grabacion activa.
+    """
+    global _grabacion_activa
+    with _lock_instalacion:
+        if _grabacion_activa is not None:
+            return _grabacion_activa
+
+        grabacion = Grabacion(ruta, modo, latencia)
+        for modulo, nombres in ((cn, funciones_connection()), (desacople, FUNCIONES_DESACOPLE), (api, FUNCIONES_API)):
+            for nombre in nombres:
+                funcion = getattr(modulo, nombre)
+                grabacion.originales[(modulo, nombre)] = funcion
+                setattr(modulo, nombre, grabacion.envolver(nombre, funcion))
+        _grabacion_activa = grabacion
+        logging.info(f"I/O {modo} active: {ruta} ({len(grabacion.originales)} functions)")
+        return grabacion
+
+def desinstalar():
+    "restaura las funciones originales y cierra el archivo de la grabacion activa"
+    global _grabacion_activa
+    with _lock_instalacion:
+        if _grabacion_activa is None:
+            return
+        for (modulo, nombre), funcion in _grabacion_activa.originales.items():
+            setattr(modulo, nombre, funcion)
+        _grabacion_activa.cerrar()
+        _grabacion_activa = None
+
+def instalar_desde_entorno():
+    """
+    Activa la grabacion segun GRABACION_MODO / GRABACION_RUTA / GRABACION_LATENCIA. Sin GRABACION_MODO no hace nada.
+
+    Returns:
+        Grabacion o None: grabacion activa.
+    """
+    modo = os.environ.get('GRABACION_MODO')
+    if not modo:
+        return None
+    try:
+        return instalar(RUTA_GRABACION, modo, latencia=os.environ.get('GRABACION_LATENCIA', 'original') != 'ninguna')
+    except Exception as exception:
+        logging.error(f"Error while installing I/O {modo}: {exception}")
+        return None
+
+def reproduciendo():
+    "True si la grabacion activa esta en modo 'reproducir'"
+    return _grabacion_activa is not None and _grabacion_activa.modo == 'reproducir'
+
+def leer_grabacion(ruta):
+    """
+    Registros de un archivo de grabacion, en orden. Un registro final incompleto (proceso interrumpido) se descarta.
+
+    Returns:
+        list: dicts con funcion, llave, duracion y resultado.
+    """
+    registros = []
+    with gzip.open(ruta, 'rb') as file:
+        while True:
+            try:
+                registros.append(pickle.load(file))
+            except EOFError:
+                break
+            except Exception as exception:
+                logging.error(f"Error while reading {ruta}, truncated after {len(registros)} records: {exception}")
+                break
+    return registros
+
+def resumen_grabacion(ruta):
+    "llamadas, duracion total y media por funcion de un archivo de grabacion"
+    registros = leer_grabacion(ruta)
+    if not registros:
+        return pd.DataFrame(columns=['funcion', 'llamadas', 'total_ms', 'media_ms'])
+    df = pd.DataFrame({'funcion': [r['funcion'] for r in registros], 'ms': [r['duracion'] * 1000 for r in registros]})
+    return (df.groupby('funcion')['ms'].agg(llamadas='size', total_ms='sum', media_ms='mean').round(2)
+            .sort_values('total_ms', ascending=False).reset_index())
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description='Resumen de un archivo de grabacion de I/O del dashboard')
+    parser.add_argument('ruta', nargs='?', default=RUTA_GRABACION)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.ruta):
+        print(f'{args.ruta} does not exist')
+        sys.exit(1)
+    print(f'{args.ruta}: {os.path.getsize(args.ruta) / 1e6:.2f} MB')
+    print(resumen_grabacion(args.ruta).to_string(index=False))
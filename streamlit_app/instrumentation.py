@@ -0,0 +1,563 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Instrumentacion de latencia del data layer. Registra tiempo, filas y bytes de cada funcion de
+connection.py, tiempo por sentencia SQL y espera de checkout del pool en un registro de histogramas en memoria,
+exportable en formato de texto de Prometheus.
+
+Incluye trazas por rerun: cada etapa (consultas, requests HTTP, procesamiento con pandas, graficos) se registra como
+un span anidado con su inicio y duracion relativos al inicio de la traza. Las trazas terminadas se agregan a un
+archivo JSONL (un span por linea) y se pueden ver como waterfall en el panel de diagnostico.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import bisect
+import tempfile
+import logging
+import functools
+import threading
+import contextlib
+import contextvars
+
+from sqlalchemy import event
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+BUCKETS_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BUCKETS_FILAS = (1, 10, 100, 1000, 10000, 100000, 1000000)
+BUCKETS_BYTES = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+# filas usadas para estimar el tamaño de listas grandes
+MUESTRA_BYTES = 100
+
+# archivo JSONL de trazas, fuera del repositorio; se puede reemplazar con la variable de entorno TRAZAS_DASHBOARD
+# ('' desactiva la escritura)
+RUTA_TRAZAS = os.environ.get('TRAZAS_DASHBOARD', os.path.join(tempfile.gettempdir(), 'trazas_dashboard.jsonl'))
+
+# al superar este tamaño el archivo de trazas se rota a <ruta>.1
+MAX_BYTES_TRAZAS = 50 * 1024 * 1024
+
+#########################################################################
+##############                Classes                 ###################
+#########################################################################
+
+class Histograma:
+    """
+    Histograma acumulativo de buckets fijos, compatible con el tipo 'histogram' de Prometheus.
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observar(self, valor):
+        "agrega una observacion"
+        self.counts[bisect.bisect_left(self.buckets, valor)] += 1
+        self.count += 1
+        self.sum += valor
+        self.max = max(self.max, valor)
+
+    def percentil(self, q):
+        """
+        Estima el percentil q (0-1) interpolando linealmente dentro del bucket que lo contiene.
+        """
+        if self.count == 0:
+            return 0.0
+
+        objetivo = q * self.count
+        acumulado = 0
+        for i, count in enumerate(self.counts):
+            if acumulado + count >= objetivo and count > 0:
+                inferior = self.buckets[i - 1] if i > 0 else 0.0
+                superior = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(inferior + (superior - inferior) * (objetivo - acumulado) / count, self.max)
+            acumulado += count
+        return self.max
+
+class Registro:
+    """
+    Registro thread-safe de histogramas y contadores identificados por (nombre de metrica, etiquetas).
+    Es compartido por todas las sesiones de Streamlit del proceso.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas = {}
+        self._contadores = {}
+        self._ayuda = {}
+
+    def observar(self, metrica, etiquetas, valor, buckets=BUCKETS_SEGUNDOS, ayuda=''):
+        """
+        Agrega una observacion al histograma de la metrica.
+
+        Args:
+            metrica (str): nombre de la metrica (ej: 'data_layer_seconds').
+            etiquetas (dict): etiquetas de la serie (ej: {'funcion': 'query_central_table'}).
+            valor (float): valor observado.
+            buckets (tuple): limites superiores de los buckets, solo se usan al crear la serie.
+            ayuda (str): descripcion de la metrica para el export de Prometheus.
+        """
+        llave = (metrica, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            histograma = self._histogramas.get(llave)
+            if histograma is None:
+                histograma = self._histogramas[llave] = Histograma(buckets)
+                self._ayuda.setdefault(metrica, ayuda)
+            histograma.observar(valor)
+
+    def incrementar(self, metrica, etiquetas, valor=1, ayuda=''):
+        """
+        Suma `valor` al contador de la metrica (ej: errores). Por convencion de Prometheus el nombre termina en _total.
+        """
+        llave = (metrica, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[llave] = self._contadores.get(llave, 0) + valor
+            self._ayuda.setdefault(metrica, ayuda)
+
+    def reset(self):
+        "elimina todas las series"
+        with self._lock:
+            self._histogramas.clear()
+            self._contadores.clear()
+
+    def resumen(self):
+        """
+        Retorna una lista de diccionarios con count, sum, mean, p50, p95 y max por serie, ordenada por tiempo total.
+        Los contadores solo tienen count y sum (el valor del contador).
+        """
+        with self._lock:
+            items = list(self._histogramas.items())
+            contadores = list(self._contadores.items())
+
+        filas = []
+        for (metrica, etiquetas), histograma in items:
+            filas.append({
+                'metrica': metrica,
+                'etiquetas': ', '.join(f'{k}={v}' for k, v in etiquetas),
+                'count': histograma.count,
+                'sum': round(histograma.sum, 6),
+                'mean': round(histograma.sum / histograma.count, 6) if histograma.count else 0.0,
+                'p50': round(histograma.percentil(0.50), 6),
+                'p95': round(histograma.percentil(0.95), 6),
+                'max': round(histograma.max, 6)
+            })
+        for (metrica, etiquetas), valor in contadores:
+            filas.append({'metrica': metrica, 'etiquetas': ', '.join(f'{k}={v}' for k, v in etiquetas), 'count': valor,
+                          'sum': valor, 'mean': None, 'p50': None, 'p95': None, 'max': None})
+        filas.sort(key=lambda fila: (fila['metrica'], -fila['sum']))
+        return filas
+
+    def prometheus(self):
+        """
+        Exporta todas las series en formato de texto de Prometheus (exposition format 0.0.4).
+        """
+        with self._lock:
+            items = sorted(self._histogramas.items())
+            contadores = sorted(self._contadores.items())
+            ayuda = dict(self._ayuda)
+
+        lineas = []
+        metrica_actual = None
+        for (metrica, etiquetas), histograma in items:
+            if metrica != metrica_actual:
+                lineas.append(f'# HELP {metrica} {ayuda.get(metrica, "")}')
+                lineas.append(f'# TYPE {metrica} histogram')
+                metrica_actual = metrica
+
+            base = ','.join(f'{k}="{_escapar(v)}"' for k, v in etiquetas)
+            separador = ',' if base else ''
+            acumulado = 0
+            for limite, count in zip(histograma.buckets, histograma.counts):
+                acumulado += count
+                lineas.append(f'{metrica}_bucket{{{base}{separador}le="{limite}"}} {acumulado}')
+            lineas.append(f'{metrica}_bucket{{{base}{separador}le="+Inf"}} {histograma.count}')
+            lineas.append(f'{metrica}_sum{{{base}}} {histograma.sum}')
+            lineas.append(f'{metrica}_count{{{base}}} {histograma.count}')
+
+        metrica_actual = None
+        for (metrica, etiquetas), valor in contadores:
+            if metrica != metrica_actual:
+                lineas.append(f'# HELP {metrica} {ayuda.get(metrica, "")}')
+                lineas.append(f'# TYPE {metrica} counter')
+                metrica_actual = metrica
+            base = ','.join(f'{k}="{_escapar(v)}"' for k, v in etiquetas)
+            lineas.append(f'{metrica}{{{base}}} {valor}')
+
+        return '\n'.join(lineas) + '\n'
+
+REGISTRO = Registro()
+
+class Traza:
+    """
+    Spans de una ejecucion (ej: un rerun de la pagina). Los tiempos se guardan en milisegundos relativos al inicio
+    de la traza. Los spans pueden venir de threads auxiliares (ver propagar), por lo que se agregan con un lock.
+    """
+    def __init__(self, nombre, ruta=RUTA_TRAZAS, **atributos):
+        self.id = uuid.uuid4().hex[:16]
+        self.nombre = nombre
+        self.ruta = ruta
+        self.atributos = atributos
+        self.inicio_unix = time.time()
+        self.inicio = time.perf_counter()
+        self.duracion_ms = None
+        self.estado = 'abierta'
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def ms(self, instante):
+        "milisegundos desde el inicio de la traza para un instante de time.perf_counter()"
+        return round((instante - self.inicio) * 1000, 3)
+
+    def agregar(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def terminar(self, estado='ok'):
+        """
+        Cierra la traza y agrega sus spans al archivo JSONL. Los spans se ordenan por inicio.
+        """
+        if self.duracion_ms is not None:
+            return self
+        self.duracion_ms = self.ms(time.perf_counter())
+        self.estado = estado
+        with self._lock:
+            self.spans.sort(key=lambda span: span['inicio_ms'])
+        if self.ruta:
+            try:
+                _escribir_traza(self)
+            except Exception as exception:
+                logging.error(f"Error while writing trace {self.id}: {exception}")
+        return self
+
+    def registros(self):
+        "lineas JSONL: una fila de la traza (span raiz) y una por span"
+        raiz = {'traza': self.id, 'span': self.id, 'padre': None, 'nombre': self.nombre, 'tipo': 'traza',
+                'inicio_unix': round(self.inicio_unix, 3), 'inicio_ms': 0.0, 'duracion_ms': self.duracion_ms,
+                'estado': self.estado, 'atributos': self.atributos}
+        return [raiz] + [{'traza': self.id, **span} for span in self.spans]
+
+_traza_actual = contextvars.ContextVar('traza_actual', default=None)
+_span_actual = contextvars.ContextVar('span_actual', default=None)
+_lock_archivo_trazas = threading.Lock()
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def _escapar(valor):
+    "escapa un valor de etiqueta para Prometheus"
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def contar_filas(resultado):
+    """
+    Cantidad de filas de un resultado del data layer (lista, DataFrame, fila o escalar).
+    """
+    if resultado is None or (isinstance(resultado, list) and not resultado):
+        return 0
+    if hasattr(resultado, 'shape') and len(getattr(resultado, 'shape', ())) == 2:
+        return int(resultado.shape[0])
+    if isinstance(resultado, list) and resultado and isinstance(resultado[0], (dict, list, tuple)):
+        return len(resultado)
+    return 1
+
+def estimar_bytes(resultado):
+    """
+    Estima los bytes en memoria de un resultado. Para listas grandes se extrapola desde una muestra.
+    """
+    if resultado is None:
+        return 0
+    if hasattr(resultado, 'memory_usage'):
+        return int(resultado.memory_usage(index=True, deep=True).sum())
+    if isinstance(resultado, list):
+        if not resultado:
+            return sys.getsizeof(resultado)
+        muestra = resultado[:MUESTRA_BYTES]
+        bytes_muestra = sum(_bytes_fila(fila) for fila in muestra)
+        return int(sys.getsizeof(resultado) + bytes_muestra * len(resultado) / len(muestra))
+    return _bytes_fila(resultado)
+
+def _bytes_fila(fila):
+    "bytes de una fila (dict, lista, tupla o escalar)"
+    if isinstance(fila, dict):
+        return sys.getsizeof(fila) + sum(sys.getsizeof(v) for v in fila.values())
+    if isinstance(fila, (list, tuple)):
+        return sys.getsizeof(fila) + sum(sys.getsizeof(v) for v in fila)
+    return sys.getsizeof(fila)
+
+def medir(funcion):
+    """
+    Decorador para funciones del data layer: registra tiempo de ejecucion, filas y bytes retornados, y errores.
+    Si hay una traza activa, la llamada tambien se registra como span de tipo 'db'.
+    """
+    nombre = funcion.__name__
+
+    @functools.wraps(funcion)
+    def wrapper(*args, **kwargs):
+        inicio = time.perf_counter()
+        estado = 'ok'
+        resultado = None
+        traza = _traza_actual.get()
+        padre = _span_actual.get()
+        id_span = _nuevo_id() if traza is not None else None
+        if traza is not None:
+            token_span = _span_actual.set(id_span)
+        try:
+            resultado = funcion(*args, **kwargs)
+            return resultado
+        except Exception:
+            estado = 'error'
+            raise
+        finally:
+            duracion = time.perf_counter() - inicio
+            if traza is not None:
+                _span_actual.reset(token_span)
+                traza.agregar(_span(traza, id_span, padre, nombre, 'db', inicio, duracion, estado,
+                                    {'filas': contar_filas(resultado)} if estado == 'ok' else {}))
+            try:
+                REGISTRO.observar('data_layer_seconds', {'funcion': nombre, 'estado': estado}, duracion,
+                                  ayuda='Tiempo de ejecucion de funciones del data layer')
+                if estado == 'ok':
+                    REGISTRO.observar('data_layer_rows', {'funcion': nombre}, contar_filas(resultado),
+                                      buckets=BUCKETS_FILAS, ayuda='Filas retornadas por funciones del data layer')
+                    REGISTRO.observar('data_layer_bytes', {'funcion': nombre}, estimar_bytes(resultado),
+                                      buckets=BUCKETS_BYTES, ayuda='Bytes retornados por funciones del data layer')
+            except Exception as exception:
+                logging.error(f"Error while recording metrics for {nombre}: {exception}")
+
+    return wrapper
+
+def instrumentar_engine(engine_in, nombre_engine='primario'):
+    """
+    Registra eventos de SQLAlchemy en el engine: tiempo por sentencia SQL (etiquetado por tipo de sentencia)
+    y tiempo de espera al obtener una conexion del pool.
+
+    Args:
+        engine_in: SQLAlchemy engine object.
+        nombre_engine (str): etiqueta del engine en las metricas (ej: 'primario', 'lectura').
+    """
+    @event.listens_for(engine_in, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('instrumentacion_inicio', []).append(time.perf_counter())
+
+    @event.listens_for(engine_in, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get('instrumentacion_inicio')
+        if not inicios:
+            return
+        inicio = inicios.pop()
+        duracion = time.perf_counter() - inicio
+        tipo = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'OTHER'
+        REGISTRO.observar('sql_statement_seconds', {'engine': nombre_engine, 'tipo': tipo}, duracion,
+                          ayuda='Tiempo de ejecucion por sentencia SQL')
+        traza = _traza_actual.get()
+        if traza is not None:
+            traza.agregar(_span(traza, _nuevo_id(), _span_actual.get(), f'{nombre_engine} {tipo}', 'sql', inicio, duracion,
+                                'ok', {'sql': statement[:200]}))
+
+    @event.listens_for(engine_in, "handle_error")
+    def handle_error(exception_context):
+        inicios = exception_context.connection.info.get('instrumentacion_inicio') if exception_context.connection is not None else None
+        if inicios:
+            inicios.pop()
+        REGISTRO.incrementar('sql_errors_total', {'engine': nombre_engine}, ayuda='Errores de ejecucion SQL')
+
+    # El pool no emite un evento previo al checkout, por lo que se envuelve su metodo connect para medir la espera
+    pool = engine_in.pool
+    connect_original = pool.connect
+
+    def connect_medido(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            return connect_original(*args, **kwargs)
+        finally:
+            REGISTRO.observar('pool_checkout_seconds', {'engine': nombre_engine}, time.perf_counter() - inicio,
+                              ayuda='Tiempo de espera para obtener una conexion del pool')
+
+    pool.connect = connect_medido
+
+#########################################################################
+###################             Trazas           ########################
+#########################################################################
+
+def _nuevo_id():
+    return uuid.uuid4().hex[:16]
+
+def _span(traza, id_span, padre, nombre, tipo, inicio, duracion, estado, atributos):
+    "registro de un span terminado"
+    return {'span': id_span, 'padre': padre or traza.id, 'nombre': nombre, 'tipo': tipo, 'inicio_ms': traza.ms(inicio),
+            'duracion_ms': round(duracion * 1000, 3), 'estado': estado, 'thread': threading.current_thread().name,
+            'atributos': atributos}
+
+def _escribir_traza(traza):
+    "agrega la traza al archivo JSONL, rotandolo si supera MAX_BYTES_TRAZAS"
+    lineas = ''.join(json.dumps(registro, default=str, ensure_ascii=False) + '\n' for registro in traza.registros())
+    with _lock_archivo_trazas:
+        if os.path.exists(traza.ruta) and os.path.getsize(traza.ruta) > MAX_BYTES_TRAZAS:
+            os.replace(traza.ruta, traza.ruta + '.1')
+        with open(traza.ruta, 'a', encoding='utf-8') as file:
+            file.write(lineas)
+
+def iniciar_traza(nombre, ruta=RUTA_TRAZAS, **atributos):
+    """
+    Inicia una traza en el contexto actual (thread del script de Streamlit). Si quedo una traza abierta en el mismo
+    contexto (ej: el rerun anterior termino con st.stop o st.rerun), se cierra con estado 'interrumpida'.
+
+    Args:
+        nombre (str): nombre de la traza (ej: 'rerun').
+        ruta (str): archivo JSONL; None o '' no escribe la traza.
+        **atributos: atributos de la traza (ej: pagina, sesion).
+
+    Returns:
+        Traza
+    """
+    anterior = _traza_actual.get()
+    if anterior is not None:
+        anterior.terminar('interrumpida')
+    traza = Traza(nombre, ruta=ruta, **atributos)
+    _traza_actual.set(traza)
+    _span_actual.set(None)
+    return traza
+
+def terminar_traza(estado='ok'):
+    """
+    Cierra la traza activa y la escribe en el archivo JSONL.
+
+    Returns:
+        Traza, o None si no habia una traza activa.
+    """
+    traza = _traza_actual.get()
+    if traza is None:
+        return None
+    _traza_actual.set(None)
+    _span_actual.set(None)
+    return traza.terminar(estado)
+
+def traza_actual():
+    "traza activa en el contexto actual, o None"
+    return _traza_actual.get()
+
+@contextlib.contextmanager
+def span(nombre, tipo='app', **atributos):
+    """
+    Registra el bloque como span hijo del span activo. Sin una traza activa no hace nada, por lo que se puede usar
+    en codigo compartido con el scheduler y los scripts.
+
+    Yields:
+        dict: atributos del span (se pueden agregar valores dentro del bloque), o None sin traza activa.
+    """
+    traza = _traza_actual.get()
+    if traza is None:
+        yield None
+        return
+
+    padre = _span_actual.get()
+    id_span = _nuevo_id()
+    token = _span_actual.set(id_span)
+    inicio = time.perf_counter()
+    estado = 'ok'
+    try:
+        yield atributos
+    except BaseException:
+        # st.stop / st.rerun se implementan con excepciones: el span se marca pero la excepcion sigue su curso
+        estado = 'error'
+        raise
+    finally:
+        _span_actual.reset(token)
+        traza.agregar(_span(traza, id_span, padre, nombre, tipo, inicio, time.perf_counter() - inicio, estado, atributos))
+
+def trazar(tipo='app', nombre=None):
+    """
+    Decorador que registra cada llamada como span (ver span).
+
+    Args:
+        tipo (str): categoria del span en el waterfall (ej: 'http', 'pandas', 'render').
+        nombre (str, optional): nombre del span. Por defecto el nombre de la funcion.
+    """
+    def decorador(funcion):
+        nombre_span = nombre or funcion.__name__
+
+        @functools.wraps(funcion)
+        def wrapper(*args, **kwargs):
+            if _traza_actual.get() is None:
+                return funcion(*args, **kwargs)
+            with span(nombre_span, tipo):
+                return funcion(*args, **kwargs)
+
+        return wrapper
+    return decorador
+
+def propagar(funcion):
+    """
+    Envuelve funcion para que se ejecute con la traza y el span activos al momento de envolverla. Necesario para
+    los threads de un ThreadPoolExecutor, que no heredan el contexto del thread que los crea.
+    """
+    contexto = contextvars.copy_context()
+
+    @functools.wraps(funcion)
+    def wrapper(*args, **kwargs):
+        # un Context no se puede usar en dos threads a la vez: cada llamada corre en su propia copia
+        return contexto.copy().run(funcion, *args, **kwargs)
+
+    return wrapper
+
+def waterfall(traza):
+    """
+    Filas del waterfall de una traza: un span por fila, en orden de inicio, con su profundidad de anidamiento.
+
+    Args:
+        traza (Traza): traza terminada.
+
+    Returns:
+        list of dict: nombre, etiqueta (nombre indentado por profundidad), tipo, inicio_ms, fin_ms, duracion_ms,
+        estado y thread.
+    """
+    padres = {span['span']: span['padre'] for span in traza.spans}
+
+    def profundidad(id_span):
+        nivel = 0
+        while padres.get(id_span) in padres:
+            id_span = padres[id_span]
+            nivel += 1
+        return nivel
+
+    filas = []
+    for orden, span in enumerate(traza.spans):
+        nivel = profundidad(span['span'])
+        filas.append({
+            'orden': orden,
+            'nombre': span['nombre'],
+            'etiqueta': f"{orden:03d} {'  ' * nivel}{span['nombre']}",
+            'tipo': span['tipo'],
+            'inicio_ms': span['inicio_ms'],
+            'fin_ms': round(span['inicio_ms'] + span['duracion_ms'], 3),
+            'duracion_ms': span['duracion_ms'],
+            'estado': span['estado'],
+            'thread': span['thread']
+        })
+    return filas
+
+def leer_trazas(ruta=RUTA_TRAZAS, ultimas=20):
+    """
+    Lee las ultimas trazas del archivo JSONL.
+
+    Returns:
+        dict: id de traza -> lista de registros (el primero es la raiz), en orden de escritura.
+    """
+    trazas = {}
+    if not ruta or not os.path.exists(ruta):
+        return trazas
+    with open(ruta, 'r', encoding='utf-8') as file:
+        for linea in file:
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue
+            trazas.setdefault(registro['traza'], []).append(registro)
+    return dict(list(trazas.items())[-ultimas:])
@@ -0,0 +1,144 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Etapas de procesamiento del dashboard (parseo de timestamps, merge central / cmg_ponderado y grafico). Se
+separan de app.py para poder medirlas de forma aislada en benchmark.py.
+"""
+
+from datetime import timedelta
+
+import pandas as pd
+
+from registro_centrales import CENTRALES, mapeo_barra_central
+from instrumentation import trazar, span
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+MAPEO_BARRA_CENTRAL = mapeo_barra_central(CENTRALES)
+
+COLUMNAS_MERGE = ['central', 'costo_operacional', 'generando', 'cmg_ponderado', 'fecha', 'hora', 'margen_garantia',
+                  'factor_motor', 'tasa_proveedor', 'porcentaje_brent', 'tasa_central', 'precio_brent',
+                  'fecha_referencia_brent']
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def nombre_central(barras, mapeo_barras=MAPEO_BARRA_CENTRAL):
+    "nombre de central de cada barra_transmision (las barras sin central se mantienen); conserva el dtype category"
+    return barras.map(lambda barra: mapeo_barras.get(barra, barra))
+
+@trazar('pandas')
+def preparar_cmg_ponderado(entries):
+    """
+    Deja la salida de query_cmg_ponderado_by_time en el formato del grafico y de la tabla ('timestamp' ya viene como
+    datetime desde el data layer).
+
+    Args:
+        entries (pd.DataFrame): salida de query_cmg_ponderado_by_time.
+
+    Returns:
+        pd.DataFrame: columnas barra_transmision, timestamp y cmg_ponderado.
+    """
+    return entries.drop(columns=['unix_time'])
+
+@trazar('pandas')
+def filtrar_modificaciones_recientes(df_central_mod, fecha_referencia, dias=4):
+    """
+    Selecciona nombre, costo_operacional y fecha_registro de las modificaciones externas de los ultimos `dias` dias.
+
+    Args:
+        df_central_mod (pd.DataFrame): salida de query_central_table_modifications.
+        fecha_referencia (datetime): fecha actual (con o sin zona horaria).
+        dias (int): ventana en dias. Por defecto 4.
+
+    Returns:
+        pd.DataFrame: modificaciones dentro de la ventana.
+    """
+    df_central_mod_co = df_central_mod.loc[:, ['nombre', 'costo_operacional', 'fecha_registro']]
+
+    # Filter out rows where the date is more than `dias` days ago
+    limite = fecha_referencia - timedelta(days=dias)
+    limite = limite.replace(tzinfo=None)
+
+    return df_central_mod_co[df_central_mod_co['fecha_registro'] > limite]
+
+def ultimo_cmg_ponderado(cmg_ponderado_96h, barra_transmision):
+    "ultimo cmg_ponderado de la barra, redondeado a 2 decimales"
+    cmg_barra = cmg_ponderado_96h[cmg_ponderado_96h['barra_transmision'] == barra_transmision]
+    return round(float(cmg_barra.iloc[-1]['cmg_ponderado']), 2)
+
+@trazar('pandas')
+def merge_central_cmg_ponderado(cmg_ponderado_96h, df_central, mapeo_barras=MAPEO_BARRA_CENTRAL):
+    """
+    Cruza los cambios de estado de la tabla central con el cmg_ponderado de la misma hora y central.
+
+    Args:
+        cmg_ponderado_96h (pd.DataFrame): salida de preparar_cmg_ponderado.
+        df_central (pd.DataFrame): salida de query_central_table.
+        mapeo_barras (dict): barra_transmision -> nombre de central.
+
+    Returns:
+        pd.DataFrame: columnas COLUMNAS_MERGE.
+    """
+    # Hacer merge entre df_central y cmg_ponderado, por central y hora de registro
+    cmg_ponderado = cmg_ponderado_96h.loc[:, ['barra_transmision', 'timestamp', 'cmg_ponderado']]
+    cmg_ponderado['central'] = nombre_central(cmg_ponderado['barra_transmision'], mapeo_barras)
+
+    df_central_to_merge = df_central.rename(columns={'nombre': 'central'})
+    df_central_to_merge['timestamp'] = df_central_to_merge['fecha_registro'].dt.floor('60min')
+
+    merged_df = pd.merge(cmg_ponderado, df_central_to_merge, on=['timestamp', 'central'], how='inner')
+    merged_df['fecha'] = merged_df['timestamp'].dt.strftime('%Y-%m-%d')
+    merged_df['hora'] = merged_df['timestamp'].dt.strftime('%H:%M:%S')
+    return merged_df[COLUMNAS_MERGE]
+
+@trazar('render')
+def render_grafico_cmg(cmg_ponderado_96h, costos_operacionales, lineas_costo_operacional):
+    """
+    Genera el grafico de cmg_ponderado por barra con lineas horizontales de costo operacional.
+
+    Args:
+        cmg_ponderado_96h (pd.DataFrame): datos a graficar (timestamp, cmg_ponderado, barra_transmision).
+        costos_operacionales (list of float): costos operacionales considerados en el limite del eje y.
+        lineas_costo_operacional (list of tuple): (valor, color, etiqueta) de cada linea horizontal a dibujar.
+
+    Returns:
+        matplotlib.figure.Figure: figura generada.
+    """
+    # seaborn y matplotlib solo se cargan cuando se dibuja el grafico
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+
+    # Create the Seaborn lineplot
+    figura = plt.figure(figsize=(10, 6))
+    with span('sns.lineplot', 'render'):
+        sns.lineplot(data=cmg_ponderado_96h, x="timestamp", y="cmg_ponderado", hue="barra_transmision", style="barra_transmision")
+
+    # Set y-axis limits
+    max_value = max(cmg_ponderado_96h["cmg_ponderado"].max(), *costos_operacionales)
+    margin = 2
+    plt.ylim(0, max_value + margin)
+
+    # add horizontal lines
+    for valor, color, etiqueta in lineas_costo_operacional:
+        plt.axhline(y=valor, color=color, linestyle='--', label=etiqueta)
+
+    # Move legend outside the plot
+    plt.legend(loc="upper left", bbox_to_anchor=(1, 1))
+
+    # Set plot title and labels
+    plt.xlabel("Fecha")
+    plt.ylabel("CMg")
+
+    return figura
+
+@trazar('pandas')
+def preparar_tabla_cmg_ponderado(cmg_ponderado_96h, mapeo_barras=MAPEO_BARRA_CENTRAL):
+    "formato de presentacion de la tabla de cmg_ponderado"
+    df = cmg_ponderado_96h.copy()
+    df['cmg_ponderado'] = df['cmg_ponderado'].round(2)
+    df['Central'] = nombre_central(df['barra_transmision'], mapeo_barras)
+    return df.rename(columns={'barra_transmision': 'Alimentador', 'timestamp': 'Fecha y Hora', 'cmg_ponderado': 'CMg Ponderado'})
@@ -0,0 +1,66 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Registro de centrales monitoreadas. Cada central define su nombre en la tabla central, la barra de
+transmision en cmg_tiempo_real / cmg_ponderado, el nombre de la barra en la API de costo marginal online y el nombre
+usado en la API flask. Agregar una central solo requiere una nueva entrada en centrales.json.
+"""
+
+import os
+import json
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+# se puede reemplazar con la variable de entorno CENTRALES_REGISTRO
+RUTA_REGISTRO = os.environ.get('CENTRALES_REGISTRO',
+                               os.path.join(os.path.dirname(os.path.abspath(__file__)), 'centrales.json'))
+
+CAMPOS_OBLIGATORIOS = ('nombre', 'barra_transmision', 'barra_online', 'nombre_api')
+
+# colores de las lineas de costo operacional cuando la central no define uno
+COLORES = ('r', 'b', 'g', 'm', 'c', 'y', 'k')
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def cargar_registro(ruta=RUTA_REGISTRO):
+    """
+    Lee y valida el registro de centrales.
+
+    Args:
+        ruta (str): ruta del archivo JSON con la lista de centrales.
+
+    Returns:
+        list of dict: centrales en el orden del archivo, con todos los campos de CAMPOS_OBLIGATORIOS y 'color'.
+
+    Raises:
+        ValueError: si falta un campo obligatorio o se repite un nombre o barra.
+    """
+    with open(ruta, encoding='utf-8') as archivo:
+        centrales = json.load(archivo)
+
+    nombres, barras = set(), set()
+    for i, central in enumerate(centrales):
+        faltantes = [campo for campo in CAMPOS_OBLIGATORIOS if not central.get(campo)]
+        if faltantes:
+            raise ValueError(f"Central {i} in {ruta} is missing {', '.join(faltantes)}")
+        if central['nombre'] in nombres or central['barra_transmision'] in barras:
+            raise ValueError(f"Duplicated central {central['nombre']} / {central['barra_transmision']} in {ruta}")
+        nombres.add(central['nombre'])
+        barras.add(central['barra_transmision'])
+        central.setdefault('color', COLORES[i % len(COLORES)])
+
+    return centrales
+
+def mapeo_barra_central(centrales):
+    "barra_transmision -> nombre de central"
+    return {central['barra_transmision']: central['nombre'] for central in centrales}
+
+def central_por_nombre(centrales, nombre):
+    "entrada del registro con el nombre indicado, o None"
+    return next((central for central in centrales if central['nombre'] == nombre), None)
+
+CENTRALES = cargar_registro()
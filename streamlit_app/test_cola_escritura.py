@@ -0,0 +1,31 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Pruebas de ColaEscritura (connection.py) contra una base SQLite: reescribir un lote ya escrito (reintento
+despues de un commit que el cliente no confirmo) no duplica filas de ninguna tabla.
+
+Uso:
+    python -m pytest -q test_cola_escritura.py
+"""
+
+from sqlalchemy import create_engine, select, func
+
+import connection as cn
+
+def test_lote_reintentado_no_duplica(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cola.db'}")
+    cn.Base.metadata.create_all(engine)
+    lote = [('tracking_coordinador', ['2026-10-19 10:00:00', 'RIO_1.zip', '2026-10-19 09:58:00', True]),
+            ('cmg_tiempo_real', ['CHARRUA__220', 2026, 10, 19, '10:00', 1_792_400_400, False, 80.0, 'CHARRUA__220']),
+            ('cmg_ponderado', ['CHARRUA__220', '2026-10-19 10:00:00', 1_792_400_400, 81.0])]
+
+    with cn.ColaEscritura(engine, intervalo_flush=0.05) as cola:
+        for _ in range(2):
+            for tabla, fila in lote:
+                cola.encolar(tabla, fila)
+            cola.vaciar()
+        assert cola.estado()['descartadas'] == 0
+
+    with engine.connect() as conn:
+        for modelo in (cn.TrackingCoordinador, cn.CmgTiempoReal, cn.CmgPonderado):
+            assert conn.execute(select([func.count()]).select_from(modelo.__table__)).scalar() == 1
@@ -0,0 +1,35 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Pruebas de la marca de agua de descargas.py: la hora en curso se excluye solo en cmg_ponderado; las
+lecturas de cmg_tiempo_real se incluyen hasta la ultima.
+
+Uso:
+    python -m pytest -q test_descargas.py
+"""
+
+import numpy as np
+
+from descargas import marca_agua
+
+HORA = 1_700_002_800
+
+class StoreFijo:
+    "store de series con los mismos unix_time para todas las tablas"
+    def __init__(self, unix_times):
+        self.unix_times = np.array(unix_times, dtype=np.int64)
+
+    def ventana(self, tabla, barra):
+        return {'unix_time': self.unix_times}
+
+def test_cmg_ponderado_excluye_hora_en_curso():
+    store = StoreFijo([HORA - 3600, HORA])
+    assert marca_agua(store, 'cmg_ponderado', 'CHARRUA__220', HORA + 1800) == HORA
+    assert marca_agua(store, 'cmg_ponderado', 'CHARRUA__220', HORA + 3600) == HORA + 3600
+
+def test_cmg_tiempo_real_incluye_ultima_lectura():
+    store = StoreFijo([HORA + 300, HORA + 1500])
+    assert marca_agua(store, 'cmg_tiempo_real', 'CHARRUA__220', HORA + 1800) == HORA + 1501
+
+def test_sin_datos():
+    assert marca_agua(StoreFijo([]), 'cmg_tiempo_real', 'CHARRUA__220', HORA + 1800) == HORA
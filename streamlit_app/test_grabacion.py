@@ -0,0 +1,64 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Pruebas de grabacion.py: en modo 'reproducir' ninguna llamada de la app (consultas de connection.py y
+desacople.py, clientes HTTP de api.py incluido el submit de Atributos) llega a la base de datos ni a la red.
+
+Uso:
+    python -m pytest -q test_grabacion.py
+"""
+
+import socket
+
+import pytest
+
+import connection as cn
+import desacople
+import api
+import grabacion
+
+class SesionProhibida:
+    "sesion de base de datos que falla ante cualquier uso"
+    def __getattr__(self, nombre):
+        raise AssertionError(f'database access during replay: {nombre}')
+
+@pytest.fixture
+def reproduccion(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'grabacion.pkl.gz')
+    registros = {
+        'insert_centrales': {'CENTRAL_1': {'status': 'ok'}},
+        'query_intervalos_desacople': {'barra_transmision': ['CHARRUA__220'], 'inicio_unix': [0], 'fin_unix': [900],
+                                       'central_referencia': ['CHARRUA__220'], 'lecturas': [2]},
+        'query_cmg_ponderado_desde_id': {'id': [1], 'barra_transmision': ['CHARRUA__220'], 'unix_time': [0], 'cmg': [10.0]},
+    }
+    grabador = grabacion.Grabacion(ruta, 'grabar')
+    for nombre, resultado in registros.items():
+        grabador.grabar(nombre, None, 0.0, resultado)
+    grabador.cerrar()
+
+    def conectar(*args, **kwargs):
+        raise AssertionError('network access during replay')
+    monkeypatch.setattr(socket.socket, 'connect', conectar)
+    monkeypatch.setattr(socket, 'create_connection', conectar)
+
+    grabacion.instalar(ruta, 'reproducir', latencia=False)
+    yield registros
+    grabacion.desinstalar()
+
+def test_reproducir_sin_red_ni_base_de_datos(reproduccion):
+    assert grabacion.reproduciendo()
+
+    respuestas = api.insert_centrales({'CENTRAL_1': {'margen_garantia': -25.0}}, 'editor', '127.0.0.1', 5000,
+                                      idempotency_key='llave')
+    assert respuestas == reproduccion['insert_centrales']
+
+    intervalos = desacople.query_intervalos_desacople(SesionProhibida(), ['CHARRUA__220'], 0, 3600)
+    assert intervalos == reproduccion['query_intervalos_desacople']
+
+    assert cn.query_cmg_ponderado_desde_id(SesionProhibida(), 0) == reproduccion['query_cmg_ponderado_desde_id']
+
+def test_desinstalar_restaura_funciones(reproduccion):
+    grabacion.desinstalar()
+    assert not grabacion.reproduciendo()
+    with pytest.raises(AssertionError, match='network access'):
+        api.insert_centrales({'CENTRAL_1': {'margen_garantia': -25.0}}, 'editor', '127.0.0.1', 5000)
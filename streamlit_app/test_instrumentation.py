@@ -0,0 +1,28 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Pruebas del registro de metricas (instrumentation.py): los errores SQL se exportan como contador.
+
+Uso:
+    python -m pytest -q test_instrumentation.py
+"""
+
+from sqlalchemy import create_engine, text
+
+from instrumentation import REGISTRO, instrumentar_engine
+
+def test_errores_sql_como_contador():
+    REGISTRO.reset()
+    engine = create_engine('sqlite://')
+    instrumentar_engine(engine, 'prueba')
+    for _ in range(2):
+        try:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT * FROM tabla_inexistente'))
+        except Exception:
+            pass
+
+    metricas = REGISTRO.prometheus()
+    assert '# TYPE sql_errors_total counter' in metricas
+    assert 'sql_errors_total{engine="prueba"} 2' in metricas
+    assert [fila['count'] for fila in REGISTRO.resumen() if fila['metrica'] == 'sql_errors_total'] == [2]
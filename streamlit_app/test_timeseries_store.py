@@ -0,0 +1,66 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Pruebas de regresion del store de series (timeseries_store.py) contra una base SQLite: filas de
+cmg_ponderado actualizadas en su lugar y filas tardias (id nuevo con unix_time antiguo).
+
+Uso:
+    python -m pytest -q test_timeseries_store.py
+"""
+
+import time
+
+import pytest
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.orm import sessionmaker
+
+import connection as cn
+from timeseries_store import TimeSeriesStore
+
+BARRA = 'CHARRUA__220'
+
+@pytest.fixture
+def base(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'store.db'}")
+    cn.Base.metadata.create_all(engine)
+    hora = int(time.time()) // 3600 * 3600
+    with engine.begin() as conn:
+        conn.execute(insert(cn.CmgPonderado.__table__), [
+            {'barra_transmision': BARRA, 'timestamp': '', 'unix_time': hora - 3600 * i, 'cmg_ponderado': 10.0 + i}
+            for i in range(5, -1, -1)])
+    return engine, hora
+
+def test_actualizacion_en_su_lugar(base):
+    engine, hora = base
+    store = TimeSeriesStore(ttl=0)
+    assert store.actualizar(sessionmaker(bind=engine), forzar=True)
+    assert store.ultimo('cmg_ponderado', BARRA)[2] == 10.0
+
+    # el scheduler reemplaza el cmg_ponderado de la hora en curso sin cambiar el id
+    with engine.begin() as conn:
+        conn.execute(update(cn.CmgPonderado.__table__).where(cn.CmgPonderado.unix_time == hora).values(cmg_ponderado=99.0))
+    store.actualizar(sessionmaker(bind=engine), forzar=True)
+
+    assert store.ultimo('cmg_ponderado', BARRA)[2] == 99.0
+    assert len(store.ventana('cmg_ponderado', BARRA)['unix_time']) == 6
+
+def test_fila_tardia(base):
+    engine, hora = base
+    store = TimeSeriesStore(ttl=0, horas_recientes=1)
+    store.actualizar(sessionmaker(bind=engine), forzar=True)
+
+    # fila con id nuevo, 10 horas atras (fuera de las horas recientes), y reemplazo de una hora ya cargada
+    with engine.begin() as conn:
+        conn.execute(insert(cn.CmgPonderado.__table__), [
+            {'barra_transmision': BARRA, 'timestamp': '', 'unix_time': hora - 36000, 'cmg_ponderado': 50.0},
+            {'barra_transmision': BARRA, 'timestamp': '', 'unix_time': hora - 7200, 'cmg_ponderado': 60.0}])
+    store.actualizar(sessionmaker(bind=engine), forzar=True)
+
+    unix_time = store.ventana('cmg_ponderado', BARRA)['unix_time']
+    assert list(unix_time) == sorted(set(unix_time))
+    assert len(unix_time) == 7
+    assert store.ultimo('cmg_ponderado', BARRA)[2] == 10.0
+
+    df = store.dataframe_cmg_ponderado(hora - 3 * 3600)
+    assert len(df) == 4
+    assert df['cmg_ponderado'].tolist() == [13.0, 60.0, 11.0, 10.0]
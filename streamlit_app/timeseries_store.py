@@ -0,0 +1,294 @@
+"""
+Author: Cristian Valls
+Date: 19-10-2026
+Description: Store en memoria, compartido por todas las sesiones del proceso, de las series cmg_tiempo_real y
+cmg_ponderado. Cada barra tiene un buffer circular de arreglos numpy (unix_time int64, cmg float64, desacople bool y
+central_referencia como codigo de un diccionario interno) que se alimenta de forma incremental desde la base de datos
+y se lee sin copias desde cada sesion.
+"""
+
+import time
+import logging
+import threading
+
+import numpy as np
+import pandas as pd
+
+import connection as cn
+
+#########################################################################
+###################           Settings         ##########################
+#########################################################################
+
+TABLAS = ('cmg_tiempo_real', 'cmg_ponderado')
+
+# horas recientes que se vuelven a leer en cada refresco: el scheduler actualiza en su lugar la hora en curso de
+# cmg_ponderado y los upserts por (barra_transmision, unix_time) pueden corregir lecturas ya cargadas (igual que espejo.py)
+HORAS_RECIENTES = 48
+ZONA_HORARIA = 'America/Santiago'
+
+#########################################################################
+##############                Classes                 ###################
+#########################################################################
+
+class Internador:
+    """
+    Diccionario de strings a codigos enteros (central_referencia). El codigo 0 representa None.
+    """
+    def __init__(self):
+        self._codigos = {None: 0}
+        self.valores = [None]
+
+    def codificar(self, valores):
+        "retorna un arreglo int32 con los codigos de los valores, agregando los nuevos"
+        codigos = np.empty(len(valores), dtype=np.int32)
+        for i, valor in enumerate(valores):
+            codigo = self._codigos.get(valor)
+            if codigo is None:
+                codigo = self._codigos[valor] = len(self.valores)
+                self.valores.append(valor)
+            codigos[i] = codigo
+        return codigos
+
+    def decodificar(self, codigos):
+        "arreglo de strings correspondiente a los codigos"
+        return np.asarray(self.valores, dtype=object)[codigos]
+
+class RingBuffer:
+    """
+    Buffer circular de capacidad fija para una barra. Cada valor se escribe dos veces (en i e i + capacidad), por lo
+    que las ultimas n lecturas siempre ocupan un tramo contiguo de los arreglos y se pueden entregar como vistas de
+    solo lectura, sin copiar.
+    """
+    def __init__(self, capacidad):
+        self.capacidad = capacidad
+        self.unix_time = np.zeros(2 * capacidad, dtype=np.int64)
+        self.cmg = np.zeros(2 * capacidad, dtype=np.float64)
+        self.desacople = np.zeros(2 * capacidad, dtype=bool)
+        self.central = np.zeros(2 * capacidad, dtype=np.int32)
+        self._pos = 0
+        self.largo = 0
+
+    def agregar(self, unix_time, cmg, desacople, central):
+        "agrega lecturas (arreglos del mismo largo) al final del buffer"
+        n = len(unix_time)
+        if n == 0:
+            return
+        if n > self.capacidad:
+            unix_time, cmg, desacople, central = (arr[-self.capacidad:] for arr in (unix_time, cmg, desacople, central))
+            n = self.capacidad
+
+        posiciones = (self._pos + np.arange(n)) % self.capacidad
+        for destino, valores in ((self.unix_time, unix_time), (self.cmg, cmg), (self.desacople, desacople), (self.central, central)):
+            destino[posiciones] = valores
+            destino[posiciones + self.capacidad] = valores
+
+        self._pos = (self._pos + n) % self.capacidad
+        self.largo = min(self.largo + n, self.capacidad)
+
+    def truncar(self, n):
+        "descarta las ultimas n lecturas"
+        n = min(n, self.largo)
+        self._pos = (self._pos - n) % self.capacidad
+        self.largo -= n
+
+    def fusionar(self, unix_time, cmg, desacople, central):
+        """
+        Agrega lecturas ordenadas por unix_time y sin unix_time repetidos. Si alguna es anterior a la ultima lectura
+        del buffer (fila tardia o actualizada), el tramo final desde esa lectura se reescribe en orden y las lecturas
+        con el mismo unix_time se reemplazan por las nuevas; si no, se agregan al final.
+        """
+        if len(unix_time) == 0:
+            return
+        tramo = self.tramo()
+        desde = tramo.start + int(np.searchsorted(self.unix_time[tramo], unix_time[0], side='left'))
+        if desde == tramo.stop:
+            self.agregar(unix_time, cmg, desacople, central)
+            return
+
+        cola = slice(desde, tramo.stop)
+        conservar = ~np.isin(self.unix_time[cola], unix_time)
+        fusion = [np.concatenate((existentes[cola][conservar], nuevas)) for existentes, nuevas in
+                  ((self.unix_time, unix_time), (self.cmg, cmg), (self.desacople, desacople), (self.central, central))]
+        orden = np.argsort(fusion[0], kind='stable')
+        self.truncar(tramo.stop - desde)
+        self.agregar(*(arr[orden] for arr in fusion))
+
+    def tramo(self, n=None):
+        "slice de las ultimas n lecturas (todas por defecto) dentro de los arreglos duplicados"
+        n = self.largo if n is None else min(n, self.largo)
+        fin = self._pos + self.capacidad
+        return slice(fin - n, fin)
+
+class TimeSeriesStore:
+    """
+    Store de series por (tabla, barra). Un solo refresco incremental por intervalo `ttl` atiende a todas las sesiones:
+    las lecturas solo toman el lock para fijar el tramo y retornan vistas de solo lectura de los arreglos.
+
+    Las vistas siguen siendo validas mientras no se agreguen mas de (capacidad - largo de la ventana) lecturas nuevas,
+    lo que con la capacidad por defecto equivale a varios dias. Los valores de las ultimas `horas_recientes` horas de
+    una vista pueden cambiar con un refresco, cuando la base de datos los actualiza.
+    """
+    def __init__(self, dias=30, ttl=60, horas_recientes=HORAS_RECIENTES):
+        self.dias = dias
+        self.ttl = ttl
+        self.horas_recientes = horas_recientes
+        self.capacidades = {'cmg_tiempo_real': dias * 24 * 12, 'cmg_ponderado': dias * 24 * 2}
+        self.internador = Internador()
+        self._buffers = {}
+        self._ultimo_id = {tabla: 0 for tabla in TABLAS}
+        self._ultimo_refresco = 0.0
+        self._lock = threading.RLock()
+        self._lock_refresco = threading.Lock()
+
+    def _buffer(self, tabla, barra):
+        llave = (tabla, barra)
+        buffer = self._buffers.get(llave)
+        if buffer is None:
+            buffer = self._buffers[llave] = RingBuffer(self.capacidades[tabla])
+        return buffer
+
+    def ingerir(self, tabla, columnas):
+        """
+        Agrega al store las filas entregadas por query_cmg_tiempo_real_desde_id / query_cmg_ponderado_desde_id.
+        Dentro de cada barra las filas se ordenan por unix_time y, con el mismo unix_time, queda la de mayor id; las
+        que ya estan en el store se reemplazan y las tardias se insertan en su posicion (RingBuffer.fusionar).
+        """
+        if not columnas or not columnas['id']:
+            return 0
+
+        ids = np.asarray(columnas['id'], dtype=np.int64)
+        barras = np.asarray(columnas['barra_transmision'], dtype=object)
+        unix_time = np.asarray(columnas['unix_time'], dtype=np.int64)
+        cmg = np.asarray(columnas['cmg'], dtype=np.float64)
+        desacople = np.asarray(columnas.get('desacople_bool', np.zeros(len(unix_time))), dtype=bool)
+
+        with self._lock:
+            central = self.internador.codificar(columnas.get('central_referencia', [None] * len(unix_time)))
+            for barra in pd.unique(barras):
+                indices = np.flatnonzero(barras == barra)
+                indices = indices[np.lexsort((ids[indices], unix_time[indices]))]
+                # ultima fila (mayor id) de cada unix_time
+                indices = indices[np.append(unix_time[indices][1:] != unix_time[indices][:-1], True)]
+                self._buffer(tabla, barra).fusionar(unix_time[indices], cmg[indices], desacople[indices], central[indices])
+            self._ultimo_id[tabla] = max(self._ultimo_id[tabla], int(ids.max()))
+
+        return len(unix_time)
+
+    def actualizar(self, session_factory, forzar=False):
+        """
+        Refresco incremental desde la base de datos: las filas con id mayor al ultimo cargado mas las de las
+        ultimas `horas_recientes` horas, para recoger las filas actualizadas en su lugar. Si otra sesion ya esta
+        refrescando, o el ultimo refresco es mas reciente que `ttl` segundos, no hace nada.
+
+        Args:
+            session_factory: callable que retorna una sesión de SQLAlchemy (ej: router.session_lectura).
+            forzar (bool): ignora el ttl.
+
+        Returns:
+            bool: True si se consulto la base de datos.
+        """
+        if not forzar and time.monotonic() - self._ultimo_refresco < self.ttl:
+            return False
+        if not self._lock_refresco.acquire(blocking=False):
+            return False
+
+        try:
+            ahora = int(time.time())
+            unix_time_desde = ahora - self.dias * 86400
+            unix_time_recientes = max(unix_time_desde, ahora - self.horas_recientes * 3600)
+            lecturas = {}
+            with session_factory() as session:
+                for tabla, consulta in (('cmg_tiempo_real', cn.query_cmg_tiempo_real_desde_id),
+                                        ('cmg_ponderado', cn.query_cmg_ponderado_desde_id)):
+                    # en la primera carga las filas nuevas ya incluyen las recientes
+                    recientes = consulta(session, 0, unix_time_recientes) if self._ultimo_id[tabla] else None
+                    lecturas[tabla] = _unir_columnas(consulta(session, self._ultimo_id[tabla], unix_time_desde), recientes)
+            for tabla, columnas in lecturas.items():
+                self.ingerir(tabla, columnas)
+            self._ultimo_refresco = time.monotonic()
+            return True
+
+        except Exception as exception:
+            logging.error(f"Error while refreshing time series store: {exception}")
+            return False
+
+        finally:
+            self._lock_refresco.release()
+
+    def barras(self, tabla):
+        "barras con datos en la tabla"
+        with self._lock:
+            return [barra for (tabla_buffer, barra) in self._buffers if tabla_buffer == tabla]
+
+    def ventana(self, tabla, barra, desde_unix=None):
+        """
+        Vistas de solo lectura de las lecturas de la barra con unix_time >= desde_unix.
+
+        Returns:
+            dict: unix_time, cmg, desacople y central (codigos) como arreglos numpy sin copia; vacio si no hay datos.
+        """
+        with self._lock:
+            buffer = self._buffers.get((tabla, barra))
+            if buffer is None or buffer.largo == 0:
+                return {'unix_time': np.empty(0, np.int64), 'cmg': np.empty(0), 'desacople': np.empty(0, bool),
+                        'central': np.empty(0, np.int32)}
+            tramo = buffer.tramo()
+            if desde_unix is not None:
+                inicio = tramo.start + int(np.searchsorted(buffer.unix_time[tramo], desde_unix, side='left'))
+                tramo = slice(inicio, tramo.stop)
+            vistas = {'unix_time': buffer.unix_time[tramo], 'cmg': buffer.cmg[tramo],
+                      'desacople': buffer.desacople[tramo], 'central': buffer.central[tramo]}
+
+        for vista in vistas.values():
+            vista.flags.writeable = False
+        return vistas
+
+    def ultimo(self, tabla, barra):
+        """
+        Ultima lectura de la barra.
+
+        Returns:
+            tuple: (central_referencia, desacople, cmg), o None si no hay datos.
+        """
+        with self._lock:
+            buffer = self._buffers.get((tabla, barra))
+            if buffer is None or buffer.largo == 0:
+                return None
+            i = buffer.tramo().stop - 1
+            return self.internador.valores[buffer.central[i]], bool(buffer.desacople[i]), float(buffer.cmg[i])
+
+    def dataframe_cmg_ponderado(self, desde_unix, barras=None):
+        """
+        DataFrame con barra_transmision, timestamp (hora de Chile sin zona) y cmg_ponderado, equivalente a
+        pipeline.preparar_cmg_ponderado sobre query_cmg_ponderado_by_time.
+        """
+        partes = []
+        for barra in (barras or self.barras('cmg_ponderado')):
+            vistas = self.ventana('cmg_ponderado', barra, desde_unix)
+            if len(vistas['unix_time']) == 0:
+                continue
+            timestamp = pd.to_datetime(vistas['unix_time'], unit='s', utc=True).tz_convert(ZONA_HORARIA).tz_localize(None)
+            partes.append(pd.DataFrame({'barra_transmision': barra, 'timestamp': timestamp, 'cmg_ponderado': vistas['cmg']}))
+
+        if not partes:
+            return cn.aplicar_esquema(pd.DataFrame(columns=['barra_transmision', 'timestamp', 'cmg_ponderado']), 'cmg_ponderado')
+        df = pd.concat(partes, ignore_index=True).sort_values('timestamp', kind='stable', ignore_index=True)
+        return cn.aplicar_esquema(df, 'cmg_ponderado')
+
+    def memoria(self):
+        "bytes usados por los arreglos del store"
+        with self._lock:
+            return sum(arr.nbytes for buffer in self._buffers.values()
+                       for arr in (buffer.unix_time, buffer.cmg, buffer.desacople, buffer.central))
+
+#########################################################################
+###################           functions         #########################
+#########################################################################
+
+def _unir_columnas(*consultas):
+    "concatena los resultados por columna de las consultas *_desde_id, ignorando las que fallaron (None)"
+    consultas = [columnas for columnas in consultas if columnas]
+    if not consultas:
+        return None
+    return {columna: [valor for columnas in consultas for valor in columnas[columna]] for columna in consultas[0]}